@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Any, List, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.synthetic_repo import PROFILES, generate_pair, synthetic_ticket  # noqa: E402
+from server.services.diff_service import compute_local_diff  # noqa: E402
+from server.services.knowledge_service import generate_repo_knowledge, load_knowledge_bundle  # noqa: E402
+from server.services.shadow_fs_service import build_shadow_knowledge, build_shadow_diff  # noqa: E402
+from server.services.dry_run_service import build_feature_summary, static_dry_run  # noqa: E402
+from server.services.ast_service import compute_ast_deltas  # noqa: E402
+from server.services.guards import ScopeGuard, RuleGuard, ImpactGuard  # noqa: E402
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+STAGES = ("diff", "shadow_init", "shadow_diff", "dry_run", "ast_deltas", "guards", "analyze", "analyze_reused")
+
+
+def _measure(fn: Callable[[], Any], repeats: int, settle: Callable[[], None] | None = None) -> Dict[str, Any]:
+    # timing passes run without tracemalloc (it slows allocation-heavy code ~2x); settle() is untimed
+    walls: List[float] = []
+    for _ in range(repeats):
+        if settle:
+            settle()
+        t0 = time.perf_counter()
+        fn()
+        walls.append((time.perf_counter() - t0) * 1000.0)
+    if settle:
+        settle()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall_ms_min": round(min(walls), 3),
+        "wall_ms_median": round(sorted(walls)[len(walls) // 2], 3),
+        "py_peak_kb": peak // 1024,
+    }
+
+
+def _configure_llm(latency: str, base_url: str | None) -> None:
+    # Offline by default: in-process replay with synthesized answers; or a running stub_llm_server
+    if base_url:
+        os.environ["LLM_MODE"] = "live"
+        os.environ["LLM_BASE_URL"] = base_url
+    else:
+        os.environ["LLM_MODE"] = "replay"
+        os.environ["LLM_REPLAY_MISS"] = "stub"
+        os.environ["LLM_REPLAY_LATENCY"] = latency
+
+
+def run_suite(spec: Dict[str, Any], workdir: str, repeats: int, stages: List[str], llm_latency: str = "none", llm_base_url: str | None = None) -> Dict[str, Any]:
+    """Generate a synthetic base/head pair under workdir and time each pipeline stage on it.
+
+    Services write under cwd-relative results/, so the suite chdirs into workdir for its duration.
+    """
+    pair = generate_pair(workdir, spec)
+    base_dir, head_dir = pair["base_dir"], pair["head_dir"]
+    ticket = synthetic_ticket()
+    _configure_llm(llm_latency, llm_base_url)
+
+    prev_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        repo_id = Path(base_dir).name
+        kb_dir = Path("results") / repo_id / "knowledge"
+        generate_repo_knowledge(repo_dir=base_dir, out_dir=str(kb_dir))
+        bundle = load_knowledge_bundle(str(kb_dir))
+        diff_bundle = compute_local_diff(base_dir=base_dir, head_dir=head_dir, include_context=True)
+        changed_files = [f.get("path") for f in diff_bundle.get("files", []) if f.get("path")]
+        # runners call each stage the way /local/pr/analyze does: classified files skip the AST pass,
+        # and the dry run and guards read the symbol-level AST deltas (computed once here, untimed)
+        code_files = [f.get("path") for f in diff_bundle.get("files", []) if f.get("path") and not f.get("classified")]
+        ast_deltas = compute_ast_deltas(base_dir=base_dir, head_dir=head_dir, changed_files=code_files, diff_bundle=diff_bundle)
+
+        def shadow_diff() -> None:
+            build_shadow_diff(base_dir=base_dir, head_dir=head_dir, diff_bundle=diff_bundle, shadow_root=str(Path(workdir) / "bench_sde"), objects_dir=str(Path(workdir) / "bench_objects"))
+
+        def guards() -> None:
+            ScopeGuard.run(ticket=ticket, diff_bundle=diff_bundle)
+            RuleGuard.run(rules=bundle["rules"], diff_bundle=diff_bundle, deps=bundle["deps"])
+            ImpactGuard.run(api=bundle["api_surface"], deps=bundle["deps"], diff_bundle=diff_bundle, ast_deltas=ast_deltas)
+
+        def dry_run() -> None:
+            build_feature_summary(ticket=ticket, diff_bundle=diff_bundle)
+            static_dry_run(api_surface=bundle["api_surface"], deps=bundle["deps"], diff_bundle=diff_bundle, ast_deltas=ast_deltas)
+
+        client = None
+        if "analyze" in stages or "analyze_reused" in stages:
+            from server.app import create_app
+            client = create_app().test_client()
+
+        def analyze(reuse: bool) -> Callable[[], None]:
+            # stage memo off: every repetition after the first would otherwise time warm memo hits
+            def call() -> None:
+                r = client.post("/local/pr/analyze", json={"base_dir": base_dir, "head_dir": head_dir, "ticket": ticket, "reuse_diff": reuse, "memo": False})
+                if r.status_code != 200:
+                    raise RuntimeError(f"analyze failed: {r.status_code} {r.get_data(as_text=True)[:200]}")
+            return call
+
+        runners: Dict[str, Callable[[], None]] = {
+            "diff": lambda: compute_local_diff(base_dir=base_dir, head_dir=head_dir, include_context=True),
+            "shadow_init": lambda: build_shadow_knowledge(repo_dir=base_dir, out_dir=str(Path(workdir) / "bench_skt")),
+            "shadow_diff": shadow_diff,
+            "dry_run": dry_run,
+            "ast_deltas": lambda: compute_ast_deltas(base_dir=base_dir, head_dir=head_dir, changed_files=code_files, diff_bundle=diff_bundle),
+            "guards": guards,
+            "analyze": analyze(False),
+            "analyze_reused": analyze(True),
+        }
+        results: Dict[str, Any] = {}
+        for name in STAGES:
+            if name not in stages:
+                continue
+            m = _measure(runners[name], repeats)
+            m["files_per_s"] = round(len(changed_files) / max(m["wall_ms_min"] / 1000.0, 1e-6), 1)
+            results[name] = m
+    finally:
+        os.chdir(prev_cwd)
+
+    return {
+        "schema_version": "1.0",
+        "spec": spec,
+        "repo": {k: v for k, v in pair.items() if k not in ("base_dir", "head_dir")},
+        "files_changed": len(changed_files),
+        "diff_bytes": len(json.dumps(diff_bundle)),
+        "stages": results,
+    }
+
+
+def compare_to_baseline(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    regressions: List[Dict[str, Any]] = []
+    for name, cur in result.get("stages", {}).items():
+        base = (baseline.get("stages") or {}).get(name)
+        if not base:
+            continue
+        for metric in ("wall_ms_min", "py_peak_kb"):
+            b = float(base.get(metric) or 0)
+            c = float(cur.get(metric) or 0)
+            # ignore sub-millisecond / sub-64KB noise
+            floor = 1.0 if metric == "wall_ms_min" else 64.0
+            if b > 0 and c > floor and c > b * (1.0 + tolerance):
+                regressions.append({"stage": name, "metric": metric, "baseline": b, "current": c, "ratio": round(c / b, 3)})
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks on synthetic base/head trees")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--files", type=int)
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--branching", type=int)
+    parser.add_argument("--fanout", type=int)
+    parser.add_argument("--change-ratio", type=float)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of " + ",".join(STAGES))
+    parser.add_argument("--llm-latency", default="none", help="replayed LLM latency: none | recorded | fixed:MS | uniform:LO:HI | normal:MEAN:STD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--llm-base-url", help="send prompts to this OpenAI-compatible URL (e.g. benchmarks/stub_llm_server.py) instead of in-process replay")
+    parser.add_argument("--workdir", help="keep generated trees/results here instead of a temp dir")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth vs baseline (0.25 = 25%%)")
+    parser.add_argument("--out", help="write the JSON result here as well as stdout")
+    args = parser.parse_args(argv)
+
+    spec = dict(PROFILES[args.profile])
+    for key in ("files", "depth", "branching", "fanout", "change_ratio", "seed"):
+        val = getattr(args, key)
+        if val is not None:
+            spec[key] = val
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {unknown}")
+
+    if args.workdir:
+        Path(args.workdir).mkdir(parents=True, exist_ok=True)
+        result = run_suite(spec, str(Path(args.workdir).resolve()), max(1, args.repeats), stages, args.llm_latency, args.llm_base_url)
+    else:
+        with tempfile.TemporaryDirectory(prefix="gtm-bench-") as tmp:
+            result = run_suite(spec, tmp, max(1, args.repeats), stages, args.llm_latency, args.llm_base_url)
+    result["profile"] = args.profile
+    result["host"] = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+
+    # baselines are keyed by profile name + full spec so differently-sized runs never compare
+    key = f"{args.profile}:{json.dumps(spec, sort_keys=True)}"
+    baseline_path = Path(args.baseline)
+    baselines = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    exit_code = 0
+    if key in baselines:
+        regressions = compare_to_baseline(result, baselines[key], args.tolerance)
+        result["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+    if args.save_baseline:
+        baselines[key] = result
+        baseline_path.write_text(json.dumps(baselines, indent=2), encoding="utf-8")
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from server.services.llm_replay_service import replay_completion  # noqa: E402
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible POST .../chat/completions served from the replay cassette store."""
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+            messages = body.get("messages") or []
+            system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+            user = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+            model = body.get("model") or os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+        except Exception as e:
+            self._send(400, {"error": {"message": f"bad request: {e}"}})
+            return
+        data, _ = replay_completion(model, system, user)
+        if data is None:
+            self._send(404, {"error": {"message": "no recorded exchange for prompt"}})
+            return
+        self._send(200, data)
+
+    def _send(self, status: int, doc: dict) -> None:
+        raw = json.dumps(doc).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, fmt: str, *args) -> None:
+        if os.environ.get("STUB_LLM_VERBOSE"):
+            super().log_message(fmt, *args)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub LLM for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--cassettes", help="cassette dir recorded with LLM_MODE=record (default: LLM_CASSETTE_DIR)")
+    parser.add_argument("--latency", default="recorded", help="recorded | none | fixed:MS | uniform:LO:HI | normal:MEAN:STD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--miss", choices=["stub", "error"], default="stub", help="unrecorded prompts: synthesize a schema-valid answer or 404")
+    args = parser.parse_args(argv)
+
+    if args.cassettes:
+        os.environ["LLM_CASSETTE_DIR"] = args.cassettes
+    os.environ["LLM_REPLAY_LATENCY"] = args.latency
+    os.environ["LLM_REPLAY_MISS"] = args.miss
+    server = ThreadingHTTPServer((args.host, args.port), StubChatHandler)
+    print(f"stub LLM listening on http://{args.host}:{args.port}/v1 (latency={args.latency}, miss={args.miss})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
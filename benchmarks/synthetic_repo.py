@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import os
+import random
+import shutil
+from pathlib import Path
+from typing import Dict, Any, List
+
+
+# Named sizes used by the runner; override individual fields from the CLI
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "small": {"files": 200, "depth": 3, "branching": 4, "fanout": 3, "change_ratio": 0.1, "seed": 7},
+    "medium": {"files": 2000, "depth": 4, "branching": 5, "fanout": 4, "change_ratio": 0.05, "seed": 7},
+    "large": {"files": 10000, "depth": 5, "branching": 6, "fanout": 5, "change_ratio": 0.02, "seed": 7},
+}
+
+
+def _module_dirs(depth: int, branching: int) -> List[str]:
+    dirs = [""]
+    frontier = [""]
+    for level in range(depth):
+        nxt: List[str] = []
+        for d in frontier:
+            for b in range(branching):
+                child = f"{d}/d{level}_{b}" if d else f"d{level}_{b}"
+                nxt.append(child)
+        dirs.extend(nxt)
+        frontier = nxt
+    return dirs
+
+
+def _import_path(from_rel: str, to_rel: str) -> str:
+    rel = os.path.relpath(to_rel, start=os.path.dirname(from_rel) or ".").replace(os.sep, "/")
+    return rel if rel.startswith("../") else f"./{rel}"
+
+
+def _render_module(idx: int, rel: str, imports: List[str], params: int, extra_export: bool, body_variant: int) -> str:
+    lines: List[str] = []
+    for target in imports:
+        tidx = Path(target).stem.split("_")[-1]
+        lines.append(f'import {{ fn_{tidx} }} from "{_import_path(rel, target)}";')
+    args = ", ".join(f"a{i}" for i in range(params))
+    lines.append("")
+    lines.append(f"export function fn_{idx}({args}) {{")
+    lines.append(f"  const base = {idx} + {body_variant};")
+    for target in imports:
+        tidx = Path(target).stem.split("_")[-1]
+        lines.append(f"  const v{tidx} = fn_{tidx}({', '.join('base' for _ in range(2))});")
+    lines.append("  return base;")
+    lines.append("}")
+    lines.append("")
+    lines.append(f"export const LABEL_{idx} = \"module-{idx}\";")
+    if extra_export:
+        lines.append("")
+        lines.append(f"export function extra_{idx}(x) {{")
+        lines.append("  return x;")
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_pair(root: str, spec: Dict[str, Any], repo_name: str = "synthetic") -> Dict[str, Any]:
+    """Write base/head snapshots of a synthetic TypeScript repo under root/{base,head}/{repo_name}.
+
+    Modules form an import DAG (each imports up to `fanout` lower-numbered modules) and are
+    re-exported from src/index.ts, so knowledge, deps and dry-run stages see realistic edges.
+    `change_ratio` of the modules change in head: body edits, signature changes and new
+    exports, plus a few added/removed modules and a docs edit.
+    """
+    files = int(spec["files"])
+    fanout = int(spec["fanout"])
+    rng = random.Random(spec.get("seed", 7))
+    root_p = Path(root)
+    base = root_p / "base" / repo_name
+    head = root_p / "head" / repo_name
+    for p in (base, head):
+        if p.exists():
+            shutil.rmtree(p)
+
+    dirs = _module_dirs(int(spec["depth"]), int(spec["branching"]))
+    modules: List[str] = []
+    for i in range(files):
+        d = dirs[rng.randrange(len(dirs))]
+        modules.append(f"src/{d}/mod_{i}.ts" if d else f"src/mod_{i}.ts")
+    imports: List[List[str]] = []
+    for i in range(files):
+        k = min(i, fanout)
+        imports.append(sorted(rng.sample(modules[:i], k)) if k else [])
+
+    changed = set(rng.sample(range(files), max(1, int(files * float(spec["change_ratio"])))))
+    removed = set(rng.sample(sorted(changed), max(0, len(changed) // 10)))
+    added_count = max(1, len(changed) // 10)
+
+    def write_tree(dst: Path, is_head: bool) -> None:
+        (dst / "src").mkdir(parents=True, exist_ok=True)
+        (dst / "docs").mkdir(parents=True, exist_ok=True)
+        index_lines: List[str] = []
+        # importers of removed modules keep their import lines, so removals surface as impact
+        for i, rel in enumerate(modules):
+            if is_head and i in removed:
+                continue
+            params, extra, variant = 2, False, 0
+            if is_head and i in changed:
+                kind = i % 3
+                variant = 1
+                if kind == 1:
+                    params = 3
+                elif kind == 2:
+                    extra = True
+            fp = dst / rel
+            fp.parent.mkdir(parents=True, exist_ok=True)
+            fp.write_text(_render_module(i, rel, imports[i], params, extra, variant), encoding="utf-8")
+            index_lines.append(f'export * from "./{rel[len("src/"):]}";')
+        if is_head:
+            for j in range(added_count):
+                idx = files + j
+                d = dirs[rng.randrange(len(dirs))]
+                rel = f"src/{d}/mod_{idx}.ts" if d else f"src/mod_{idx}.ts"
+                fp = dst / rel
+                fp.parent.mkdir(parents=True, exist_ok=True)
+                fp.write_text(_render_module(idx, rel, [], 2, False, 0), encoding="utf-8")
+                index_lines.append(f'export * from "./{rel[len("src/"):]}";')
+        (dst / "src" / "index.ts").write_text("\n".join(index_lines) + "\n", encoding="utf-8")
+        (dst / "docs" / "README.md").write_text("# synthetic\n" + ("\nHead notes.\n" if is_head else ""), encoding="utf-8")
+        (dst / "package.json").write_text('{\n  "name": "synthetic",\n  "version": "1.0.0"\n}\n', encoding="utf-8")
+
+    write_tree(base, is_head=False)
+    write_tree(head, is_head=True)
+    return {
+        "base_dir": str(base),
+        "head_dir": str(head),
+        "modules": files,
+        "changed": len(changed) - len(removed),
+        "removed": len(removed),
+        "added": added_count,
+    }
+
+
+def synthetic_ticket() -> Dict[str, Any]:
+    return {
+        "schema_version": "1.0",
+        "ticket": {
+            "id": "T-BENCH",
+            "title": "Synthetic benchmark change",
+            "summary": "Touch a fraction of modules under src/",
+            "acceptance_criteria": [
+                {"id": "AC-1", "text": "Module bodies updated", "verification": "manual"},
+                {"id": "AC-2", "text": "No changes outside src", "verification": "manual"},
+            ],
+            "expected_change_scope": {"files_glob": ["src/**"], "modules": []},
+            "out_of_scope_glob": ["docs/**", "examples/**", "scripts/**"],
+            "labels": [],
+            "links": [],
+        },
+    }
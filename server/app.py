@@ -5,6 +5,10 @@ from server.routes.knowledge_routes import knowledge_bp
 from server.routes.pr_routes import pr_bp
 from server.routes.ticket_routes import ticket_bp
 from server.routes.shadow_routes import shadow_bp
+from server.routes.metrics_routes import metrics_bp
+from server.routes.runs_routes import runs_bp
+from server.routes.retention_routes import retention_bp
+from server.services.retention_service import start_background_compaction
 
 
 def create_app() -> Flask:
@@ -19,6 +23,10 @@ def create_app() -> Flask:
     app.register_blueprint(pr_bp)
     app.register_blueprint(ticket_bp)
     app.register_blueprint(shadow_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(runs_bp)
+    app.register_blueprint(retention_bp)
+    start_background_compaction(float(os.environ.get("RETENTION_INTERVAL_SECONDS", "0")))
     return app
 
 
@@ -9,6 +9,7 @@ from flask import Blueprint, jsonify, request
 
 from server.services.knowledge_service import generate_repo_knowledge
 from server.services.llm_service import build_repo_doc_llm
+from server.services.run_io_service import atomic_write_json
 
 
 knowledge_bp = Blueprint("knowledge", __name__)
@@ -32,7 +33,7 @@ def generate_knowledge_route():
         structure_doc = json.loads((out_dir / "structure.json").read_text(encoding="utf-8"))
         repo_doc = build_repo_doc_llm(structure_doc)
         if repo_doc and isinstance(repo_doc, dict):
-            (out_dir / "repo.json").write_text(json.dumps(repo_doc, indent=2), encoding="utf-8")
+            atomic_write_json(out_dir / "repo.json", repo_doc)
     except Exception:
         pass
     return jsonify({"ok": True, "artifacts": artifacts, "out_dir": str(out_dir)}), 200
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from flask import Blueprint, Response
+
+from server.services.metrics_service import render_prometheus
+
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.get("/metrics")
+def metrics_route():
+    return Response(render_prometheus(), status=200, mimetype="text/plain; version=0.0.4")
@@ -2,25 +2,56 @@ from __future__ import annotations
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Iterator, Tuple
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
-from server.services.diff_service import compute_local_diff
+from server.services.diff_service import (
+    compute_local_diff,
+    compute_git_diff,
+    compute_snapshot_diff,
+    base_snapshot,
+    attach_head_context,
+    snapshot_fingerprint,
+    commit_fingerprint,
+    SIMILARITY_MODES,
+)
+from server.services.git_source_service import is_git_repo, git_source, git_repo_id, source_trees
 from server.services.knowledge_service import load_knowledge_bundle
 from server.services.guards import ScopeGuard, RuleGuard, ImpactGuard
-from server.services.dry_run_service import build_feature_summary, static_dry_run
+from server.services.dry_run_service import build_feature_summary, directory_summaries, static_dry_run
 from server.services.ast_service import compute_ast_deltas
 from server.services.llm_service import (
     evaluate_ticket_alignment,
     ticket_alignment_shadow,
     impact_guard_shadow,
+    batched_shadow_prompts,
+    pack_dir_contexts,
+    llm_identity,
+    BATCH_TOKEN_BUDGET,
+)
+from server.services.orchestrator import compute_score_and_rank, deterministic_blockers
+from server.services.shadow_fs_service import (
+    build_shadow_knowledge,
+    build_shadow_diff,
+    get_dir_context,
+    save_diff_run,
+    load_diff_run,
+    find_diff_run,
 )
-from server.services.orchestrator import compute_score_and_rank
-from server.services.shadow_fs_service import build_shadow_knowledge, build_shadow_diff, get_dir_context
 from server.services.policy_service import evaluate_policies, load_policies
 from server.services.sarif_service import build_sarif
+from server.services.metrics_service import run_metrics, maybe_profile, RunMetrics
+from server.services.triage_service import triage_directories, skipped_dir_result
+from server.services.batch_scoring_service import write_score_features
+from server.services.run_index_service import index_run
+from server.services.object_store_service import objects_dir_for
+from server.services.run_io_service import RUNS_LOCK, new_run_id, atomic_write_json, repo_lock
+from server.services.symbol_map_service import scope_dir_context
+from server.services.stage_cache_service import StageMemo, content_hash, memo_root_for, memo_stage, stage_key
 
 
 pr_bp = Blueprint("pr", __name__)
@@ -29,146 +60,570 @@ pr_bp = Blueprint("pr", __name__)
 @pr_bp.post("/local/pr/analyze")
 def analyze_local_pr_route():
     payload: Dict[str, Any] = request.get_json(force=True, silent=False)
-    base_dir = payload.get("base_dir")
-    head_dir = payload.get("head_dir")
+    params, error = _analyze_params(payload)
+    if error:
+        return jsonify({"ok": False, "error": error[0]}), error[1]
+    body, status = _collect_analysis(params)
+    return jsonify(body), status
+
+
+@pr_bp.post("/local/pr/rank")
+def rank_local_prs_route():
+    """Analyze N candidate heads for one ticket against one base and rank them.
+
+    Base-side work (knowledge bundle, SKT, base tree snapshot for diffs, base AST summaries) is done
+    once and shared; heads are analyzed concurrently (max_parallel, default RANK_MAX_PARALLEL).
+    """
+    payload: Dict[str, Any] = request.get_json(force=True, silent=False)
+    heads = payload.get("heads")
+    if not isinstance(heads, list) or not heads:
+        return jsonify({"ok": False, "error": "Invalid heads"}), 400
+    head_key = "head_ref" if payload.get("repo_git_dir") else "head_dir"
+    common = {k: v for k, v in payload.items() if k not in ("heads", "run_id", "head_dir", "head_ref")}
+    candidates: List[Tuple[str, Dict[str, Any]]] = []
+    for i, head in enumerate(heads):
+        spec = head if isinstance(head, dict) else {head_key: head}
+        params, error = _analyze_params({**common, head_key: spec.get(head_key)})
+        if error:
+            return jsonify({"ok": False, "error": f"heads[{i}]: {error[0]}"}), error[1]
+        candidates.append((str(spec.get("label") or spec.get(head_key)), params))
+    try:
+        max_parallel = max(1, int(payload.get("max_parallel") or os.environ.get("RANK_MAX_PARALLEL", "4")))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid max_parallel"}), 400
+
+    with _shared_base(candidates[0][1]) as shared:
+        for _, params in candidates:
+            params["shared"] = shared
+        # LLM-bound, so threads; CPU-bound stages inside still fan out to the worker pool
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(candidates))) as ex:
+            results = list(ex.map(_collect_analysis, [params for _, params in candidates]))
+    labels = [label for label, _ in candidates]
+    return jsonify({
+        "ok": True,
+        "repo_id": candidates[0][1]["repo_id"],
+        "ranking": _ranking_table(labels, results),
+        "results": [{"label": label, "status": status, **body} for label, (body, status) in zip(labels, results)],
+    }), 200
+
+
+@pr_bp.post("/local/pr/analyze/stream")
+def analyze_local_pr_stream_route():
+    """Same pipeline as /local/pr/analyze, streaming each stage's result as it completes.
+
+    Server-Sent Events by default; NDJSON with "format": "ndjson" or Accept: application/x-ndjson.
+    The last event is "done" (the full analyze response body) or "error".
+    """
+    payload: Dict[str, Any] = request.get_json(force=True, silent=False)
+    params, error = _analyze_params(payload)
+    if error:
+        return jsonify({"ok": False, "error": error[0]}), error[1]
+    fmt = payload.get("format") or ("ndjson" if "application/x-ndjson" in request.headers.get("Accept", "") else "sse")
+    if fmt not in ("sse", "ndjson"):
+        return jsonify({"ok": False, "error": "Invalid format"}), 400
+
+    def encode(event: str, data: Dict[str, Any]) -> str:
+        if fmt == "ndjson":
+            return json.dumps({"event": event, "data": data}, default=str) + "\n"
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def generate() -> Iterator[str]:
+        # headers are already sent once streaming starts, so failures become a final error event
+        try:
+            for event, data in _run_analysis(params):
+                yield encode(event, data)
+        except Exception as e:
+            yield encode("error", {"status": 500, "error": str(e)})
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/event-stream"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _analyze_params(payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Tuple[str, int] | None]:
+    git = None
+    if payload.get("repo_git_dir"):
+        # git-ref mode: diff and file reads come straight from the repository's object store
+        git_dir = payload.get("repo_git_dir")
+        if not isinstance(git_dir, str) or not is_git_repo(git_dir):
+            return {}, ("Invalid repo_git_dir", 400)
+        try:
+            git = git_source(git_dir, payload.get("base_ref"), payload.get("head_ref"))
+        except ValueError as e:
+            return {}, (f"Invalid base_ref/head_ref: {e}", 400)
+        base_dir = head_dir = None
+    else:
+        base_dir = payload.get("base_dir")
+        head_dir = payload.get("head_dir")
+        if not base_dir or not os.path.isdir(base_dir):
+            return {}, ("Invalid base_dir", 400)
+        if not head_dir or not os.path.isdir(head_dir):
+            return {}, ("Invalid head_dir", 400)
     ticket = payload.get("ticket")
-    if not base_dir or not os.path.isdir(base_dir):
-        return jsonify({"ok": False, "error": "Invalid base_dir"}), 400
-    if not head_dir or not os.path.isdir(head_dir):
-        return jsonify({"ok": False, "error": "Invalid head_dir"}), 400
     if not isinstance(ticket, dict):
-        return jsonify({"ok": False, "error": "Invalid ticket"}), 400
+        return {}, ("Invalid ticket", 400)
+    diff_run_id = payload.get("run_id")
+    if diff_run_id is not None and (not isinstance(diff_run_id, str) or not diff_run_id or Path(diff_run_id).name != diff_run_id):
+        return {}, ("Invalid run_id", 400)
+    rename_detection = payload.get("rename_detection")
+    if rename_detection is not None and rename_detection not in SIMILARITY_MODES:
+        return {}, (f"Invalid rename_detection (one of {list(SIMILARITY_MODES)})", 400)
+
+    # flags must be JSON booleans: bool("false") would turn a string "false" on
+    flags: Dict[str, bool] = {}
+    for name, default in (
+        ("reuse_diff", True),
+        ("batch_prompts", os.environ.get("SHADOW_PROMPT_BATCH", "0") == "1"),
+        ("triage", os.environ.get("SHADOW_TRIAGE", "1") != "0"),
+        ("fast_fail", os.environ.get("ANALYZE_FAST_FAIL", "0") == "1"),
+        ("memo", os.environ.get("ANALYZE_MEMO", "1") != "0"),
+    ):
+        value = payload.get(name)
+        if value is not None and not isinstance(value, bool):
+            return {}, (f"Invalid {name} (true or false)", 400)
+        flags[name] = default if value is None else value
+    batch_token_budget = payload.get("batch_token_budget")
+    if batch_token_budget is None:
+        batch_token_budget = BATCH_TOKEN_BUDGET
+    elif isinstance(batch_token_budget, bool) or not isinstance(batch_token_budget, int) or batch_token_budget <= 0:
+        return {}, ("Invalid batch_token_budget (a positive integer)", 400)
+
+    # repo_id derived from base folder name (git-ref mode: the repository folder, or an explicit repo_id)
+    repo_id = Path(base_dir).name if git is None else (payload.get("repo_id") or git_repo_id(git["repo_git_dir"]))
+    if not isinstance(repo_id, str) or not repo_id or Path(repo_id).name != repo_id:
+        return {}, ("Invalid repo_id", 400)
+    run_id = new_run_id()
+    return {
+        "payload": payload,
+        "base_dir": base_dir,
+        "head_dir": head_dir,
+        "git": git,
+        "ticket": ticket,
+        "repo_id": repo_id,
+        "run_id": run_id,
+        "out_dir": Path("results") / repo_id / "analysis" / run_id,
+        "diff_run_id": diff_run_id,
+        **flags,
+        "batch_token_budget": batch_token_budget,
+        "profile_mode": payload.get("profile") or os.environ.get("ANALYZE_PROFILE") or None,
+        "rename_detection": rename_detection,
+        "shared": None,
+    }, None
 
-    # repo_id derived from base folder name
-    repo_id = Path(base_dir).name
-    knowledge_dir = Path("results") / repo_id / "knowledge"
-    bundle = load_knowledge_bundle(str(knowledge_dir))
 
-    # Ensure shadow knowledge exists (used by navigator contexts)
+def _collect_analysis(params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Drain the analyze pipeline; (response body, HTTP status)."""
+    result = None
+    for event, data in _run_analysis(params):
+        if event in ("done", "error"):
+            result = (event, data)
+    if result is None:
+        return {"ok": False, "error": "analysis produced no report"}, 500
+    if result[0] == "error":
+        return {"ok": False, "error": result[1]["error"]}, result[1]["status"]
+    return result[1], 200
+
+
+def _ensure_shadow(repo_id: str, base_tree: Any) -> Path:
+    # _index.json is written last, so its presence means a complete SKT; concurrent analyses wait on
+    # the lock instead of racing the build
     shadow_root = Path("results") / repo_id / "shadow"
-    if not shadow_root.exists():
-        shadow_root.mkdir(parents=True, exist_ok=True)
-        try:
-            build_shadow_knowledge(repo_dir=base_dir, out_dir=str(shadow_root))
-        except Exception:
-            pass
+    if not (shadow_root / "_index.json").exists():
+        with repo_lock(repo_id, "shadow"):
+            if not (shadow_root / "_index.json").exists():
+                shadow_root.mkdir(parents=True, exist_ok=True)
+                try:
+                    build_shadow_knowledge(repo_dir=base_tree, out_dir=str(shadow_root), objects_dir=str(objects_dir_for(repo_id)))
+                except Exception:
+                    pass
+    return shadow_root
+
+
+@contextmanager
+def _shared_base(params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Base-side artifacts computed once for every head of a /local/pr/rank request."""
+    repo_id = params["repo_id"]
+    git = params["git"]
+    base_tree = source_trees(git, label=repo_id)[0] if git else params["base_dir"]
+    _ensure_shadow(repo_id, base_tree)
+    shared: Dict[str, Any] = {
+        "bundle": load_knowledge_bundle(str(Path("results") / repo_id / "knowledge")),
+        # per-file AST summaries keyed by content; base files are parsed by the first head only
+        "ast_cache": {},
+        "snapshot": None,
+    }
+    if git:
+        yield shared  # commits are already in the object store
+        return
+    with base_snapshot(params["base_dir"]) as snapshot:
+        shared["snapshot"] = snapshot
+        yield shared
+
+
+def _ranking_table(labels: List[str], results: List[Tuple[Dict[str, Any], int]]) -> List[Dict[str, Any]]:
+    """One row per head, best score first; equal scores share a position. Failed heads go last."""
+    rows: List[Dict[str, Any]] = []
+    failed: List[Dict[str, Any]] = []
+    for label, (body, status) in zip(labels, results):
+        if status != 200:
+            failed.append({"label": label, "ok": False, "position": None, "error": body.get("error")})
+            continue
+        report = body["report"]
+        ta = report.get("ticket_alignment", {})
+        sections = report.get("section_scores", {})
+        rows.append({
+            "label": label,
+            "ok": True,
+            "run_id": Path(body["output_dir"]).name,
+            "score": report.get("score"),
+            "rank": report.get("rank"),
+            "risk_level": report.get("risk_level"),
+            "matched": len(ta.get("matched", []) or []),
+            "unmet": len(ta.get("unmet", []) or []),
+            "out_of_scope_count": sections.get("out_of_scope_count", 0),
+            "rule_violations": sections.get("rule_violations", 0),
+            "api_changes": sections.get("api_changes", 0),
+        })
+    rows.sort(key=lambda r: -(r["score"] or 0))
+    for r in rows:
+        r["position"] = 1 + sum(1 for o in rows if (o["score"] or 0) > (r["score"] or 0))
+    return rows + failed
+
+
+def _dir_memo_context(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    # every SDE directory carries the run folder as its root parent's name, which is not about this
+    # directory, so it stays out of the memo key
+    parents = [{**p, "name": ""} if p.get("rel_path") == "" else p for p in ctx.get("parents", [])]
+    return {**ctx, "parents": parents}
+
+
+def _memoizable_alignment(alignment: Dict[str, Any]) -> bool:
+    # fallback answers (LLM disabled or failed) are not worth keeping: the next run should retry
+    return (alignment or {}).get("notes") != "shadow_fallback"
+
+
+def _run_analysis(params: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # held shared for the whole run: compaction must not delete the shadow_diff run it reuses or writes
+    with repo_lock(params["repo_id"], RUNS_LOCK, shared=True):
+        with run_metrics(params["run_id"]) as metrics, maybe_profile(params["profile_mode"], params["out_dir"]):
+            for event, data in _analyze_local_pr(metrics=metrics, **params):
+                if event == "done":
+                    metrics.status = "done"
+                elif event == "error":
+                    metrics.status = "rejected" if 400 <= int(data.get("status") or 500) < 500 else "error"
+                yield event, data
+
 
-    diff_bundle = compute_local_diff(base_dir=base_dir, head_dir=head_dir, include_context=True)
-    feature_summary = build_feature_summary(ticket=ticket, diff_bundle=diff_bundle)
-    dry_run = static_dry_run(api_surface=bundle["api_surface"], deps=bundle["deps"], diff_bundle=diff_bundle)
+def _analyze_local_pr(
+    payload: Dict[str, Any],
+    base_dir: str | None,
+    head_dir: str | None,
+    git: Dict[str, Any] | None,
+    ticket: Dict[str, Any],
+    repo_id: str,
+    run_id: str,
+    out_dir: Path,
+    diff_run_id: str | None,
+    reuse_diff: bool,
+    batch_prompts: bool,
+    batch_token_budget: int,
+    triage: bool,
+    fast_fail: bool,
+    memo: bool,
+    metrics: RunMetrics,
+    profile_mode: str | bool | None,
+    rename_detection: str | None,
+    shared: Dict[str, Any] | None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Run the analyze pipeline, yielding (event, data) as each stage's result is ready."""
+    # tree walkers take a directory or a GitPath (commit view read through cat-file)
+    base_tree, head_tree = source_trees(git, label=repo_id) if git else (base_dir, head_dir)
+    with metrics.stage("load_knowledge"):
+        # shared: base-side artifacts of a /local/pr/rank request, prepared once for all heads
+        # Ensure shadow knowledge exists (used by navigator contexts); building it also generates the
+        # knowledge bundle on a repo's first analysis, so the bundle is loaded after
+        shadow_root = _ensure_shadow(repo_id, base_tree)
+        knowledge_dir = Path("results") / repo_id / "knowledge"
+        bundle = shared["bundle"] if shared else load_knowledge_bundle(str(knowledge_dir))
 
-    # AST-level deltas on changed code files
-    changed_files = [f.get("path") for f in diff_bundle.get("files", []) if f.get("path")]
-    ast_deltas = compute_ast_deltas(base_dir=base_dir, head_dir=head_dir, changed_files=changed_files)
+    # Reuse a stored SDE run (explicit run_id, or same base/head fingerprint) instead of re-diffing
+    runs_root = Path("results") / repo_id / "shadow_diff"
+    with metrics.stage("diff_lookup"):
+        fingerprint = None
+        if diff_run_id or reuse_diff:
+            fingerprint = commit_fingerprint(git, similarity=rename_detection) if git else snapshot_fingerprint(base_dir=base_dir, head_dir=head_dir, similarity=rename_detection)
+        if not diff_run_id and reuse_diff:
+            diff_run_id = find_diff_run(runs_root=str(runs_root), fingerprint=fingerprint)
+        stored = load_diff_run(str(runs_root / diff_run_id)) if diff_run_id else None
+    # an explicit run_id must name a run built from these same trees and diff options
+    if payload.get("run_id") and stored is None:
+        yield "error", {"status": 404, "error": "shadow diff run not found"}
+        return
+    if payload.get("run_id") and stored.get("fingerprint") != fingerprint:
+        yield "error", {"status": 409, "error": "shadow diff run was built from different base/head inputs"}
+        return
+
+    with metrics.stage("diff") as diff_stage:
+        if stored is not None:
+            diff_bundle = stored["diff_bundle"]
+            if "context" not in diff_bundle:
+                attach_head_context(diff_bundle)
+            shadow_diff_root = runs_root / diff_run_id
+        else:
+            diff_run_id = run_id
+            if git:
+                diff_bundle = compute_git_diff(git, include_context=True, similarity=rename_detection)
+            elif shared and shared["snapshot"]:
+                diff_bundle = compute_snapshot_diff(shared["snapshot"], head_dir=head_dir, include_context=True, similarity=rename_detection)
+            else:
+                diff_bundle = compute_local_diff(base_dir=base_dir, head_dir=head_dir, include_context=True, similarity=rename_detection)
+            shadow_diff_root = runs_root / run_id
+            shadow_diff_root.mkdir(parents=True, exist_ok=True)
+            build_shadow_diff(base_dir=base_tree, head_dir=head_tree, diff_bundle=diff_bundle, shadow_root=str(shadow_diff_root), objects_dir=str(objects_dir_for(repo_id)))
+            if fingerprint is None:
+                fingerprint = commit_fingerprint(git, similarity=rename_detection) if git else snapshot_fingerprint(base_dir=base_dir, head_dir=head_dir, similarity=rename_detection)
+            save_diff_run(shadow_root=str(shadow_diff_root), diff_bundle=diff_bundle, fingerprint=fingerprint, base_dir=base_dir, head_dir=head_dir, git=git)
+        diff_stage["reused"] = stored is not None
+    yield "diff", {
+        "diff_run_id": diff_run_id,
+        "reused": stored is not None,
+        "shadow_diff_root": str(shadow_diff_root),
+        "summary": diff_bundle.get("summary", {}),
+        "files": [{"path": f.get("path"), "status": f.get("status")} for f in diff_bundle.get("files", [])],
+    }
+
+    # Memoized stages (stage_cache_service.STAGE_INPUTS): each is keyed by content hashes of its
+    # inputs under results/{repo_id}/memo, so re-analysing an updated PR recomputes only what changed
+    memo_root = memo_root_for(repo_id) if memo else None
+    digests = {
+        "ticket": content_hash(ticket),
+        "knowledge": content_hash(bundle),
+        "diff": content_hash(diff_bundle),
+        "model": content_hash(llm_identity()),
+    }
+    memo_status: Dict[str, bool] = {"diff": stored is not None}
+    reused_dirs: List[str] = []
+
+    with metrics.stage("feature_summary") as st:
+        feature_summary, st["reused"] = memo_stage(memo_root, "feature_summary", digests, lambda: build_feature_summary(ticket=ticket, diff_bundle=diff_bundle))
+        memo_status["feature_summary"], digests["feature_summary"] = st["reused"], content_hash(feature_summary)
+    yield "feature_summary", feature_summary
+
+    # AST-level deltas on changed code files; memoized per file content rather than per run. They run
+    # before the dry run, which narrows callers to importers of the touched exports
+    with metrics.stage("ast_deltas") as st:
+        changed_files = [f.get("path") for f in diff_bundle.get("files", []) if f.get("path") and not f.get("classified")]
+        ast_memo = StageMemo(memo_root, "ast_file")
+        ast_cache = ast_memo if memo else (shared["ast_cache"] if shared else None)
+        ast_deltas = compute_ast_deltas(base_dir=base_tree, head_dir=head_tree, changed_files=changed_files, cache=ast_cache, diff_bundle=diff_bundle)
+        memo_status["ast_deltas"] = st["reused"] = ast_memo.hits > 0 and ast_memo.misses == 0
+        digests["ast_deltas"] = content_hash(ast_deltas)
+    yield "ast_deltas", ast_deltas
+
+    with metrics.stage("dry_run") as st:
+        dry_run, st["reused"] = memo_stage(memo_root, "dry_run", digests, lambda: static_dry_run(api_surface=bundle["api_surface"], deps=bundle["deps"], diff_bundle=diff_bundle, ast_deltas=ast_deltas))
+        memo_status["dry_run"], digests["dry_run"] = st["reused"], content_hash(dry_run)
+    yield "dry_run", dry_run
 
     # Deterministic guards (global). Shadow-scoped LLM prompts are used for alignment/impact per directory
-    scope_out = ScopeGuard.run(ticket=ticket, diff_bundle=diff_bundle)
-    rule_out = RuleGuard.run(rules=bundle["rules"], diff_bundle=diff_bundle, deps=bundle["deps"])
-    impact_out = ImpactGuard.run(api=bundle["api_surface"], deps=bundle["deps"], diff_bundle=diff_bundle)
-
-    # Build shadow diff environment for this analysis and perform root + per-directory shadow prompts
-    run_id = __import__("datetime").datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    shadow_diff_root = Path("results") / repo_id / "shadow_diff" / run_id
-    shadow_diff_root.mkdir(parents=True, exist_ok=True)
-    build_shadow_diff(base_dir=base_dir, head_dir=head_dir, diff_bundle=diff_bundle, shadow_root=str(shadow_diff_root))
-
-    # Root context alignment
-    root_ctx = get_dir_context(shadow_root=str(shadow_diff_root), rel_path="", include_diff=True, budget=4000)
-    global_summary = {"feature_summary": feature_summary, "dry_run": dry_run}
-    alignment = ticket_alignment_shadow(ticket=ticket, dir_context=root_ctx, global_summary=global_summary)
-
-    # Per-directory shadow prompts
+    with metrics.stage("guards") as st:
+        guards, st["reused"] = memo_stage(memo_root, "guards", digests, lambda: {
+            "scope": ScopeGuard.run(ticket=ticket, diff_bundle=diff_bundle),
+            "rules": RuleGuard.run(rules=bundle["rules"], diff_bundle=diff_bundle, deps=bundle["deps"]),
+            "impact": ImpactGuard.run(api=bundle["api_surface"], deps=bundle["deps"], diff_bundle=diff_bundle, ast_deltas=ast_deltas),
+        })
+        scope_out, rule_out, impact_out = guards["scope"], guards["rules"], guards["impact"]
+        memo_status["guards"] = st["reused"]
+    yield "guards", {"scope": scope_out, "rules": rule_out, "impact": impact_out}
+
     changed_dirs = sorted({str(Path(f.get("path") or "").parent) if str(Path(f.get("path") or "").parent) != "." else "" for f in diff_bundle.get("files", []) if f.get("path")})
-    per_dir_alignment: List[Dict[str, Any]] = []
-    per_dir_impact: List[Dict[str, Any]] = []
-    per_directory: List[Dict[str, Any]] = []
-    for rel in changed_dirs:
-        ctx = get_dir_context(shadow_root=str(shadow_diff_root), rel_path=rel, include_diff=True, budget=3000)
-        try:
-            a = ticket_alignment_shadow(ticket=ticket, dir_context=ctx, global_summary=global_summary)
-            per_dir_alignment.append({"rel_path": rel, "alignment": a})
-        except Exception:
-            per_dir_alignment.append({"rel_path": rel, "alignment": {"ticket_alignment": {"matched": [], "unmet": [], "evidence": []}}})
-        try:
-            ig = impact_guard_shadow(dir_context=ctx, feature_summary=feature_summary, dry_run=dry_run)
-            per_dir_impact.append({"rel_path": rel, "impact": ig})
-        except Exception:
-            per_dir_impact.append({"rel_path": rel, "impact": {"changed_exports": [], "signature_changes": [], "possibly_impacted": []}})
-
-    # Merge per-dir results conservatively into global
-    ac_list = [c.get("id") for c in ticket.get("ticket", {}).get("acceptance_criteria", [])]
-    matched_union: List[str] = [m for m in (alignment.get("ticket_alignment", {}).get("matched", []) or []) if m in ac_list]
-    evidence: List[Dict[str, Any]] = list(alignment.get("ticket_alignment", {}).get("evidence", []))
-    for a in per_dir_alignment:
-        ta = (a.get("alignment") or {}).get("ticket_alignment", {})
-        rel = a.get("rel_path", "")
-        for m in ta.get("matched", []) or []:
-            if m in ac_list and m not in matched_union:
-                matched_union.append(m)
-        for ev in ta.get("evidence", []) or []:
-            # attach rel_path if missing
-            if isinstance(ev, dict) and "rel_path" not in ev:
-                ev["rel_path"] = rel
-            evidence.append(ev)
-    unmet = [x for x in ac_list if x not in matched_union]
-    alignment = {
-        "schema_version": "1.0",
-        "ticket_alignment": {"matched": matched_union, "unmet": unmet, "evidence": evidence},
-        "notes": "shadow_alignment"
-    }
+    # Fast-fail: rank 1 is already certain from deterministic signals, so no LLM stage can change the outcome
+    blockers = deterministic_blockers(profile=bundle["profile"], scope=scope_out, rules=rule_out, dry_run={**dry_run, "ast_deltas": ast_deltas}) if fast_fail else []
+    if blockers:
+        ac_list = [c.get("id") for c in ticket.get("ticket", {}).get("acceptance_criteria", [])]
+        alignment = {
+            "schema_version": "1.0",
+            "ticket_alignment": {"matched": [], "unmet": ac_list, "evidence": [], "skipped": True},
+            "notes": "fast_fail"
+        }
+        skipped = {rel: "fast_fail" for rel in changed_dirs}
+        per_directory = [
+            {"rel_path": rel, "matched": [], "impact": {"changed_exports": [], "signature_changes": [], "possibly_impacted": []}, "skipped": True, "skip_reason": "fast_fail"}
+            for rel in changed_dirs
+        ]
+        yield "fast_fail", {"blockers": blockers}
+    else:
+        # Directories whose changes are all non-code and already decided skip the per-dir prompts
+        with metrics.stage("triage"):
+            triaged = triage_directories(ticket=ticket, diff_bundle=diff_bundle, scope=scope_out, skt_root=str(shadow_root)) if triage else {}
+            skipped = {rel: t["reason"] for rel, t in triaged.items() if not t["needs_llm"]}
+        yield "triage", {"enabled": triage, "skipped_dirs": skipped}
+
+        with metrics.stage("shadow_prompts"):
+            # Root context alignment over the (fresh or reused) shadow diff environment
+            def dir_context(rel: str, budget: int = 3000) -> Dict[str, Any]:
+                # code files whose hunks map to AST symbols are sent as symbol-level deltas
+                ctx = get_dir_context(shadow_root=str(shadow_diff_root), rel_path=rel, include_diff=True, budget=budget)
+                return scope_dir_context(ctx, diff_bundle, ast_deltas.get("symbol_deltas", []))
+
+            root_ctx = dir_context("", budget=4000)
+            global_summary = {"feature_summary": feature_summary, "dry_run": dry_run}
+            alignment, memo_status["root_alignment"] = memo_stage(
+                memo_root, "root_alignment", {**digests, "root_context": content_hash(root_ctx)},
+                lambda: ticket_alignment_shadow(ticket=ticket, dir_context=root_ctx, global_summary=global_summary),
+                keep=lambda a: a.get("notes") != "shadow_fallback",
+            )
+            yield "root_alignment", alignment
+
+            # Per-directory shadow prompts: each reads the feature summary and dry run of its own files
+            summaries = directory_summaries(ticket=ticket, deps=bundle["deps"], diff_bundle=diff_bundle, ast_deltas=ast_deltas, rel_dirs=[rel for rel in changed_dirs if rel not in skipped])
+            per_dir_alignment: List[Dict[str, Any]] = []
+            per_dir_impact: List[Dict[str, Any]] = []
+            per_directory: List[Dict[str, Any]] = []
+            contexts: Dict[str, Dict[str, Any]] = {}
+            batched: Dict[str, Dict[str, Any]] = {rel: skipped_dir_result(ticket) for rel in changed_dirs if rel in skipped}
+            prompt_dirs = [rel for rel in changed_dirs if rel not in skipped]
+            dir_memo = StageMemo(memo_root, "directory")
+            dir_keys: Dict[str, str] = {}
+            if memo_root is not None:
+                # a directory whose own context is unchanged reuses its alignment+impact answers
+                for rel in prompt_dirs:
+                    contexts[rel] = dir_context(rel)
+                    dir_keys[rel] = stage_key("directory", {**digests, "dir_context": content_hash(_dir_memo_context(contexts[rel])), "dir_summary": content_hash(summaries[rel])})
+                    hit = dir_memo.get(dir_keys[rel])
+                    if hit is not None:
+                        batched[rel] = hit
+                        reused_dirs.append(rel)
+                        yield "directory", {"rel_path": rel, **hit, "reused": True}
+                prompt_dirs = [rel for rel in prompt_dirs if rel not in batched]
+            if batch_prompts and prompt_dirs:
+                # Pack small directories into combined alignment+impact prompts; anything the model
+                # leaves out falls through to the per-directory prompts below
+                for rel in prompt_dirs:
+                    if rel not in contexts:
+                        contexts[rel] = dir_context(rel)
+                for group in pack_dir_contexts([{**contexts[rel], "dir_summary": summaries[rel]} for rel in prompt_dirs], token_budget=batch_token_budget):
+                    rels = [c.get("rel_path", "") for c in group]
+                    with metrics.stage("shadow_prompts.batch", rel_path=",".join(rels)):
+                        try:
+                            batched.update(batched_shadow_prompts(ticket=ticket, dir_contexts=group))
+                        except Exception:
+                            pass
+                    for rel in rels:
+                        if rel in batched:
+                            if rel in dir_keys and _memoizable_alignment(batched[rel]["alignment"]):
+                                dir_memo[dir_keys[rel]] = batched[rel]
+                            yield "directory", {"rel_path": rel, **batched[rel]}
+            for rel in changed_dirs:
+                if rel in batched:
+                    per_dir_alignment.append({"rel_path": rel, "alignment": batched[rel]["alignment"]})
+                    per_dir_impact.append({"rel_path": rel, "impact": batched[rel]["impact"]})
+                    if rel in skipped:
+                        yield "directory", {"rel_path": rel, **batched[rel], "skipped": True, "skip_reason": skipped[rel]}
+                    continue
+                with metrics.stage("shadow_prompts.dir", rel_path=rel):
+                    ctx = contexts.get(rel) or dir_context(rel)
+                    complete = True
+                    try:
+                        a = ticket_alignment_shadow(ticket=ticket, dir_context=ctx, global_summary=summaries[rel])
+                        per_dir_alignment.append({"rel_path": rel, "alignment": a})
+                        complete = _memoizable_alignment(a)
+                    except Exception:
+                        complete = False
+                        per_dir_alignment.append({"rel_path": rel, "alignment": {"ticket_alignment": {"matched": [], "unmet": [], "evidence": []}}})
+                    try:
+                        ig = impact_guard_shadow(dir_context=ctx, feature_summary=summaries[rel]["feature_summary"], dry_run=summaries[rel]["dry_run"])
+                        per_dir_impact.append({"rel_path": rel, "impact": ig})
+                    except Exception:
+                        complete = False
+                        per_dir_impact.append({"rel_path": rel, "impact": {"changed_exports": [], "signature_changes": [], "possibly_impacted": []}})
+                    if complete and rel in dir_keys:
+                        dir_memo[dir_keys[rel]] = {"alignment": per_dir_alignment[-1]["alignment"], "impact": per_dir_impact[-1]["impact"]}
+                yield "directory", {"rel_path": rel, "alignment": per_dir_alignment[-1]["alignment"], "impact": per_dir_impact[-1]["impact"]}
 
-    # Impact: union and de-dup (override deterministic if shadow has signals)
-    ch: List[str] = []
-    sig: List[str] = []
-    imp: List[str] = []
-    for ig in per_dir_impact:
-        impact_obj = ig.get("impact") or {}
-        for v in impact_obj.get("changed_exports", []) or []:
-            if v not in ch:
-                ch.append(v)
-        for v in impact_obj.get("signature_changes", []) or []:
-            if v not in sig:
-                sig.append(v)
-        for v in impact_obj.get("possibly_impacted", []) or []:
-            if v not in imp:
-                imp.append(v)
-    if ch or sig or imp:
-        impact_out = {"changed_exports": ch, "signature_changes": sig, "possibly_impacted": imp}
-
-    # Build per_directory array
-    for i in range(len(per_dir_alignment)):
-        rel = per_dir_alignment[i].get("rel_path", "")
-        align = (per_dir_alignment[i].get("alignment") or {}).get("ticket_alignment", {})
-        imp_dir = (per_dir_impact[i].get("impact") if i < len(per_dir_impact) else {}) or {}
-        per_directory.append({
-            "rel_path": rel,
-            "matched": [m for m in (align.get("matched", []) or []) if m in ac_list],
-            "impact": {
-                "changed_exports": imp_dir.get("changed_exports", []),
-                "signature_changes": imp_dir.get("signature_changes", []),
-                "possibly_impacted": imp_dir.get("possibly_impacted", []),
+        with metrics.stage("merge"):
+            # Merge per-dir results conservatively into global
+            ac_list = [c.get("id") for c in ticket.get("ticket", {}).get("acceptance_criteria", [])]
+            matched_union: List[str] = [m for m in (alignment.get("ticket_alignment", {}).get("matched", []) or []) if m in ac_list]
+            evidence: List[Dict[str, Any]] = list(alignment.get("ticket_alignment", {}).get("evidence", []))
+            for a in per_dir_alignment:
+                ta = (a.get("alignment") or {}).get("ticket_alignment", {})
+                rel = a.get("rel_path", "")
+                for m in ta.get("matched", []) or []:
+                    if m in ac_list and m not in matched_union:
+                        matched_union.append(m)
+                for ev in ta.get("evidence", []) or []:
+                    # attach rel_path if missing
+                    if isinstance(ev, dict) and "rel_path" not in ev:
+                        ev["rel_path"] = rel
+                    evidence.append(ev)
+            unmet = [x for x in ac_list if x not in matched_union]
+            alignment = {
+                "schema_version": "1.0",
+                "ticket_alignment": {"matched": matched_union, "unmet": unmet, "evidence": evidence},
+                "notes": "shadow_alignment"
             }
-        })
 
-    score, risk_level, rank, recommendations = compute_score_and_rank(
-        profile=bundle["profile"],
-        alignment=alignment,
-        scope=scope_out,
-        rules=rule_out,
-        impact=impact_out,
-        feature_summary=feature_summary,
-        dry_run={**dry_run, "ast_deltas": ast_deltas},
-    )
-
-    # Policy evaluation and SARIF
-    policies_path = str(Path("templates") / "policies.sample.json")
-    policies = load_policies(policies_path)
-    policy_violations = evaluate_policies(report={
-        "impact": impact_out,
-        "scope": scope_out,
-        "feature_summary": feature_summary,
-    }, policies=policies)
-    sarif = build_sarif(report={}, policy_violations=policy_violations)
+            # Impact: union and de-dup (override deterministic if shadow has signals)
+            ch: List[str] = []
+            sig: List[str] = []
+            imp: List[str] = []
+            for ig in per_dir_impact:
+                impact_obj = ig.get("impact") or {}
+                for v in impact_obj.get("changed_exports", []) or []:
+                    if v not in ch:
+                        ch.append(v)
+                for v in impact_obj.get("signature_changes", []) or []:
+                    if v not in sig:
+                        sig.append(v)
+                for v in impact_obj.get("possibly_impacted", []) or []:
+                    if v not in imp:
+                        imp.append(v)
+            if ch or sig or imp:
+                impact_out = {"changed_exports": ch, "signature_changes": sig, "possibly_impacted": imp}
+
+            # Build per_directory array
+            for i in range(len(per_dir_alignment)):
+                rel = per_dir_alignment[i].get("rel_path", "")
+                align = (per_dir_alignment[i].get("alignment") or {}).get("ticket_alignment", {})
+                imp_dir = (per_dir_impact[i].get("impact") if i < len(per_dir_impact) else {}) or {}
+                entry = {
+                    "rel_path": rel,
+                    "matched": [m for m in (align.get("matched", []) or []) if m in ac_list],
+                    "impact": {
+                        "changed_exports": imp_dir.get("changed_exports", []),
+                        "signature_changes": imp_dir.get("signature_changes", []),
+                        "possibly_impacted": imp_dir.get("possibly_impacted", []),
+                    }
+                }
+                if rel in skipped:
+                    entry["skipped"] = True
+                    entry["skip_reason"] = skipped[rel]
+                if rel in reused_dirs:
+                    entry["reused"] = True
+                per_directory.append(entry)
+
+    with metrics.stage("score"):
+        score, risk_level, rank, recommendations = compute_score_and_rank(
+            profile=bundle["profile"],
+            alignment=alignment,
+            scope=scope_out,
+            rules=rule_out,
+            impact=impact_out,
+            feature_summary=feature_summary,
+            dry_run={**dry_run, "ast_deltas": ast_deltas},
+        )
+    yield "score", {"score": score, "risk_level": risk_level, "rank": rank, "recommendations": recommendations}
+
+    with metrics.stage("policies"):
+        # Policy evaluation and SARIF
+        policies_path = str(Path("templates") / "policies.sample.json")
+        policies = load_policies(policies_path)
+        policy_violations = evaluate_policies(report={
+            "impact": impact_out,
+            "scope": scope_out,
+            "feature_summary": feature_summary,
+        }, policies=policies)
+        sarif = build_sarif(report={}, policy_violations=policy_violations)
 
     report = {
         "schema_version": "1.0",
@@ -185,6 +640,13 @@ def analyze_local_pr_route():
         "risk_level": risk_level,
         "rank": rank,
         "recommendations": recommendations,
+        **({"fast_fail": {"blockers": blockers, "llm_sections": "skipped"}} if blockers else {}),
+        "memo": {
+            "enabled": memo,
+            "stages_reused": [name for name, hit in memo_status.items() if hit],
+            "stages_recomputed": [name for name, hit in memo_status.items() if not hit],
+            "directories_reused": reused_dirs,
+        },
         "section_scores": {
             "ticket_alignment": alignment.get("ticket_alignment", {}).get("matched", []),
             "out_of_scope_count": len(scope_out.get("out_of_scope_files", [])),
@@ -193,26 +655,39 @@ def analyze_local_pr_route():
         },
     }
 
-    # Persist stable outputs under results/{repoId}/analysis/{run_id}
-    out_dir = Path("results") / repo_id / "analysis" / run_id
-    out_dir.mkdir(parents=True, exist_ok=True)
-    (out_dir / "diff_bundle.json").write_text(json.dumps(diff_bundle, indent=2), encoding="utf-8")
-    (out_dir / "feature_summary.json").write_text(json.dumps(feature_summary, indent=2), encoding="utf-8")
-    (out_dir / "dry_run.json").write_text(json.dumps(report["dry_run"], indent=2), encoding="utf-8")
-    (out_dir / "report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
-    (out_dir / "report.sarif.json").write_text(json.dumps(sarif, indent=2), encoding="utf-8")
+    with metrics.stage("artifacts"):
+        # Persist stable outputs under results/{repoId}/analysis/{run_id}
+        out_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(out_dir / "diff_bundle.json", diff_bundle)
+        atomic_write_json(out_dir / "feature_summary.json", feature_summary)
+        atomic_write_json(out_dir / "dry_run.json", report["dry_run"])
+        atomic_write_json(out_dir / "report.json", report)
+        atomic_write_json(out_dir / "report.sarif.json", sarif)
+        write_score_features(out_dir, report)
     # minimal manifest
     manifest = {
         "schema_version": "1.0",
         "repo_id": repo_id,
         "run_id": run_id,
         "model": os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
-        "budgets": {"root": 4000, "dir": 3000},
+        "budgets": {"root": 4000, "dir": 3000, "batch": batch_token_budget if batch_prompts else None},
         "base_dir": base_dir,
         "head_dir": head_dir,
+        "git": git,
+        "diff_run_id": diff_run_id,
+        "diff_reused": stored is not None,
+        "triage": {"enabled": triage, "skipped_dirs": skipped},
+        "fast_fail": {"enabled": fast_fail, "blockers": blockers},
+        "memo": report["memo"],
+        "profile": profile_mode,
+        "metrics": metrics.to_dict(),
     }
-    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
-    extra = {"shadow_diff_root": str(shadow_diff_root)} if 'shadow_diff_root' in locals() else {}
-    return jsonify({"ok": True, "report": report, "output_dir": str(out_dir), **extra}), 200
+    atomic_write_json(out_dir / "manifest.json", manifest)
+    try:
+        index_run(repo_id=repo_id, run_id=run_id, report=report, diff_bundle=diff_bundle, output_dir=str(out_dir), diff_run_id=diff_run_id)
+    except Exception:
+        pass
+    extra = {"shadow_diff_root": str(shadow_diff_root), "diff_run_id": diff_run_id, "diff_reused": stored is not None}
+    yield "done", {"ok": True, "report": report, "output_dir": str(out_dir), **extra}
 
 
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Any
+
+from flask import Blueprint, jsonify, request
+
+from server.services.retention_service import run_compaction, last_compaction
+
+
+retention_bp = Blueprint("retention", __name__)
+
+
+@retention_bp.post("/retention/compact")
+def compact_route():
+    payload: Dict[str, Any] = request.get_json(force=True, silent=True) or {}
+    repo_id = payload.get("repo_id")
+    if repo_id is not None and (not isinstance(repo_id, str) or Path(repo_id).name != repo_id):
+        return jsonify({"ok": False, "error": "Invalid repo_id"}), 400
+    report = run_compaction(repo_id=repo_id, dry_run=bool(payload.get("dry_run", False)))
+    return jsonify({"ok": True, "report": report}), 200
+
+
+@retention_bp.get("/retention/status")
+def status_route():
+    return jsonify({"ok": True, "last": last_compaction()}), 200
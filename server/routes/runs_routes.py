@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request
+
+from server.services.run_index_service import query_runs
+
+
+runs_bp = Blueprint("runs", __name__)
+
+
+@runs_bp.get("/runs")
+def list_runs_route():
+    args = request.args
+    try:
+        rank = int(args["rank"]) if args.get("rank") else None
+        limit = int(args.get("limit") or 100)
+    except ValueError:
+        return jsonify({"ok": False, "error": "rank and limit must be integers"}), 400
+    runs = query_runs(
+        repo_id=args.get("repo_id") or None,
+        path=args.get("path") or None,
+        rank=rank,
+        risk_level=args.get("risk_level") or None,
+        violation_id=args.get("violation_id") or None,
+        since=args.get("since") or None,
+        until=args.get("until") or None,
+        limit=limit,
+    )
+    return jsonify({"ok": True, "count": len(runs), "runs": runs}), 200
@@ -2,18 +2,22 @@ from __future__ import annotations
 
 import json
 import os
-from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any
 
 from flask import Blueprint, jsonify, request
 
-from server.services.diff_service import compute_local_diff
+from server.services.diff_service import CONTEXT_MODES, SIMILARITY_MODES, attach_head_context, compute_local_diff, compute_git_diff, load_context_excerpts, snapshot_fingerprint, commit_fingerprint
+from server.services.git_source_service import GitPath, is_git_repo, git_source, git_repo_id, resolve_commit, source_trees, tree_root
 from server.services.shadow_fs_service import (
     build_shadow_knowledge,
     build_shadow_diff,
     get_dir_context,
+    load_diff_run,
+    save_diff_run,
 )
+from server.services.object_store_service import objects_dir_for
+from server.services.run_io_service import reserve_run_dir, repo_lock
 from server.services.policy_service import evaluate_policies, load_policies
 from server.services.sarif_service import build_sarif
 
@@ -24,41 +28,76 @@ shadow_bp = Blueprint("shadow", __name__)
 @shadow_bp.post("/shadow/init")
 def shadow_init_route():
     payload: Dict[str, Any] = request.get_json(force=True, silent=False)
-    repo_dir = payload.get("repo_dir")
-    if not repo_dir or not os.path.isdir(repo_dir):
-        return jsonify({"ok": False, "error": "Invalid repo_dir"}), 400
+    git_dir = payload.get("repo_git_dir")
+    if git_dir:
+        # git-ref mode: build the SKT from one commit ({repo_git_dir, [ref], [repo_id]}) without a checkout
+        if not isinstance(git_dir, str) or not is_git_repo(git_dir):
+            return jsonify({"ok": False, "error": "Invalid repo_git_dir"}), 400
+        repo_id = payload.get("repo_id") or git_repo_id(git_dir)
+        try:
+            repo_dir = GitPath(os.path.realpath(git_dir), resolve_commit(git_dir, payload.get("ref") or "HEAD"), label=repo_id)
+        except ValueError as e:
+            return jsonify({"ok": False, "error": f"Invalid ref: {e}"}), 400
+    else:
+        repo_dir = payload.get("repo_dir")
+        if not repo_dir or not os.path.isdir(repo_dir):
+            return jsonify({"ok": False, "error": "Invalid repo_dir"}), 400
+        repo_id = Path(repo_dir).name
+    if not isinstance(repo_id, str) or not repo_id or Path(repo_id).name != repo_id:
+        return jsonify({"ok": False, "error": "Invalid repo_id"}), 400
 
-    repo_id = Path(repo_dir).name
     out_dir = Path("results") / repo_id / "shadow"
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    summary = build_shadow_knowledge(repo_dir=repo_dir, out_dir=str(out_dir))
+    with repo_lock(repo_id, "shadow"):
+        summary = build_shadow_knowledge(repo_dir=repo_dir, out_dir=str(out_dir), objects_dir=str(objects_dir_for(repo_id)))
     return jsonify({"ok": True, "repo_id": repo_id, "shadow_root": str(out_dir), "summary": summary}), 200
 
 
 @shadow_bp.post("/shadow/diff")
 def shadow_diff_route():
     payload: Dict[str, Any] = request.get_json(force=True, silent=False)
-    base_dir = payload.get("base_dir")
-    head_dir = payload.get("head_dir")
-    if not base_dir or not os.path.isdir(base_dir):
-        return jsonify({"ok": False, "error": "Invalid base_dir"}), 400
-    if not head_dir or not os.path.isdir(head_dir):
-        return jsonify({"ok": False, "error": "Invalid head_dir"}), 400
-
-    repo_id = Path(base_dir).name
-    diff_bundle = compute_local_diff(base_dir=base_dir, head_dir=head_dir, include_context=False)
-    run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    out_dir = Path("results") / repo_id / "shadow_diff" / run_id
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    (out_dir / "diff_bundle.json").write_text(json.dumps(diff_bundle, indent=2), encoding="utf-8")
-    index = build_shadow_diff(base_dir=base_dir, head_dir=head_dir, diff_bundle=diff_bundle, shadow_root=str(out_dir))
+    rename_detection = payload.get("rename_detection")
+    if rename_detection is not None and rename_detection not in SIMILARITY_MODES:
+        return jsonify({"ok": False, "error": f"Invalid rename_detection (one of {list(SIMILARITY_MODES)})"}), 400
+    git = None
+    if payload.get("repo_git_dir"):
+        git_dir = payload.get("repo_git_dir")
+        if not isinstance(git_dir, str) or not is_git_repo(git_dir):
+            return jsonify({"ok": False, "error": "Invalid repo_git_dir"}), 400
+        try:
+            git = git_source(git_dir, payload.get("base_ref"), payload.get("head_ref"))
+        except ValueError as e:
+            return jsonify({"ok": False, "error": f"Invalid base_ref/head_ref: {e}"}), 400
+        base_dir = head_dir = None
+        repo_id = payload.get("repo_id") or git_repo_id(git_dir)
+        if not isinstance(repo_id, str) or not repo_id or Path(repo_id).name != repo_id:
+            return jsonify({"ok": False, "error": "Invalid repo_id"}), 400
+        base_tree, head_tree = source_trees(git, label=repo_id)
+        fingerprint = commit_fingerprint(git, similarity=rename_detection)
+        diff_bundle = compute_git_diff(git, include_context=False, similarity=rename_detection)
+    else:
+        base_dir = payload.get("base_dir")
+        head_dir = payload.get("head_dir")
+        if not base_dir or not os.path.isdir(base_dir):
+            return jsonify({"ok": False, "error": "Invalid base_dir"}), 400
+        if not head_dir or not os.path.isdir(head_dir):
+            return jsonify({"ok": False, "error": "Invalid head_dir"}), 400
+        repo_id = Path(base_dir).name
+        base_tree, head_tree = base_dir, head_dir
+        fingerprint = snapshot_fingerprint(base_dir=base_dir, head_dir=head_dir, similarity=rename_detection)
+        diff_bundle = compute_local_diff(base_dir=base_dir, head_dir=head_dir, include_context=False, similarity=rename_detection)
+    run_id, out_dir = reserve_run_dir(Path("results") / repo_id / "shadow_diff")
+
+    index = build_shadow_diff(base_dir=base_tree, head_dir=head_tree, diff_bundle=diff_bundle, shadow_root=str(out_dir), objects_dir=str(objects_dir_for(repo_id)))
+    # diff_bundle.json + _run.json let /local/pr/analyze reuse this run (by run_id or fingerprint)
+    save_diff_run(shadow_root=str(out_dir), diff_bundle=diff_bundle, fingerprint=fingerprint, base_dir=base_dir, head_dir=head_dir, git=git)
 
     return jsonify({
         "ok": True,
         "repo_id": repo_id,
         "run_id": run_id,
+        "fingerprint": fingerprint,
         "shadow_diff_root": str(out_dir),
         "index": index,
     }), 200
@@ -98,12 +137,16 @@ def shadow_file_content_route():
         analysis_root = Path("results") / repo_id / "analysis" / (run_id or "")
         manifest_path = analysis_root / "manifest.json"
         manifest = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
-        base_dir = manifest.get("base_dir")
-        head_dir = manifest.get("head_dir")
-        root = head_dir if where == "head" else base_dir
+        git = manifest.get("git")
+        if git:
+            # git-ref runs: read the blob at the run's resolved commit via the persistent cat-file reader
+            base_tree, head_tree = source_trees(git)
+            root = head_tree if where == "head" else base_tree
+        else:
+            root = manifest.get("head_dir") if where == "head" else manifest.get("base_dir")
         if not root:
             return jsonify({"ok": False, "error": "manifest missing base/head"}), 400
-        target = Path(root) / rel_path
+        target = tree_root(root) / rel_path
         if not target.exists() or not target.is_file():
             return jsonify({"ok": False, "error": "file not found"}), 404
         data = target.read_bytes()[:max_bytes]
@@ -116,6 +159,40 @@ def shadow_file_content_route():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@shadow_bp.post("/shadow/context_excerpts")
+def shadow_context_excerpts_route():
+    """Head-context excerpts of a stored SDE run's changed files, resolved on demand from its
+    recorded head (directory or git commit): { repo_id, run_id, [paths], [mode], [context_bytes], [context_lines] }.
+    """
+    payload: Dict[str, Any] = request.get_json(force=True, silent=False)
+    repo_id = payload.get("repo_id")
+    run_id = payload.get("run_id")
+    if not repo_id or not run_id or Path(str(repo_id)).name != repo_id or Path(str(run_id)).name != run_id:
+        return jsonify({"ok": False, "error": "repo_id and run_id required"}), 400
+    mode = payload.get("mode")
+    if mode is not None and mode not in CONTEXT_MODES:
+        return jsonify({"ok": False, "error": f"mode must be one of {list(CONTEXT_MODES)}"}), 400
+    paths = payload.get("paths")
+    if paths is not None and (not isinstance(paths, list) or not all(isinstance(p, str) for p in paths)):
+        return jsonify({"ok": False, "error": "paths must be a list of strings"}), 400
+    run = load_diff_run(str(Path("results") / repo_id / "shadow_diff" / run_id))
+    if run is None:
+        return jsonify({"ok": False, "error": "shadow diff run not found"}), 404
+    head = source_trees(run["git"])[1] if run.get("git") else run.get("head_dir")
+    if not head:
+        return jsonify({"ok": False, "error": "run has no recorded head"}), 400
+    diff_bundle = run["diff_bundle"]
+    if "context" not in diff_bundle:
+        attach_head_context(diff_bundle)
+    try:
+        context_bytes = int(payload["context_bytes"]) if payload.get("context_bytes") else None
+        context_lines = int(payload["context_lines"]) if payload.get("context_lines") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "context_bytes/context_lines must be integers"}), 400
+    excerpts = load_context_excerpts(diff_bundle, head_dir=head, paths=paths, mode=mode, context_bytes=context_bytes, context_lines=context_lines)
+    return jsonify({"ok": True, "mode": mode or diff_bundle["context"]["mode"], "excerpts": excerpts}), 200
+
+
 @shadow_bp.post("/policy/evaluate")
 def policy_evaluate_route():
     payload: Dict[str, Any] = request.get_json(force=True, silent=False)
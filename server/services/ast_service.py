@@ -1,42 +1,233 @@
 from __future__ import annotations
 
+import ast
 import json
 import subprocess
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, MutableMapping, Tuple
 
+from server.services.git_source_service import GitPath, tree_root
+from server.services.stage_cache_service import content_hash, stage_key
+from server.services.symbol_map_service import exported_changes, map_hunks_to_symbols
+from server.services.worker_pool_service import parallel_map
 
-def _run_node_ast(file_path: str) -> Dict[str, Any] | None:
+
+JS_SUFFIXES = (".ts", ".tsx", ".js", ".jsx", ".mjs")
+PY_SUFFIXES = (".py",)
+
+
+def _run_node_ast(file_path: str, source: bytes | None = None) -> Dict[str, Any] | None:
     script = Path(__file__).parent / "js_ast_extract.js"
     if not script.exists():
         return None
+    # with source, the file is not read from disk: node parses stdin and uses file_path for its extension
+    cmd = ["node", str(script), "--file", file_path] + (["--stdin"] if source is not None else [])
     try:
-        out = subprocess.check_output([
-            "node", str(script), "--file", file_path
-        ], stderr=subprocess.STDOUT, timeout=20)
+        out = subprocess.check_output(cmd, input=source, stderr=subprocess.STDOUT, timeout=20)
         return json.loads(out.decode("utf-8"))
     except Exception:
         return None
 
 
-def summarize_files_ast(root_dir: str, rel_paths: List[str]) -> Dict[str, Dict[str, Any]]:
+def _py_params(fn: ast.FunctionDef | ast.AsyncFunctionDef) -> List[str]:
+    # signature notation: "b=" has a default, "*" or "*args" starts the keyword-only params, "**kw"
+    a = fn.args
+    positional = a.posonlyargs + a.args
+    first_default = len(positional) - len(a.defaults)
+    params = [p.arg + ("=" if i >= first_default else "") for i, p in enumerate(positional)]
+    if a.vararg:
+        params.append("*" + a.vararg.arg)
+    elif a.kwonlyargs:
+        params.append("*")
+    params.extend(p.arg + ("=" if d is not None else "") for p, d in zip(a.kwonlyargs, a.kw_defaults))
+    if a.kwarg:
+        params.append("**" + a.kwarg.arg)
+    return params
+
+
+def _param_shape(params: List[str]) -> Tuple[List[Tuple[str, bool]], Dict[str, bool], bool, bool]:
+    """(positional [(name, required)], keyword-only {name: required}, has *args, has **kwargs) of a
+    summary's params; JS rest params ("...rest") count as *args.
+    """
+    positional: List[Tuple[str, bool]] = []
+    kwonly: Dict[str, bool] = {}
+    star = vararg = varkw = False
+    for p in params or []:
+        if p.startswith("**"):
+            varkw = True
+        elif p.startswith("*") or p.startswith("..."):
+            star, vararg = True, vararg or p != "*"
+        elif star:
+            kwonly[p.rstrip("=")] = not p.endswith("=")
+        else:
+            positional.append((p.rstrip("="), not p.endswith("=")))
+    return positional, kwonly, vararg, varkw
+
+
+def _params_breaking(before: List[str], after: List[str]) -> bool:
+    """True when a call valid against before can fail against after: a param removed or renamed
+    (positional ones compared in order), a new or newly required param, or *args/**kwargs dropped.
+    Appending params with defaults, or giving one a default, is compatible.
+    """
+    bpos, bkw, bvar, bvarkw = _param_shape(before)
+    hpos, hkw, hvar, hvarkw = _param_shape(after)
+    if (bvar and not hvar) or (bvarkw and not hvarkw):
+        return True
+    if any(i >= len(hpos) or hpos[i][0] != name for i, (name, _) in enumerate(bpos)):
+        return True
+    if any(required and (i >= len(bpos) or not bpos[i][1]) for i, (_, required) in enumerate(hpos)):
+        return True
+    positional_names = {name for name, _ in hpos}
+    if any(name not in hkw and name not in positional_names for name in bkw):
+        return True
+    return any(required and not bkw.get(name, False) for name, required in hkw.items())
+
+
+def _py_dunder_all(body: List[ast.stmt]) -> List[str] | None:
+    names: List[str] | None = None
+    for node in body:
+        target = node.targets[0] if isinstance(node, ast.Assign) and len(node.targets) == 1 else getattr(node, "target", None)
+        if not (isinstance(target, ast.Name) and target.id == "__all__") or getattr(node, "value", None) is None:
+            continue
+        try:
+            value = [str(v) for v in ast.literal_eval(node.value)]
+        except (ValueError, TypeError, SyntaxError):
+            return None
+        names = (names or []) + value if isinstance(node, ast.AugAssign) else value
+    return names
+
+
+def _py_public(name: str) -> bool:
+    return not name.startswith("_") or (name.startswith("__") and name.endswith("__"))
+
+
+def summarize_python_source(source: bytes) -> Dict[str, Any] | None:
+    """{exports, functions, symbols} of a Python module, same schema as js_ast_extract.js; None on a
+    syntax error. Exports follow __all__ when it is a literal, else public top-level definitions.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    defined: Dict[str, str] = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            defined[node.name] = "function"
+        elif isinstance(node, ast.ClassDef):
+            defined[node.name] = "class"
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            for t in (node.targets if isinstance(node, ast.Assign) else [node.target]):
+                if isinstance(t, ast.Name) and t.id != "__all__":
+                    defined.setdefault(t.id, "const")
+    dunder_all = _py_dunder_all(tree.body)
+    if dunder_all is not None:
+        exports = [{"name": n, "kind": defined.get(n, "spec")} for n in dict.fromkeys(dunder_all)]
+    else:
+        exports = [{"name": n, "kind": k} for n, k in defined.items() if not n.startswith("_")]
+    exported = {e["name"] for e in exports}
+
+    functions: List[Dict[str, Any]] = []
+    symbols: List[Dict[str, Any]] = []
+
+    def visit(body: List[ast.stmt], owner: str | None, owner_kind: str | None, owner_exported: bool) -> None:
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{owner}.{node.name}" if owner else node.name
+                start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                if isinstance(node, ast.ClassDef):
+                    kind, params = "class", None
+                else:
+                    kind, params = ("method" if owner_kind == "class" else "function"), _py_params(node)
+                if owner is None:
+                    is_exported = node.name in exported
+                else:
+                    # methods of an exported class are API unless private
+                    is_exported = owner_exported and owner_kind == "class" and _py_public(node.name)
+                symbols.append({"name": name, "kind": kind, "start": start, "end": node.end_lineno, "exported": is_exported and owner is None, "params": params})
+                if params is not None and (owner is None or owner_kind == "class"):
+                    functions.append({"name": name, "params": params, "isExported": is_exported})
+                visit(node.body, name, kind, is_exported)
+            elif owner is None and isinstance(node, (ast.Assign, ast.AnnAssign)):
+                for t in (node.targets if isinstance(node, ast.Assign) else [node.target]):
+                    if isinstance(t, ast.Name) and t.id != "__all__":
+                        symbols.append({"name": t.id, "kind": "const", "start": node.lineno, "end": node.end_lineno, "exported": t.id in exported, "params": None})
+            elif isinstance(node, (ast.If, ast.Try, ast.With, ast.AsyncWith)):
+                # conditional definitions (if TYPE_CHECKING / try-import fallbacks) still define the name
+                for child in ("body", "orelse", "finalbody"):
+                    visit(getattr(node, child, []) or [], owner, owner_kind, owner_exported)
+                for handler in getattr(node, "handlers", []) or []:
+                    visit(handler.body, owner, owner_kind, owner_exported)
+
+    visit(tree.body, None, None, False)
+    return {"exports": exports, "functions": functions, "symbols": symbols}
+
+
+def summarize_files_ast(root_dir: str | GitPath, rel_paths: List[str], cache: MutableMapping[str, Any] | None = None) -> Dict[str, Dict[str, Any]]:
+    """Per-file export/function summaries. With a cache, summaries are keyed by file content, so
+    unchanged files skip parsing; failed parses are never cached. JS/TS files go through the node
+    extractor; Python files are parsed in-process, fanned out over the worker pool.
+    """
     summaries: Dict[str, Dict[str, Any]] = {}
+    root = tree_root(root_dir)
+    pending_py: List[Tuple[str, str | None, bytes]] = []
     for rel in rel_paths:
-        fp = str(Path(root_dir) / rel)
-        ast = _run_node_ast(fp)
-        if ast is None:
-            ast = {"exports": [], "functions": []}
-        summaries[rel] = ast
+        target = root / rel
+        key = None
+        source = None
+        is_py = rel.endswith(PY_SUFFIXES)
+        if cache is not None or is_py or isinstance(root, GitPath):
+            try:
+                source = target.read_bytes()
+            except OSError:
+                source = None
+            if cache is not None and source is not None:
+                key = stage_key("ast_file", {"path_suffix": content_hash(target.suffix), "content": content_hash(source)})
+                hit = cache.get(key)
+                if hit is not None:
+                    summaries[rel] = hit
+                    continue
+        if is_py:
+            if source is None:
+                summaries[rel] = {"exports": [], "functions": []}
+            else:
+                pending_py.append((rel, key, source))
+            continue
+        if isinstance(root, GitPath):
+            summary = _run_node_ast(rel, source=source) if source is not None else None
+        else:
+            summary = _run_node_ast(str(target))
+        if summary is None:
+            summary = {"exports": [], "functions": []}
+        elif key is not None:
+            cache[key] = summary
+        summaries[rel] = summary
+    py_summaries = parallel_map(summarize_python_source, [source for _, _, source in pending_py])
+    for (rel, key, _), summary in zip(pending_py, py_summaries):
+        if summary is None:
+            summary = {"exports": [], "functions": []}
+        elif key is not None:
+            cache[key] = summary
+        summaries[rel] = summary
     return summaries
 
 
-def compute_ast_deltas(base_dir: str, head_dir: str, changed_files: List[str]) -> Dict[str, Any]:
-    code_files = [p for p in changed_files if p.endswith((".ts", ".tsx", ".js", ".jsx", ".mjs"))]
+def compute_ast_deltas(
+    base_dir: str | GitPath,
+    head_dir: str | GitPath,
+    changed_files: List[str],
+    cache: MutableMapping[str, Any] | None = None,
+    diff_bundle: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """Export/signature deltas of changed code files. With diff_bundle, its hunks are annotated in place
+    with their enclosing symbols and the result adds symbol-level deltas and, per file whose changes stay
+    inside exported symbols, the touched exports and the exports using them (symbol_map_service).
+    """
+    code_files = [p for p in changed_files if p.endswith(JS_SUFFIXES + PY_SUFFIXES)]
     if not code_files:
-        return {"signature_breaking": [], "exports_added": [], "exports_removed": []}
+        return {"signature_breaking": [], "exports_added": [], "exports_removed": [], "symbol_deltas": [], "symbol_files": [], "exported_changes": {}}
 
-    base = summarize_files_ast(base_dir, code_files)
-    head = summarize_files_ast(head_dir, code_files)
+    base = summarize_files_ast(base_dir, code_files, cache=cache)
+    head = summarize_files_ast(head_dir, code_files, cache=cache)
 
     signature_breaking: List[str] = []
     exports_added: List[str] = []
@@ -55,17 +246,35 @@ def compute_ast_deltas(base_dir: str, head_dir: str, changed_files: List[str]) -
 
         bf = {f.get("name"): (f.get("params", []), bool(f.get("isExported"))) for f in b.get("functions", []) if f.get("name")}
         hf = {f.get("name"): (f.get("params", []), bool(f.get("isExported"))) for f in h.get("functions", []) if f.get("name")}
-        # breaking if param length changes or export status toggles
+        # breaking if a param is removed/renamed, a required one is added, or export status toggles
         for name in (set(bf.keys()) & set(hf.keys())):
             bsig, bexp = bf[name]
             hsig, hexp = hf[name]
-            if len(bsig) != len(hsig) or bexp != hexp:
+            if _params_breaking(bsig, hsig) or bexp != hexp:
                 signature_breaking.append(f"{rel}#${name}")
 
+    symbol_deltas: List[Dict[str, Any]] = []
+    symbol_files: List[str] = []
+    exported: Dict[str, List[str]] = {}
+    if diff_bundle is not None:
+        symbol_deltas = map_hunks_to_symbols(diff_bundle, base, head)
+        symbol_files = [f["path"] for f in diff_bundle.get("files", []) if f.get("hunks") and all("symbols" in h for h in f["hunks"])]
+        root = tree_root(head_dir)
+        sources: Dict[str, str] = {}
+        for rel in symbol_files:
+            try:
+                sources[rel] = (root / rel).read_bytes().decode("utf-8", errors="replace")
+            except OSError:
+                continue
+        exported = exported_changes(diff_bundle, base, head, sources)
+
     return {
         "signature_breaking": sorted(set(signature_breaking)),
         "exports_added": sorted(set(exports_added)),
         "exports_removed": sorted(set(exports_removed)),
+        "symbol_deltas": symbol_deltas,
+        "symbol_files": symbol_files,
+        "exported_changes": exported,
     }
 
 
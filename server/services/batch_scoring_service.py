@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+from server.services.orchestrator import extract_score_features, score_features
+from server.services.run_io_service import atomic_write_json
+from server.services.worker_pool_service import parallel_map
+
+
+FEATURES_FILE = "score_features.json"
+
+
+def report_score_features(report: Dict[str, Any]) -> Dict[str, Any]:
+    return extract_score_features(
+        alignment={"ticket_alignment": report.get("ticket_alignment", {})},
+        scope=report.get("scope", {}),
+        rules=report.get("rules", {}),
+        impact=report.get("impact", {}),
+        feature_summary=report.get("feature_summary"),
+        dry_run=report.get("dry_run"),
+    )
+
+
+def write_score_features(out_dir: Path, report: Dict[str, Any]) -> Dict[str, Any]:
+    doc = {
+        "schema_version": "1.0",
+        "features": report_score_features(report),
+        "score": report.get("score"),
+        "rank": report.get("rank"),
+        "risk_level": report.get("risk_level"),
+    }
+    atomic_write_json(Path(out_dir) / FEATURES_FILE, doc, indent=None)
+    return doc
+
+
+def iter_analysis_dirs(results_root: str = "results", repo_id: str | None = None) -> List[Path]:
+    root = Path(results_root)
+    if repo_id:
+        repos = [root / repo_id]
+    else:
+        repos = sorted(p for p in root.iterdir() if p.is_dir()) if root.exists() else []
+    out: List[Path] = []
+    for repo in repos:
+        runs = repo / "analysis"
+        if runs.is_dir():
+            out.extend(sorted(d for d in runs.iterdir() if (d / "report.json").exists() or (d / FEATURES_FILE).exists()))
+    return out
+
+
+def load_feature_table(results_root: str = "results", repo_id: str | None = None, write_missing: bool = False) -> Dict[str, Any]:
+    """Extract scoring features from every stored analysis once.
+
+    Uses score_features.json when present (written at the end of each analyze run) and falls back to
+    parsing report.json; write_missing backfills the sidecar so later loads skip the full report.
+    """
+    refs: List[Dict[str, str]] = []
+    features: List[Dict[str, Any]] = []
+    stored: List[Tuple[Any, Any]] = []
+    errors: List[str] = []
+    for d in iter_analysis_dirs(results_root, repo_id):
+        try:
+            side = d / FEATURES_FILE
+            if side.exists():
+                doc = json.loads(side.read_text(encoding="utf-8"))
+            else:
+                report = json.loads((d / "report.json").read_text(encoding="utf-8"))
+                if write_missing:
+                    doc = write_score_features(d, report)
+                else:
+                    doc = {"features": report_score_features(report), "score": report.get("score"), "rank": report.get("rank")}
+        except Exception as e:
+            errors.append(f"{d}: {e}")
+            continue
+        refs.append({"repo_id": d.parent.parent.name, "run_id": d.name})
+        features.append(doc["features"])
+        stored.append((doc.get("score"), doc.get("rank")))
+    return {"refs": refs, "features": features, "stored": stored, "errors": errors}
+
+
+def score_table(table: Dict[str, Any], profile: Dict[str, Any]) -> List[Tuple[int, str, int]]:
+    # features are plain dicts and score_features is pure, so large tables spread over the worker pool
+    return parallel_map(partial(score_features, profile=profile), table["features"])
+
+
+def _quantile(sorted_vals: List[int], q: float) -> int | None:
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * (len(sorted_vals) - 1) + 0.5))]
+
+
+def summarize_scores(table: Dict[str, Any], scored: List[Tuple[int, str, int]]) -> Dict[str, Any]:
+    scores = sorted(s for s, _, _ in scored)
+    ranks = Counter(r for _, _, r in scored)
+    risks = Counter(k for _, k, _ in scored)
+    buckets = Counter(min(s // 10, 9) * 10 for s in scores)
+    transitions: Counter = Counter()
+    for (_, prev_rank), (_, _, rank) in zip(table["stored"], scored):
+        if prev_rank is not None and prev_rank != rank:
+            transitions[f"{prev_rank}->{rank}"] += 1
+    return {
+        "reports": len(scored),
+        "rank_counts": {str(r): ranks.get(r, 0) for r in range(1, 6)},
+        "risk_counts": dict(sorted(risks.items())),
+        "score": {
+            "min": scores[0] if scores else None,
+            "p25": _quantile(scores, 0.25),
+            "median": _quantile(scores, 0.5),
+            "p75": _quantile(scores, 0.75),
+            "max": scores[-1] if scores else None,
+            "mean": round(sum(scores) / len(scores), 2) if scores else None,
+        },
+        "score_histogram": {f"{b}-{b + 9 if b < 90 else 100}": buckets.get(b, 0) for b in range(0, 100, 10)},
+        "rank_changes": sum(transitions.values()),
+        "rank_transitions": dict(sorted(transitions.items())),
+    }
@@ -1,12 +1,27 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
-import shutil
+import re
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Tuple
+
+from server.services.file_class_service import (
+    MINIFIED_AVG_CHARS,
+    MINIFIED_LINE_CHARS,
+    class_rules,
+    classify_content,
+    classify_enabled,
+    classify_path,
+    read_gitattributes,
+)
+from server.services.git_source_service import GitPath, source_trees, tree_root
+from server.services.worker_pool_service import parallel_map
 
 
 DIFF_CMD = [
@@ -14,52 +29,244 @@ DIFF_CMD = [
     "diff",
     "--unified=3",
     "--no-color",
-    "--find-renames",
-    "--find-copies",
     "--output-indicator-new=+",
     "--output-indicator-old=-",
 ]
+# bump when parsing or the bundle summary changes; stored bundles then stop matching their fingerprint
+PARSER_VERSION = "2"
+
+# Rename/copy detection is chosen per diff (similarity_args). DIFF_RENAME_DETECTION sets the default:
+# auto | copies | renames | none. auto counts added/deleted files with a cheap --no-renames
+# name-status pass first: copies up to DIFF_COPY_MAX_ADDED added files (copy search is quadratic),
+# renames beyond that when files were also deleted, none when nothing can pair up.
+# DIFF_RENAME_LIMIT is passed as -l (git's diff.renameLimit) to every detecting mode.
+SIMILARITY_MODES = ("auto", "copies", "renames", "none")
+DEFAULT_COPY_MAX_ADDED = 200
+DEFAULT_RENAME_LIMIT = 1000
+
+# a user's repository may carry diff config (external drivers, textconv, noprefix) the parser cannot read
+GIT_REPO_DIFF_ARGS = ["--no-ext-diff", "--no-textconv", "--src-prefix=a/", "--dst-prefix=b/"]
 
 MAX_DIFF_BYTES = 2_000_000  # 2 MB cap to avoid huge payloads
 
+# head-context excerpts are references resolved on demand (load_context_excerpts);
+# DIFF_CONTEXT_MODE: hunks (head lines around each hunk, default) | head (start of the file)
+CONTEXT_MODES = ("hunks", "head")
+CONTEXT_LINES = 20
+DEFAULT_CONTEXT_CONCURRENCY = 8
 
-def _init_git_repo_with_tree(repo_dir: str, commit_message: str) -> str:
-    subprocess.run(["git", "init"], cwd=repo_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    subprocess.run(["git", "add", "-A"], cwd=repo_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    subprocess.run(["git", "-c", "user.email=dev@example.com", "-c", "user.name=Dev", "commit", "--allow-empty", "--no-verify", "-m", commit_message], cwd=repo_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=repo_dir).decode().strip()
-    return sha
+# DIFF_COLLAPSE_NONSEMANTIC=0 keeps the text of whitespace- and comment-only hunks
+# whole-line comment syntax by file suffix: (line prefixes, block opener, block closer); a line
+# continuing a block ("* ...") is a comment only while a block opened before it is still open, and
+# trailing comments after code count as code
+_C_COMMENTS = (("//",), "/*", "*/")
+_HASH_COMMENTS = (("#",), "", "")
+_MARKUP_COMMENTS = ((), "<!--", "-->")
+COMMENT_SYNTAX = {
+    **{s: _C_COMMENTS for s in (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".go", ".rs", ".java", ".kt", ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".swift", ".scss", ".css")},
+    **{s: _HASH_COMMENTS for s in (".py", ".sh", ".bash", ".rb", ".yml", ".yaml", ".toml", ".cfg", ".ini", ".r")},
+    **{s: _MARKUP_COMMENTS for s in (".html", ".htm", ".xml", ".svg", ".vue", ".md")},
+}
 
 
-def _parse_unified_diff(patch_text: str) -> Dict[str, Any]:
-    files: List[Dict[str, Any]] = []
-    current: Dict[str, Any] | None = None
+def collapse_enabled() -> bool:
+    return os.environ.get("DIFF_COLLAPSE_NONSEMANTIC", "1").lower() not in ("0", "false", "no")
 
-    for line in patch_text.splitlines():
-        if line.startswith("diff --git "):
-            if current:
-                files.append(current)
-            current = {"path": "", "status": "modified", "old_path": None, "hunks": []}
-        elif line.startswith("rename from ") and current is not None:
+
+def _parse_options() -> Dict[str, Any]:
+    # read in the calling process and shipped with every parse task: pool workers keep the
+    # environment of the pool's first use
+    return {"collapse": collapse_enabled(), "classify": classify_enabled(), "minified": (MINIFIED_LINE_CHARS, MINIFIED_AVG_CHARS)}
+
+
+# indentation is syntax here: only blank lines and whitespace between tokens are insignificant
+INDENT_SIGNIFICANT = (".py", ".yml", ".yaml", ".pug", ".coffee", ".sass")
+# a line break can end a statement here (semicolon insertion, newline-terminated statements), so
+# re-wrapped lines are a change
+NEWLINE_SIGNIFICANT = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".go", ".swift", ".kt", ".rb", ".sh", ".bash", ".r")
+
+# string literals (kept whole, unterminated ones run to the end of the line), words and numbers,
+# then operators longest first so "a - -b" and "a --b" stay apart
+_TOKEN_RE = re.compile(
+    r""""(?:\\.|[^"\\])*"?|'(?:\\.|[^'\\])*'?|`(?:\\.|[^`\\])*`?"""
+    r"|\d[\w.]*|(?:[^\W\d]|\$)[\w$]*"
+    r"|>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|//=|\?\?=|&&=|\|\|="
+    r"|=>|->|\?\.|\?\?|==|!=|<=|>=|&&|\|\||\+\+|--|\+=|-=|\*=|/=|%=|&=|\|=|\^=|\*\*|//|<<|>>|::|:="
+    r"|\S"
+)
+
+
+def _comment_state(stripped: str, syntax: Tuple[Tuple[str, ...], str, str] | None, inside: bool) -> Tuple[bool, bool]:
+    # (is this whole line a comment, is a block comment still open after it)
+    if syntax is None:
+        return False, False
+    prefixes, opener, closer = syntax
+    if not inside:
+        if stripped.startswith(prefixes):
+            return True, False
+        if not opener or not stripped.startswith(opener):
+            return False, False
+        stripped = stripped[len(opener):]
+    if closer not in stripped:
+        return True, True
+    return not stripped.split(closer, 1)[1].strip(), False
+
+
+def _side_lines(text: str, mark: str, syntax: Tuple[Tuple[str, ...], str, str] | None) -> List[Tuple[str, bool]]:
+    # (line, whole-line comment) of one side's changed lines; context lines advance the block state
+    out: List[Tuple[str, bool]] = []
+    inside = False
+    for raw in text.splitlines():
+        if not raw or raw[0] not in (" ", mark):
+            continue  # the other side or "\ No newline at end of file"
+        comment, inside = _comment_state(raw[1:].strip(), syntax, inside)
+        if raw[0] == mark:
+            out.append((raw[1:], comment))
+    return out
+
+
+def _token_lines(lines: List[Tuple[str, bool]], skip_comments: bool, indent: bool, newline: bool) -> List[Any]:
+    # a side's changed lines as tokens: one flat sequence where line breaks mean nothing, else one
+    # entry per non-blank line, led by its indentation width where that is syntax
+    out: List[Any] = []
+    for line, comment in lines:
+        if skip_comments and comment:
+            continue
+        tokens = _TOKEN_RE.findall(line)
+        if not tokens:
+            continue
+        if indent:
+            expanded = line.expandtabs()
+            out.append((len(expanded) - len(expanded.lstrip()), tokens))
+        elif newline:
+            out.append(tokens)
+        else:
+            out.extend(tokens)
+    return out
+
+
+def classify_hunk(text: str, path: str) -> str:
+    """Class of one hunk: "whitespace" when the removed and added lines hold the same token sequence
+    (whitespace between tokens, blank lines and line endings aside; line breaks also count in
+    NEWLINE_SIGNIFICANT files and indentation in INDENT_SIGNIFICANT ones), "comment" when they also
+    differ in whole-line comments, else "semantic".
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    indent = suffix in INDENT_SIGNIFICANT
+    newline = suffix in NEWLINE_SIGNIFICANT
+    syntax = COMMENT_SYNTAX.get(suffix)
+    removed, added = _side_lines(text, "-", syntax), _side_lines(text, "+", syntax)
+    if _token_lines(removed, False, indent, newline) == _token_lines(added, False, indent, newline):
+        return "whitespace"
+    if syntax is not None and _token_lines(removed, True, indent, newline) == _token_lines(added, True, indent, newline):
+        return "comment"
+    return "semantic"
+
+
+def _collapse_nonsemantic(current: Dict[str, Any]) -> None:
+    # replace whitespace/comment-only hunk text with line counts; mark files with no semantic hunk
+    classes = []
+    for h in current["hunks"]:
+        cls = classify_hunk(h["text"], current["path"])
+        classes.append(cls)
+        if cls != "semantic":
+            lines = h["text"].splitlines()
+            h["collapsed"] = {
+                "class": cls,
+                "added": sum(1 for line in lines if line.startswith("+")),
+                "removed": sum(1 for line in lines if line.startswith("-")),
+            }
+            h["text"] = ""
+    if classes and "semantic" not in classes:
+        current["change_class"] = "comment" if "comment" in classes else "whitespace"
+
+
+def _header_path(header: str) -> str:
+    # "diff --git a/old b/new" -> new; binary files have no ---/+++ lines to take it from
+    return header.rsplit(" b/", 1)[-1].strip() if " b/" in header else ""
+
+
+def similarity_setting(requested: str | None = None) -> str:
+    mode = requested or os.environ.get("DIFF_RENAME_DETECTION", "auto")
+    return mode if mode in SIMILARITY_MODES else "auto"
+
+
+def _count_added_deleted(repo_dir: str, base_sha: str, head_sha: str) -> Tuple[int, int]:
+    raw = subprocess.check_output(["git", "diff", "--name-status", "--no-renames", "-z", base_sha, head_sha], cwd=repo_dir)
+    fields = raw.decode("utf-8", errors="ignore").split("\0")
+    statuses = fields[0::2]  # -z output alternates status and path
+    return statuses.count("A"), statuses.count("D")
+
+
+def similarity_args(repo_dir: str, base_sha: str, head_sha: str, requested: str | None = None) -> Tuple[List[str], Dict[str, Any]]:
+    """(git diff arguments, record for the bundle's "similarity") of the rename/copy detection for
+    one diff; see DIFF_RENAME_DETECTION.
+    """
+    requested = similarity_setting(requested)
+    limit = int(os.environ.get("DIFF_RENAME_LIMIT", str(DEFAULT_RENAME_LIMIT)) or DEFAULT_RENAME_LIMIT)
+    record: Dict[str, Any] = {"requested": requested}
+    mode = requested
+    if requested == "auto":
+        added, deleted = _count_added_deleted(repo_dir, base_sha, head_sha)
+        copy_max = int(os.environ.get("DIFF_COPY_MAX_ADDED", str(DEFAULT_COPY_MAX_ADDED)) or DEFAULT_COPY_MAX_ADDED)
+        if added == 0:
+            mode = "none"
+        elif added <= copy_max:
+            mode = "copies"
+        elif deleted:
+            mode = "renames"
+        else:
+            mode = "none"
+        record.update({"added": added, "deleted": deleted})
+    record["mode"] = mode
+    if mode == "none":
+        return ["--no-renames"], record
+    record["limit"] = limit
+    args = ["--find-renames", f"-l{limit}"]
+    if mode == "copies":
+        args.insert(1, "--find-copies")
+    return args, record
+
+
+def _parse_file_chunk(task: Tuple[List[str], Dict[str, Any], Tuple[str, str] | None]) -> Dict[str, Any]:
+    # one file's section of a unified diff, starting at its "diff --git " line; a file already
+    # classified by path arrives as its header lines only. options come from _parse_options
+    lines, options, file_class = task
+    current: Dict[str, Any] = {"path": "", "status": "modified", "old_path": None, "hunks": []}
+    binary = False
+
+    for line in lines[1:]:
+        if line.startswith("new file mode"):
+            current["status"] = "added"
+        elif line.startswith("deleted file mode"):
+            current["status"] = "removed"
+        elif line.startswith("Binary files "):
+            binary = True
+        elif line.startswith("rename from "):
             current["status"] = "renamed"
             current["old_path"] = line[len("rename from "):].strip()
-        elif line.startswith("rename to ") and current is not None:
+        elif line.startswith("rename to "):
             current["path"] = line[len("rename to "):].strip()
-        elif line.startswith("+++ b/") and current is not None:
+        elif line.startswith("copy from "):
+            current["status"] = "copied"
+            current["old_path"] = line[len("copy from "):].strip()
+        elif line.startswith("copy to "):
+            current["path"] = line[len("copy to "):].strip()
+        elif line.startswith("+++ b/"):
             # new path
             path = line[len("+++ b/"):].strip()
             if path == "/dev/null":
                 current["status"] = "removed"
             else:
                 current["path"] = path
-        elif line.startswith("--- a/") and current is not None:
+        elif line.startswith("--- a/"):
             old_path = line[len("--- a/"):].strip()
             if old_path == "/dev/null":
                 current["status"] = "added"
             else:
-                if current["status"] != "renamed":
+                if current["status"] not in ("renamed", "copied"):
                     current["old_path"] = old_path
-        elif line.startswith("@@ ") and current is not None:
+        elif line.startswith("@@ "):
             # hunk header
             meta = line.strip()
             # attempt to extract ranges
@@ -81,88 +288,340 @@ def _parse_unified_diff(patch_text: str) -> Dict[str, Any]:
                 hunk = {"meta": meta, "old_start": 0, "old_lines": 0, "new_start": 0, "new_lines": 0, "text": ""}
             current["hunks"].append(hunk)
         else:
-            if current and current.get("hunks"):
+            if current.get("hunks"):
                 # append diff lines to last hunk text
                 current["hunks"][-1]["text"] += line + "\n"
+    if not current["path"]:
+        current["path"] = _header_path(lines[0])
+        if current["status"] == "removed":
+            current["old_path"] = current["path"]
+    if file_class is None and options["classify"]:
+        by_content = classify_content(current["path"], current["hunks"], binary, options["minified"])
+        if by_content is not None:
+            file_class = by_content[:2]
+            current["classified_reason"] = by_content[2]
+    if file_class is not None:
+        # routed past hunk-level stages: name, status and size only
+        current["hunks"] = []
+        current["classified"], current["classified_by"] = file_class
+    elif options["collapse"]:
+        _collapse_nonsemantic(current)
+    return current
+
+
+def _split_file_chunks(patch_text: str) -> List[List[str]]:
+    # one line list per file, split at the "diff --git " headers
+    chunks: List[List[str]] = []
+    for line in patch_text.splitlines():
+        if line.startswith("diff --git "):
+            chunks.append([line])
+        elif chunks:
+            chunks[-1].append(line)
+    return chunks
+
+
+def _classify_chunks(chunks: List[List[str]], head_dir: str | GitPath | None) -> List[Tuple[str, str] | None]:
+    """Path class of each file chunk (rules + head .gitattributes); classified chunks are cut to
+    their header lines in place, so their hunks never reach the byte cap, the parser or later stages.
+    """
+    if not classify_enabled():
+        return [None] * len(chunks)
+    rules = class_rules()
+    attributes = read_gitattributes(head_dir)
+    classes: List[Tuple[str, str] | None] = []
+    for chunk in chunks:
+        file_class = classify_path(_header_path(chunk[0]), rules, attributes)
+        if file_class is not None:
+            cut = next((i for i, line in enumerate(chunk) if line.startswith("@@ ")), len(chunk))
+            del chunk[cut:]
+        classes.append(file_class)
+    return classes
+
+
+def _parse_chunks(chunks: List[List[str]], classes: List[Tuple[str, str] | None]) -> Dict[str, Any]:
+    # files parse independently, so large patches fan out over the worker pool
+    options = _parse_options()
+    collapse = options["collapse"]
+    files: List[Dict[str, Any]] = parallel_map(_parse_file_chunk, [(c, options, cls) for c, cls in zip(chunks, classes)])
 
-    if current:
-        files.append(current)
     # compute summary
-    insertions = sum(h["text"].count("\n+") for f in files for h in f["hunks"])
-    deletions = sum(h["text"].count("\n-") for f in files for h in f["hunks"])
+    # counted per line: a hunk's first line has no "\n" before it
+    lines = [line for f in files for h in f["hunks"] for line in h["text"].splitlines()]
+    insertions = sum(1 for line in lines if line.startswith("+")) + sum(h.get("collapsed", {}).get("added", 0) for f in files for h in f["hunks"])
+    deletions = sum(1 for line in lines if line.startswith("-")) + sum(h.get("collapsed", {}).get("removed", 0) for f in files for h in f["hunks"])
     summary = {"files_changed": len(files), "insertions": insertions, "deletions": deletions}
-    return {"schema_version": "1.0", "base": "local", "head": "local", "summary": summary, "files": files}
+    collapsed = [h["collapsed"]["class"] for f in files for h in f["hunks"] if "collapsed" in h]
+    normalization = {
+        "collapse": collapse,
+        "whitespace_hunks": collapsed.count("whitespace"),
+        "comment_hunks": collapsed.count("comment"),
+        "format_only_files": sum(1 for f in files if f.get("change_class")),
+        "classified_files": sum(1 for f in files if f.get("classified")),
+    }
+    return {"schema_version": "1.0", "base": "local", "head": "local", "summary": summary, "normalization": normalization, "files": files}
+
+
+def _diff_commits(repo_dir: str, base_sha: str, head_sha: str, extra_args: List[str] | None = None, head_dir: str | GitPath | None = None, similarity: str | None = None) -> Tuple[Dict[str, Any], bool]:
+    """Parsed diff between two commits of repo_dir; the flag is False when the patch exceeded
+    MAX_DIFF_BYTES and only the file list was kept (no hunks, each file marked "truncated"). Files
+    classified by path (see file_class_service; head_dir supplies .gitattributes) do not count
+    towards the cap. The bundle's "similarity" records the rename/copy detection used (similarity_args).
+    """
+    sim_args, sim_record = similarity_args(repo_dir, base_sha, head_sha, similarity)
+    cmd = DIFF_CMD + sim_args + (extra_args or []) + [base_sha, head_sha]
+    raw = subprocess.check_output(cmd, cwd=repo_dir)
+    chunks = _split_file_chunks(raw.decode(errors="ignore"))
+    classes = _classify_chunks(chunks, head_dir)
+    if sum(len(line) + 1 for chunk in chunks for line in chunk) > MAX_DIFF_BYTES:
+        # too big; return summary only with file list, no hunks
+        parsed = _parse_chunks([], [])
+        # Construct minimal file list by git name-status
+        name_status = subprocess.check_output(["git", "diff", "--name-status", *sim_args, base_sha, head_sha], cwd=repo_dir).decode("utf-8", errors="ignore")
+        files = []
+        for line in name_status.splitlines():
+            if not line:
+                continue
+            parts = line.split("\t")
+            status = parts[0]
+            if status.startswith("R") and len(parts) >= 3:
+                files.append({"path": parts[2], "status": "renamed", "old_path": parts[1], "hunks": [], "truncated": True})
+            elif status.startswith("C") and len(parts) >= 3:
+                files.append({"path": parts[2], "status": "copied", "old_path": parts[1], "hunks": [], "truncated": True})
+            elif status == "A" and len(parts) >= 2:
+                files.append({"path": parts[1], "status": "added", "old_path": None, "hunks": [], "truncated": True})
+            elif status == "D" and len(parts) >= 2:
+                files.append({"path": parts[1], "status": "removed", "old_path": parts[1], "hunks": [], "truncated": True})
+            elif len(parts) >= 2:
+                files.append({"path": parts[1], "status": "modified", "old_path": parts[1], "hunks": [], "truncated": True})
+        rules, attributes = class_rules(), read_gitattributes(head_dir)
+        for f in files:
+            file_class = classify_path(f["path"], rules, attributes) if classify_enabled() else None
+            if file_class is not None:
+                f["classified"], f["classified_by"] = file_class
+        parsed["files"] = files
+        parsed["summary"]["files_changed"] = len(files)
+        parsed["similarity"] = sim_record
+        _attach_classified_sizes(parsed, head_dir)
+        return parsed, False
+    parsed = _parse_chunks(chunks, classes)
+    parsed["similarity"] = sim_record
+    _attach_classified_sizes(parsed, head_dir)
+    return parsed, True
 
 
-def compute_local_diff(base_dir: str, head_dir: str, include_context: bool = True, context_bytes: int = 8000) -> Dict[str, Any]:
-    # create temp repo; commit base, then replace with head, commit; run git diff between commits
+def _attach_classified_sizes(diff_bundle: Dict[str, Any], head_dir: str | GitPath | None) -> None:
+    # classified files keep name, status and head size in place of hunks and context
+    if head_dir is None:
+        return
+    root = tree_root(head_dir)
+    for f in diff_bundle.get("files", []):
+        if not f.get("classified") or f.get("status") == "removed":
+            continue
+        try:
+            f["size"] = (root / f["path"]).stat().st_size
+        except OSError:
+            pass
+
+
+def _snapshot_tree(git_dir: str, work_tree: str, index_file: str) -> str:
+    # hash a directory as it is on disk into git_dir's object store; a private index per snapshot
+    # lets several heads be written against one repository at the same time
+    work_tree = os.path.abspath(work_tree)
+    env = {**os.environ, "GIT_INDEX_FILE": index_file}
+    git = ["git", f"--git-dir={git_dir}", f"--work-tree={work_tree}"]
+    subprocess.run(git + ["add", "-A"], cwd=work_tree, env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return subprocess.check_output(git + ["write-tree"], cwd=work_tree, env=env).decode().strip()
+
+
+@contextmanager
+def base_snapshot(base_dir: str) -> Iterator[Dict[str, Any]]:
+    """Hash base_dir into a throwaway repository once; heads are then diffed against it with
+    compute_snapshot_diff (thread-safe), so N heads share one base pass.
+    """
     with tempfile.TemporaryDirectory() as tmp:
-        repo = Path(tmp) / "repo"
-        repo.mkdir(parents=True, exist_ok=True)
-        # copy base
-        shutil.copytree(base_dir, repo, dirs_exist_ok=True)
-        base_sha = _init_git_repo_with_tree(str(repo), "base")
-
-        # replace with head snapshot (preserve .git)
-        for child in repo.iterdir():
-            if child.name == ".git":
+        git_dir = str(Path(tmp) / "repo.git")
+        subprocess.run(["git", "init", "--bare", "-q", git_dir], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        base_tree = _snapshot_tree(git_dir, base_dir, str(Path(tmp) / "base.index"))
+        yield {"git_dir": git_dir, "tmp": tmp, "base_dir": base_dir, "base_tree": base_tree}
+
+
+def compute_snapshot_diff(snapshot: Dict[str, Any], head_dir: str, include_context: bool = True, context_bytes: int = 8000, similarity: str | None = None) -> Dict[str, Any]:
+    fd, index_file = tempfile.mkstemp(prefix="head.", suffix=".index", dir=snapshot["tmp"])
+    os.close(fd)
+    os.unlink(index_file)  # git wants to create the index itself
+    try:
+        head_tree = _snapshot_tree(snapshot["git_dir"], head_dir, index_file)
+    finally:
+        if os.path.exists(index_file):
+            os.unlink(index_file)
+    parsed, complete = _diff_commits(snapshot["git_dir"], snapshot["base_tree"], head_tree, head_dir=head_dir, similarity=similarity)
+    if include_context and complete:
+        attach_head_context(parsed, context_bytes=context_bytes)
+    return parsed
+
+
+def compute_local_diff(base_dir: str, head_dir: str, include_context: bool = True, context_bytes: int = 8000, similarity: str | None = None) -> Dict[str, Any]:
+    # snapshot both trees into a temp repo (no copies); run git diff between the two trees
+    with base_snapshot(base_dir) as snapshot:
+        return compute_snapshot_diff(snapshot, head_dir, include_context=include_context, context_bytes=context_bytes, similarity=similarity)
+
+
+def compute_git_diff(source: Dict[str, Any], include_context: bool = True, context_bytes: int = 8000, similarity: str | None = None) -> Dict[str, Any]:
+    """Diff two commits of an existing repository (git_source_service.git_source); no checkout or tree copy.
+    Head excerpts, when loaded, are read through the repository's persistent cat-file reader.
+    """
+    head_tree = source_trees(source)[1]
+    parsed, complete = _diff_commits(source["repo_git_dir"], source["base_commit"], source["head_commit"], GIT_REPO_DIFF_ARGS, head_dir=head_tree, similarity=similarity)
+    parsed["base"] = source["base_commit"]
+    parsed["head"] = source["head_commit"]
+    if include_context and complete:
+        attach_head_context(parsed, context_bytes=context_bytes)
+    return parsed
+
+
+def context_mode() -> str:
+    mode = os.environ.get("DIFF_CONTEXT_MODE", "hunks")
+    return mode if mode in CONTEXT_MODES else "hunks"
+
+
+def attach_head_context(diff_bundle: Dict[str, Any], context_bytes: int = 8000, mode: str | None = None) -> Dict[str, Any]:
+    """Record lazy head-context references: the bundle's "context" options and a "context_ref" on
+    every changed file with a head side. Nothing is read here; load_context_excerpts resolves them.
+    Classified files (generated, vendored, binary, lockfiles) get none.
+    """
+    diff_bundle["context"] = {"mode": mode or context_mode(), "bytes": context_bytes, "lines": CONTEXT_LINES}
+    for f in diff_bundle.get("files", []):
+        f.pop("context", None)  # eager excerpts of bundles stored before references
+        if f.get("classified") or f.get("status") == "removed" or not f.get("path"):
+            continue
+        f["context_ref"] = {"where": "head", "path": f["path"]}
+    return diff_bundle
+
+
+def _read_head(p: Path | GitPath, limit: int | None = None) -> bytes:
+    if isinstance(p, GitPath):
+        data = p.read_bytes()
+        return data if limit is None else data[:limit]
+    with open(p, "rb") as fh:
+        return fh.read() if limit is None else fh.read(limit)
+
+
+def _hunk_windows(hunks: List[Dict[str, Any]], context_lines: int) -> List[Tuple[int, int]]:
+    # merged 1-based head line ranges: each hunk's new side widened by context_lines
+    windows: List[Tuple[int, int]] = []
+    for h in sorted(hunks, key=lambda h: h.get("new_start") or 0):
+        start = max(1, (h.get("new_start") or 1) - context_lines)
+        end = (h.get("new_start") or 1) + max(0, (h.get("new_lines") or 0) - 1) + context_lines
+        if windows and start <= windows[-1][1] + 1:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def _load_excerpt(root: Any, f: Dict[str, Any], mode: str, context_bytes: int, context_lines: int) -> str:
+    p = root / f["context_ref"]["path"]
+    if mode == "head" or not f.get("hunks"):
+        return _read_head(p, context_bytes).decode("utf-8", errors="ignore")
+    lines = _read_head(p).decode("utf-8", errors="ignore").splitlines()
+    parts: List[str] = []
+    size = 0
+    for start, end in _hunk_windows(f["hunks"], context_lines):
+        chunk = f"@@ head lines {start}-{min(end, len(lines))}\n" + "".join(line + "\n" for line in lines[start - 1:end])
+        if size + len(chunk) > context_bytes:
+            parts.append(chunk[:max(0, context_bytes - size)])
+            break
+        parts.append(chunk)
+        size += len(chunk)
+    return "".join(parts)
+
+
+def load_context_excerpts(
+    diff_bundle: Dict[str, Any],
+    head_dir: str | GitPath,
+    paths: List[str] | None = None,
+    mode: str | None = None,
+    context_bytes: int | None = None,
+    context_lines: int | None = None,
+    max_workers: int | None = None,
+) -> Dict[str, str]:
+    """Resolve context_ref entries (all, or those of paths) to {path: excerpt} on a bounded thread
+    pool (DIFF_CONTEXT_CONCURRENCY). "head" mode returns the first context_bytes of the head file;
+    "hunks" returns the head lines around each hunk, capped at context_bytes. Options default to the
+    bundle's "context" record; unreadable files map to "".
+    """
+    opts = diff_bundle.get("context") or {}
+    mode = mode or opts.get("mode") or context_mode()
+    context_bytes = context_bytes or opts.get("bytes") or 8000
+    context_lines = CONTEXT_LINES if context_lines is None else context_lines
+    wanted = set(paths) if paths is not None else None
+    files = [f for f in diff_bundle.get("files", []) if f.get("context_ref") and (wanted is None or f.get("path") in wanted)]
+    if not files:
+        return {}
+    root = tree_root(head_dir)
+    workers = max(1, min(len(files), max_workers or int(os.environ.get("DIFF_CONTEXT_CONCURRENCY", str(DEFAULT_CONTEXT_CONCURRENCY)))))
+
+    def load(f: Dict[str, Any]) -> str:
+        try:
+            return _load_excerpt(root, f, mode, context_bytes, context_lines)
+        except (OSError, ValueError):
+            return ""
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip((f["path"] for f in files), pool.map(load, files)))
+
+
+def _tree_stat_entries(root_dir: str) -> List[List[Any]]:
+    root = Path(root_dir)
+    entries: List[List[Any]] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != ".git")
+        for name in sorted(filenames):
+            p = Path(dirpath) / name
+            try:
+                st = p.stat()
+            except OSError:
                 continue
-            if child.is_file():
-                child.unlink()
-            else:
-                shutil.rmtree(child)
-        # copy head snapshot excluding .git
-        def _ignore_git(dirpath, names):
-            ignored = []
-            if ".git" in names:
-                ignored.append(".git")
-            return ignored
-
-        shutil.copytree(head_dir, repo, dirs_exist_ok=True, ignore=_ignore_git)
-        subprocess.run(["git", "add", "-A"], cwd=str(repo), check=True)
-        subprocess.run(["git", "commit", "-m", "head"], cwd=str(repo), check=True)
-        head_sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=str(repo)).decode().strip()
-
-        cmd = DIFF_CMD + [base_sha, head_sha]
-        raw = subprocess.check_output(cmd, cwd=str(repo))
-        if len(raw) > MAX_DIFF_BYTES:
-            # too big; return summary only with file list, no hunks
-            parsed = _parse_unified_diff(raw[:0].decode("utf-8", errors="ignore"))
-            # Construct minimal file list by git name-status
-            name_status = subprocess.check_output(["git", "diff", "--name-status", base_sha, head_sha], cwd=str(repo)).decode("utf-8", errors="ignore")
-            files = []
-            for line in name_status.splitlines():
-                if not line:
-                    continue
-                parts = line.split("\t")
-                status = parts[0]
-                if status.startswith("R") and len(parts) >= 3:
-                    files.append({"path": parts[2], "status": "renamed", "old_path": parts[1], "hunks": []})
-                elif status == "A" and len(parts) >= 2:
-                    files.append({"path": parts[1], "status": "added", "old_path": None, "hunks": []})
-                elif status == "D" and len(parts) >= 2:
-                    files.append({"path": parts[1], "status": "removed", "old_path": parts[1], "hunks": []})
-                elif len(parts) >= 2:
-                    files.append({"path": parts[1], "status": "modified", "old_path": parts[1], "hunks": []})
-            parsed["files"] = files
-            parsed["summary"]["files_changed"] = len(files)
-            return parsed
-        patch = raw.decode(errors="ignore")
-        parsed = _parse_unified_diff(patch)
-        if include_context:
-            # attach head file excerpts for changed files
-            for f in parsed.get("files", []):
-                p = Path(head_dir) / f.get("path", "")
-                try:
-                    if p.exists() and p.is_file():
-                        data = p.read_bytes()[:context_bytes]
-                        try:
-                            text = data.decode("utf-8", errors="ignore")
-                        except Exception:
-                            text = ""
-                        f["context"] = text
-                except Exception:
-                    f["context"] = ""
-        return parsed
+            entries.append([p.relative_to(root).as_posix(), st.st_size, st.st_mtime_ns])
+    return entries
+
+
+def _diff_options(similarity: str | None) -> Dict[str, Any]:
+    # settings besides DIFF_CMD that shape a bundle
+    return {
+        "parser": PARSER_VERSION,
+        "collapse": [INDENT_SIGNIFICANT, NEWLINE_SIGNIFICANT] if collapse_enabled() else None,
+        "classify": [class_rules(), MINIFIED_LINE_CHARS, MINIFIED_AVG_CHARS] if classify_enabled() else None,
+        "similarity": [
+            similarity_setting(similarity),
+            os.environ.get("DIFF_RENAME_LIMIT", str(DEFAULT_RENAME_LIMIT)),
+            os.environ.get("DIFF_COPY_MAX_ADDED", str(DEFAULT_COPY_MAX_ADDED)),
+        ],
+    }
+
+
+def snapshot_fingerprint(base_dir: str, head_dir: str, extra: Dict[str, Any] | None = None, similarity: str | None = None) -> str:
+    """Cheap identity of a base/head snapshot pair: relative path, size and mtime of every file
+    (excluding .git) on both sides, plus the diff options that shaped the bundle (hunk collapsing,
+    file classes, rename/copy detection).
+    """
+    doc = {
+        "base": _tree_stat_entries(base_dir),
+        "head": _tree_stat_entries(head_dir),
+        "diff_cmd": DIFF_CMD,
+        **_diff_options(similarity),
+        "extra": extra or {},
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode("utf-8")).hexdigest()
 
 
+def commit_fingerprint(source: Dict[str, Any], extra: Dict[str, Any] | None = None, similarity: str | None = None) -> str:
+    """Identity of a git-ref input: commit ids are content hashes already, so no tree walk is needed."""
+    doc = {
+        "base_commit": source["base_commit"],
+        "head_commit": source["head_commit"],
+        "diff_cmd": DIFF_CMD + GIT_REPO_DIFF_ARGS,
+        **_diff_options(similarity),
+        "extra": extra or {},
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode("utf-8")).hexdigest()
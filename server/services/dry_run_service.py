@@ -3,6 +3,9 @@ from __future__ import annotations
 import re
 from typing import Dict, Any, List, Tuple, Set
 
+from server.services.symbol_map_service import importer_index, importers_of
+from server.services.worker_pool_service import parallel_map
+
 
 CODE_GLOBS = (
     ".ts",
@@ -57,12 +60,15 @@ def _is_config_file(path: str) -> bool:
 
 
 def _count_hunk_lines(hunks: List[Dict[str, Any]]) -> Tuple[int, int]:
+    # same totals as the diff bundle summary: hunk text holds no file headers, and a collapsed
+    # (whitespace/comment-only) hunk keeps only its line counts
     added = 0
     removed = 0
     for h in hunks or []:
+        collapsed = h.get("collapsed") or {}
+        added += collapsed.get("added", 0)
+        removed += collapsed.get("removed", 0)
         for line in (h.get("text") or "").splitlines():
-            if line.startswith("+++") or line.startswith("---"):
-                continue
             if line.startswith("+"):
                 added += 1
             elif line.startswith("-"):
@@ -158,13 +164,9 @@ def _extract_calls_from_hunks(hunks: List[Dict[str, Any]]) -> Tuple[Dict[str, in
 def _compute_semantic_deltas(diff_bundle: Dict[str, Any]) -> Dict[str, Any]:
     total_added: Dict[str, int] = {}
     total_removed: Dict[str, int] = {}
-    for f in diff_bundle.get("files", []):
-        # only analyze code files for semantics
-        path = f.get("path") or ""
-        if not _is_code_file(path):
-            continue
-        hunks = f.get("hunks", [])
-        a, r = _extract_calls_from_hunks(hunks)
+    # only analyze code files for semantics; per-file call scans run on the worker pool, merged in file order
+    code_hunks = [f.get("hunks", []) for f in diff_bundle.get("files", []) if _is_code_file(f.get("path") or "")]
+    for a, r in parallel_map(_extract_calls_from_hunks, code_hunks):
         for k, v in a.items():
             total_added[k] = total_added.get(k, 0) + v
         for k, v in r.items():
@@ -186,7 +188,32 @@ def _compute_semantic_deltas(diff_bundle: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def static_dry_run(api_surface: Dict[str, Any], deps: Dict[str, Any], diff_bundle: Dict[str, Any]) -> Dict[str, Any]:
+def static_dry_run(api_surface: Dict[str, Any], deps: Dict[str, Any], diff_bundle: Dict[str, Any], ast_deltas: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """Deterministic PR facts. First-hop callers of a file listed in ast_deltas.exported_changes are
+    only the files importing one of its touched exports; other changed files count every importer.
+    """
+    return _dry_run_facts(importer_index(deps), diff_bundle, ast_deltas)
+
+
+def directory_summaries(ticket: Dict[str, Any], deps: Dict[str, Any], diff_bundle: Dict[str, Any], ast_deltas: Dict[str, Any] | None, rel_dirs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """{rel_dir: {"feature_summary", "dry_run"}} over the directory's own changed files only: their
+    counts, callers and semantic deltas. A directory's prompts read this slice rather than the
+    run-wide summaries, so an edit elsewhere in the PR leaves them (and their memo key) unchanged.
+    """
+    by_dir: Dict[str, List[Dict[str, Any]]] = {}
+    for f in diff_bundle.get("files", []):
+        path = f.get("path") or ""
+        if path:
+            by_dir.setdefault(path.rsplit("/", 1)[0] if "/" in path else "", []).append(f)
+    index = importer_index(deps)
+    out: Dict[str, Dict[str, Any]] = {}
+    for rel in rel_dirs:
+        scoped = {"files": by_dir.get(rel, [])}
+        out[rel] = {"feature_summary": build_feature_summary(ticket, scoped), "dry_run": _dry_run_facts(index, scoped, ast_deltas)}
+    return out
+
+
+def _dry_run_facts(index: Dict[str, Dict[str, Set[str]]], diff_bundle: Dict[str, Any], ast_deltas: Dict[str, Any] | None) -> Dict[str, Any]:
     changed_files = [f.get("path") for f in diff_bundle.get("files", []) if f.get("path")]
     symbols_added: List[str] = []
     symbols_removed: List[str] = []
@@ -208,16 +235,20 @@ def static_dry_run(api_surface: Dict[str, Any], deps: Dict[str, Any], diff_bundl
                     if m:
                         symbols_removed.append(f"{path}#${m.group(1)}")
 
-    # reverse deps: who depends on changed files (2-hop with caps)
-    rev: Dict[str, List[str]] = {}
-    for e in deps.get("edges", []):
-        rev.setdefault(e.get("to"), []).append(e.get("from"))
+    # reverse deps: who depends on changed files (2-hop with caps); the first hop is per symbol where
+    # the touched exports are known, the second is file-level (which of a caller's exports use them is unknown)
+    narrowed = (ast_deltas or {}).get("exported_changes") or {}
     first_hop: Set[str] = set()
+    callers_by_symbol: Dict[str, List[str]] = {}
     for p in changed_files:
-        first_hop.update(rev.get(p, []))
+        first_hop |= importers_of(index, p, narrowed.get(p))
+        for name in narrowed.get(p, []):
+            found = importers_of(index, p, [name])
+            if found:
+                callers_by_symbol[f"{p}#${name}"] = sorted(found)[:50]
     second_hop: Set[str] = set()
     for n in list(first_hop)[:200]:
-        second_hop.update(rev.get(n, []))
+        second_hop |= importers_of(index, n)
     callers = sorted(set(list(first_hop)[:200] + list(second_hop)[:200]))
     hop_truncated = len(first_hop) > 200 or len(second_hop) > 200
 
@@ -277,6 +308,7 @@ def static_dry_run(api_surface: Dict[str, Any], deps: Dict[str, Any], diff_bundl
         "signature_deltas": sorted(set(signature_changes)),
         "callers": callers,
         "callers_2hop_truncated": hop_truncated,
+        "callers_by_symbol": callers_by_symbol,
         "config_drift": [],
         "semantic_deltas": semantic,
         "dep_drift": dep_drift,
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import os
+import posixpath
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from server.services.dry_run_service import CODE_GLOBS
+from server.services.git_source_service import GitPath, tree_root
+
+
+# FILE_CLASSIFY=0 turns the classifier off; FILE_CLASS_RULES names a JSON file whose
+# {"lockfile"|"generated"|"vendored"|"binary": [globs]} lists extend the defaults below
+CLASSES = ("binary", "lockfile", "vendored", "generated")
+
+LOCKFILES = {"package-lock.json", "pnpm-lock.yaml", "yarn.lock", "poetry.lock", "Pipfile.lock", "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock"}
+
+DEFAULT_RULES: Dict[str, List[str]] = {
+    "lockfile": sorted(LOCKFILES),
+    "generated": [
+        "dist/*", "*/dist/*", "*.min.js", "*.min.css", "*.js.map", "*.css.map",
+        "*.snap", "*/__snapshots__/*", "*_pb2.py", "*.pb.go", "*.generated.*",
+    ],
+    "vendored": ["vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "third_party/*", "*/third_party/*"],
+    "binary": [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.webp", "*.pdf", "*.zip", "*.gz", "*.tgz", "*.jar",
+        "*.woff", "*.woff2", "*.ttf", "*.eot", "*.otf", "*.mp3", "*.mp4", "*.so", "*.dylib", "*.dll", "*.exe",
+        "*.class", "*.pyc",
+    ],
+}
+
+# added lines this long only come out of bundlers and minifiers; one such line is not enough, the
+# file's added lines have to be mostly that long or average MINIFIED_AVG_CHARS
+MINIFIED_LINE_CHARS = 1000
+MINIFIED_AVG_CHARS = 500
+
+# .gitattributes attribute -> class; "binary" is git's macro for -diff -merge -text
+_ATTR_CLASSES = {"linguist-generated": "generated", "linguist-vendored": "vendored", "binary": "binary"}
+
+
+def classify_enabled() -> bool:
+    return os.environ.get("FILE_CLASSIFY", "1").lower() not in ("0", "false", "no")
+
+
+def class_rules() -> Dict[str, List[str]]:
+    """Default globs per class plus those from the FILE_CLASS_RULES JSON file (if set and readable)."""
+    rules = {cls: list(globs) for cls, globs in DEFAULT_RULES.items()}
+    path = os.environ.get("FILE_CLASS_RULES")
+    if path:
+        try:
+            extra = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            extra = {}
+        for cls in CLASSES:
+            globs = extra.get(cls) if isinstance(extra, dict) else None
+            if isinstance(globs, list):
+                rules[cls].extend(g for g in globs if isinstance(g, str))
+    return rules
+
+
+def _glob_match(path: str, pattern: str) -> bool:
+    # a pattern without "/" matches the file name at any depth, like .gitignore/.gitattributes
+    if "/" not in pattern:
+        return fnmatchcase(posixpath.basename(path), pattern)
+    return fnmatchcase(path, pattern.lstrip("/"))
+
+
+def read_gitattributes(head_dir: str | GitPath | None) -> List[Tuple[str, Dict[str, bool]]]:
+    """(pattern, {attribute: set/unset}) lines of the head tree's top-level .gitattributes that
+    touch a classifying attribute; later lines win, as in git.
+    """
+    if head_dir is None:
+        return []
+    try:
+        text = (tree_root(head_dir) / ".gitattributes").read_text(encoding="utf-8", errors="ignore")
+    except (OSError, ValueError):
+        return []
+    out: List[Tuple[str, Dict[str, bool]]] = []
+    for raw in text.splitlines():
+        parts = raw.split()
+        if not parts or parts[0].startswith("#"):
+            continue
+        attrs: Dict[str, bool] = {}
+        for token in parts[1:]:
+            if token.startswith("!"):
+                continue  # back to unspecified: the default globs decide
+            unset = token.startswith("-")
+            name, _, value = token.lstrip("-").partition("=")
+            if name == "diff":
+                # -diff marks content git will not diff as text; diff or diff=driver says nothing
+                if unset:
+                    attrs["binary"] = True
+            elif name in _ATTR_CLASSES:
+                attrs[name] = not unset and value.lower() not in ("false", "0")
+        if attrs:
+            out.append((parts[0], attrs))
+    return out
+
+
+def classify_path(path: str, rules: Dict[str, List[str]], attributes: List[Tuple[str, Dict[str, bool]]]) -> Tuple[str, str] | None:
+    """(class, source) of a changed path, source being "gitattributes" or "rule"; None for source files.
+    An attribute set to false in .gitattributes overrides the default globs of its class.
+    """
+    state: Dict[str, bool] = {}
+    for pattern, attrs in attributes:
+        if _glob_match(path, pattern):
+            for name, value in attrs.items():
+                state[_ATTR_CLASSES[name]] = value
+    for cls in CLASSES:
+        if state.get(cls):
+            return cls, "gitattributes"
+    for cls in CLASSES:
+        if state.get(cls) is False:
+            continue
+        if any(_glob_match(path, g) for g in rules.get(cls, [])):
+            return cls, "rule"
+    return None
+
+
+def classify_content(path: str, hunks: List[Dict[str, Any]], binary: bool, minified: Tuple[int, int] | None = None) -> Tuple[str, str, str] | None:
+    """(class, "content", reason) from content heuristics on a parsed file: git's binary marker, or
+    added lines that are mostly minified-length or average an extreme length. A code file with any
+    normal-length added line is never classified, so hand-written code next to one long line
+    (an inlined data URI, a generated table) keeps its hunks. minified is (line chars, average chars),
+    by default MINIFIED_LINE_CHARS and MINIFIED_AVG_CHARS.
+    """
+    if binary:
+        return "binary", "content", "git binary marker"
+    line_chars, avg_chars = minified or (MINIFIED_LINE_CHARS, MINIFIED_AVG_CHARS)
+    added = [len(line) - 1 for h in hunks for line in (h.get("text") or "").splitlines() if line.startswith("+") and line[1:].strip()]
+    long = sum(1 for n in added if n > line_chars)
+    if not long:
+        return None
+    if path.endswith(CODE_GLOBS) and long < len(added):
+        return None
+    average = sum(added) // len(added)
+    if long * 2 > len(added) or average > avg_chars:
+        return "generated", "content", f"minified: {long}/{len(added)} added lines over {line_chars} chars, average {average}"
+    return None
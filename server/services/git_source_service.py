@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import atexit
+import fnmatch
+import os
+import posixpath
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class CatFileReader:
+    """One long-lived `git cat-file --batch` process per repository; blobs are read by object id.
+
+    Requests are serialized with a lock; a dead process is restarted once per request.
+    """
+
+    def __init__(self, git_dir: str) -> None:
+        self.git_dir = git_dir
+        self._proc: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> subprocess.Popen:
+        self._proc = subprocess.Popen(
+            ["git", "cat-file", "--batch"],
+            cwd=self.git_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        return self._proc
+
+    def read(self, object_id: str) -> bytes | None:
+        """Blob contents, or None when the object is missing or not a blob."""
+        if not object_id or "\n" in object_id:
+            return None
+        with self._lock:
+            for attempt in (0, 1):
+                proc = self._proc if self._proc is not None and self._proc.poll() is None else self._start()
+                try:
+                    proc.stdin.write(object_id.encode("utf-8") + b"\n")
+                    proc.stdin.flush()
+                    header = proc.stdout.readline()
+                    if not header:
+                        raise BrokenPipeError("git cat-file exited")
+                    parts = header.split()
+                    if parts[-1] in (b"missing", b"ambiguous"):
+                        return None
+                    size = int(parts[2])
+                    data = proc.stdout.read(size)
+                    proc.stdout.read(1)  # trailing LF
+                    return data if parts[1] == b"blob" else None
+                except (OSError, ValueError, IndexError):
+                    self._close()
+                    if attempt:
+                        raise
+        return None
+
+    def _close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+_readers: Dict[str, CatFileReader] = {}
+_readers_lock = threading.Lock()
+
+
+def reader_for(git_dir: str) -> CatFileReader:
+    key = os.path.realpath(git_dir)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is None:
+            reader = _readers[key] = CatFileReader(key)
+        return reader
+
+
+def close_readers() -> None:
+    with _readers_lock:
+        readers = list(_readers.values())
+        _readers.clear()
+    for r in readers:
+        r.close()
+
+
+atexit.register(close_readers)
+
+
+def _git(git_dir: str, *args: str) -> bytes:
+    return subprocess.check_output(["git", *args], cwd=git_dir, stderr=subprocess.PIPE)
+
+
+def is_git_repo(git_dir: str) -> bool:
+    if not git_dir or not os.path.isdir(git_dir):
+        return False
+    try:
+        _git(git_dir, "rev-parse", "--git-dir")
+        return True
+    except (subprocess.CalledProcessError, OSError):
+        return False
+
+
+def git_repo_id(git_dir: str) -> str:
+    """Repository name for results/{repo_id}: the work tree (or bare repo) folder without .git."""
+    p = os.path.realpath(git_dir)
+    name = os.path.basename(p)
+    if name == ".git":
+        name = os.path.basename(os.path.dirname(p))
+    return name[:-4] if name.endswith(".git") else name
+
+
+def resolve_commit(git_dir: str, ref: str) -> str:
+    """Full commit sha for ref; ValueError when it does not name a commit."""
+    if not isinstance(ref, str) or not ref or ref.startswith("-"):
+        raise ValueError(f"invalid ref: {ref!r}")
+    try:
+        return _git(git_dir, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}").decode("ascii").strip()
+    except (subprocess.CalledProcessError, OSError):
+        raise ValueError(f"unknown ref: {ref}")
+
+
+def git_source(git_dir: str, base_ref: str, head_ref: str) -> Dict[str, Any]:
+    """Resolve a base/head ref pair once; the commit ids pin every later read for the run."""
+    return {
+        "repo_git_dir": os.path.realpath(git_dir),
+        "base_ref": base_ref,
+        "head_ref": head_ref,
+        "base_commit": resolve_commit(git_dir, base_ref),
+        "head_commit": resolve_commit(git_dir, head_ref),
+    }
+
+
+@lru_cache(maxsize=16)
+def _tree_index(git_dir: str, commit: str) -> Tuple[Dict[str, Tuple[str, int]], Dict[str, List[str]]]:
+    # commits are immutable, so one ls-tree per (repo, commit) serves every lookup
+    files: Dict[str, Tuple[str, int]] = {}
+    dirs: Dict[str, set] = {"": set()}
+    raw = _git(git_dir, "ls-tree", "-r", "-l", "-z", "--full-tree", commit)
+    for entry in raw.decode("utf-8", errors="surrogateescape").split("\0"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        _, kind, sha, size = meta.split()
+        if kind != "blob":
+            continue  # submodule commits have no contents here
+        files[path] = (sha, int(size))
+        parts = path.split("/")
+        for i in range(len(parts)):
+            dirs.setdefault("/".join(parts[:i]), set()).add(parts[i])
+    return files, {d: sorted(names) for d, names in dirs.items()}
+
+
+class GitPath:
+    """Read-only pathlib-style view of one commit's tree (in the spirit of zipfile.Path).
+
+    Implements the subset the tree walkers use (/, name, suffix, parent, exists, is_dir, is_file,
+    iterdir, rglob, stat().st_size, read_bytes, read_text, relative_to, resolve), so knowledge,
+    SKT/SDE and AST stages run on a commit without a checkout. Contents come from cat-file.
+    """
+
+    def __init__(self, git_dir: str, commit: str, at: str = "", label: str | None = None) -> None:
+        # absolute: GitPaths travel to pool workers, whose cwd is that of the pool's first user
+        self.git_dir = os.path.abspath(git_dir)
+        self.commit = commit
+        self.at = at
+        self.label = label or git_repo_id(git_dir)
+
+    def _index(self) -> Tuple[Dict[str, Tuple[str, int]], Dict[str, List[str]]]:
+        return _tree_index(self.git_dir, self.commit)
+
+    def _child(self, at: str) -> "GitPath":
+        return GitPath(self.git_dir, self.commit, at, self.label)
+
+    def __truediv__(self, other: Any) -> "GitPath":
+        joined = posixpath.normpath(posixpath.join(self.at, str(other).replace("\\", "/")))
+        return self._child("" if joined in (".", "/") else joined.lstrip("/"))
+
+    def __str__(self) -> str:
+        return f"{self.git_dir}@{self.commit[:12]}:{self.at}"
+
+    def __repr__(self) -> str:
+        return f"GitPath({self.git_dir!r}, {self.commit!r}, {self.at!r})"
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, GitPath) and (self.git_dir, self.commit, self.at) == (other.git_dir, other.commit, other.at)
+
+    def __hash__(self) -> int:
+        return hash((self.git_dir, self.commit, self.at))
+
+    @property
+    def name(self) -> str:
+        return posixpath.basename(self.at) if self.at else self.label
+
+    @property
+    def suffix(self) -> str:
+        return PurePosixPath(self.name).suffix
+
+    @property
+    def parent(self) -> "GitPath":
+        return self._child(posixpath.dirname(self.at))
+
+    def as_posix(self) -> str:
+        return self.at
+
+    def resolve(self) -> "GitPath":
+        return self
+
+    def relative_to(self, other: "GitPath") -> PurePosixPath:
+        return PurePosixPath(self.at or ".").relative_to(other.at or ".")
+
+    def is_file(self) -> bool:
+        return self.at in self._index()[0]
+
+    def is_dir(self) -> bool:
+        return self.at in self._index()[1]
+
+    def exists(self) -> bool:
+        return self.is_file() or self.is_dir()
+
+    def iterdir(self) -> Iterator["GitPath"]:
+        names = self._index()[1].get(self.at)
+        if names is None:
+            raise NotADirectoryError(str(self))
+        for n in names:
+            yield self._child(posixpath.join(self.at, n) if self.at else n)
+
+    def rglob(self, pattern: str) -> Iterator["GitPath"]:
+        files, dirs = self._index()
+        prefix = self.at + "/" if self.at else ""
+        for p in sorted(set(files) | set(dirs)):
+            if p and p.startswith(prefix) and fnmatch.fnmatchcase(posixpath.basename(p), pattern):
+                yield self._child(p)
+
+    def stat(self) -> SimpleNamespace:
+        entry = self._index()[0].get(self.at)
+        if entry is None:
+            raise FileNotFoundError(str(self))
+        return SimpleNamespace(st_size=entry[1], st_mtime=0.0, st_mtime_ns=0)
+
+    def read_bytes(self) -> bytes:
+        entry = self._index()[0].get(self.at)
+        data = reader_for(self.git_dir).read(entry[0]) if entry else None
+        if data is None:
+            raise FileNotFoundError(str(self))
+        return data
+
+    def read_text(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        return self.read_bytes().decode(encoding, errors)
+
+
+def source_trees(source: Dict[str, Any], label: str | None = None) -> Tuple[GitPath, GitPath]:
+    git_dir = source["repo_git_dir"]
+    return GitPath(git_dir, source["base_commit"], label=label), GitPath(git_dir, source["head_commit"], label=label)
+
+
+def tree_root(src: Any) -> Any:
+    """A directory path as Path, or a GitPath as is; tree walkers accept either."""
+    return src if isinstance(src, GitPath) else Path(src)
+
+
+def absolute_root(src: Any) -> Any:
+    """tree_root resolved to an absolute path, for worker-pool tasks: forkserver workers keep the
+    cwd of the pool's first use, so a relative path would name another directory there.
+    """
+    return tree_root(src).resolve()
@@ -3,6 +3,8 @@ from __future__ import annotations
 from fnmatch import fnmatch
 from typing import Dict, Any, List
 
+from server.services.symbol_map_service import importer_index, importers_of
+
 
 class ScopeGuard:
     @staticmethod
@@ -58,19 +60,31 @@ class RuleGuard:
 
 class ImpactGuard:
     @staticmethod
-    def run(api: Dict[str, Any], deps: Dict[str, Any], diff_bundle: Dict[str, Any]) -> Dict[str, Any]:
+    def run(api: Dict[str, Any], deps: Dict[str, Any], diff_bundle: Dict[str, Any], ast_deltas: Dict[str, Any] | None = None) -> Dict[str, Any]:
         api_exports = {(e.get("from"), e.get("symbol")) for e in (api or {}).get("exports", [])}
         changed_files = [f.get("path") for f in diff_bundle.get("files", []) if f.get("path")]
 
+        # files whose hunks were mapped to AST symbols (ast_deltas.symbol_files) are judged per symbol
+        mapped = set((ast_deltas or {}).get("symbol_files", []))
+        touched: Dict[str, set] = {}
+        for f in diff_bundle.get("files", []):
+            if f.get("path") in mapped:
+                touched[f["path"]] = {name for h in f.get("hunks", []) for name in h.get("symbols", [])}
+        signature_changes: List[str] = []
+        for d in (ast_deltas or {}).get("symbol_deltas", []):
+            if d.get("exported") and d.get("change") in ("signature", "added", "removed"):
+                signature_changes.append(d["path"])
+
         changed_exports: List[str] = []
         for (path, symbol) in api_exports:
-            if path in changed_files:
+            if path in changed_files and (path not in mapped or symbol in touched.get(path, ())):
                 changed_exports.append(symbol)
 
-        # naive signature change detection: check for lines starting with '+' that change function signature keywords
-        signature_changes: List[str] = []
+        # naive signature change detection for the rest: lines starting with '+' that change function signature keywords
         for f in diff_bundle.get("files", []):
             path = f.get("path")
+            if path in mapped:
+                continue
             for h in f.get("hunks", []):
                 text = h.get("text", "")
                 for line in text.splitlines():
@@ -78,11 +92,10 @@ class ImpactGuard:
                         signature_changes.append(path)
                         break
 
-        # impacted via reverse deps
-        rev: Dict[str, List[str]] = {}
-        for e in deps.get("edges", []):
-            rev.setdefault(e["to"], []).append(e["from"])
-        possibly_impacted = sorted(set([d for c in changed_files for d in rev.get(c, [])]))
+        # impacted via reverse deps, per touched export where ast_deltas narrowed the file
+        index = importer_index(deps)
+        narrowed = (ast_deltas or {}).get("exported_changes") or {}
+        possibly_impacted = sorted(set().union(*(importers_of(index, c, narrowed.get(c)) for c in changed_files)))
 
         return {
             "changed_exports": sorted(set(changed_exports)),
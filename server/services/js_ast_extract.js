@@ -3,8 +3,7 @@ const fs = require('fs');
 const path = require('path');
 const parser = require('@babel/parser');
 
-function parseFile(file) {
-  const code = fs.readFileSync(file, 'utf8');
+function parseFile(file, code) {
   const isTS = file.endsWith('.ts') || file.endsWith('.tsx');
   const ast = parser.parse(code, {
     sourceType: 'module',
@@ -21,7 +20,13 @@ function parseFile(file) {
 
   function getParams(node) {
     if (!node || !node.params) return [];
-    return node.params.map(p => (p.name || p.left && p.left.name || 'param'));
+    // same notation as the Python summaries: "b=" has a default (or is optional), "...rest"
+    return node.params.map(p => {
+      if (p.type === 'TSParameterProperty') p = p.parameter;
+      if (p.type === 'RestElement') return '...' + ((p.argument && p.argument.name) || 'param');
+      if (p.type === 'AssignmentPattern') return ((p.left && p.left.name) || 'param') + '=';
+      return (p.name || 'param') + (p.optional ? '=' : '');
+    });
   }
 
   const t = ast.types || {};
@@ -61,7 +66,97 @@ function parseFile(file) {
     }
   }
 
-  return { exports, functions };
+  // Line ranges (1-based, inclusive) of functions, classes, methods, declared consts and TS types, so
+  // diff hunks can be mapped to the symbols they touch. Nested symbols are named owner.name.
+  const symbols = [];
+  const exportedLocals = new Set();
+
+  function addSymbol(name, kind, node, fn, exported, owner) {
+    if (!name || !node.loc) return null;
+    const full = owner ? owner + '.' + name : name;
+    symbols.push({
+      name: full,
+      kind,
+      start: node.loc.start.line,
+      end: node.loc.end.line,
+      exported: !!exported && !owner,
+      params: fn ? getParams(fn) : null,
+    });
+    return full;
+  }
+
+  function isFunction(n) {
+    return n && (n.type === 'ArrowFunctionExpression' || n.type === 'FunctionExpression');
+  }
+
+  function keyName(key) {
+    return key && (key.name || (key.id && key.id.name) || (typeof key.value === 'string' ? key.value : null));
+  }
+
+  function visit(node, owner, exported) {
+    if (!node || typeof node !== 'object') return;
+    if (Array.isArray(node)) { node.forEach(n => visit(n, owner, false)); return; }
+    let inner = owner;
+    switch (node.type) {
+      case 'ExportNamedDeclaration':
+      case 'ExportDefaultDeclaration':
+        if (node.declaration && node.declaration.type && node.declaration.type.endsWith('Declaration')) {
+          visit(node.declaration, owner, true);
+          return;
+        }
+        for (const s of node.specifiers || []) {
+          if (s.local && s.local.name) exportedLocals.add(s.local.name);
+        }
+        break;
+      case 'FunctionDeclaration':
+      case 'TSDeclareFunction':
+        inner = addSymbol((node.id && node.id.name) || 'default', 'function', node, node, exported, owner) || owner;
+        break;
+      case 'ClassDeclaration':
+        inner = addSymbol((node.id && node.id.name) || 'default', 'class', node, null, exported, owner) || owner;
+        break;
+      case 'ClassMethod':
+      case 'ClassPrivateMethod':
+      case 'TSDeclareMethod':
+        inner = addSymbol(keyName(node.key), 'method', node, node, false, owner) || owner;
+        break;
+      case 'ClassProperty':
+      case 'ClassPrivateProperty':
+        if (isFunction(node.value)) inner = addSymbol(keyName(node.key), 'method', node, node.value, false, owner) || owner;
+        break;
+      case 'VariableDeclaration':
+        for (const d of node.declarations || []) {
+          if (!d.id || !d.id.name) continue;
+          const fn = isFunction(d.init) ? d.init : null;
+          const name = addSymbol(d.id.name, fn ? 'function' : 'const', node.declarations.length === 1 ? node : d, fn, exported, owner);
+          if (d.init) visit(d.init, name || owner, false);
+        }
+        return;
+      case 'TSInterfaceDeclaration':
+        addSymbol(node.id && node.id.name, 'interface', node, null, exported, owner);
+        return;
+      case 'TSTypeAliasDeclaration':
+        addSymbol(node.id && node.id.name, 'type', node, null, exported, owner);
+        return;
+      case 'TSEnumDeclaration':
+        addSymbol(node.id && node.id.name, 'enum', node, null, exported, owner);
+        return;
+      default:
+        break;
+    }
+    for (const k of Object.keys(node)) {
+      if (k === 'loc' || k === 'leadingComments' || k === 'trailingComments' || k === 'innerComments') continue;
+      const v = node[k];
+      if (v && typeof v === 'object') visit(v, inner, false);
+    }
+  }
+
+  visit(ast.program.body, null, false);
+  for (const s of symbols) {
+    if (!s.name.includes('.') && exportedLocals.has(s.name)) s.exported = true;
+  }
+
+  return { exports, functions, symbols };
 }
 
 function main() {
@@ -71,9 +166,11 @@ function main() {
     console.log(JSON.stringify({ exports: [], functions: [] }));
     return;
   }
-  const file = path.resolve(args[idx+1]);
+  // --stdin: contents come from stdin (e.g. a git blob); --file still names the file for its extension
+  const fromStdin = args.includes('--stdin');
+  const file = fromStdin ? args[idx+1] : path.resolve(args[idx+1]);
   try {
-    const out = parseFile(file);
+    const out = parseFile(file, fs.readFileSync(fromStdin ? 0 : file, 'utf8'));
     console.log(JSON.stringify(out));
   } catch (e) {
     console.log(JSON.stringify({ exports: [], functions: [] }));
@@ -3,11 +3,15 @@ from __future__ import annotations
 import json
 import os
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 
+from server.services.git_source_service import GitPath, absolute_root, tree_root
+from server.services.run_io_service import atomic_write_json
+from server.services.worker_pool_service import parallel_map
 
-def _infer_structure(repo_dir: str) -> Dict[str, Any]:
-    root = Path(repo_dir)
+
+def _infer_structure(repo_dir: str | GitPath) -> Dict[str, Any]:
+    root = tree_root(repo_dir)
     entries = []
 
     def describe_dir(p: Path, max_children: int = 10) -> Dict[str, Any]:
@@ -35,12 +39,12 @@ def _infer_structure(repo_dir: str) -> Dict[str, Any]:
     return {"schema_version": "1.0", "root": "/", "tree": entries}
 
 
-def _infer_repo(repo_dir: str) -> Dict[str, Any]:
+def _infer_repo(repo_dir: str | GitPath) -> Dict[str, Any]:
     # Conservative defaults tailored for date-fns-like repo
     return {
         "schema_version": "1.0",
         "repo": {
-            "name": Path(repo_dir).name,
+            "name": tree_root(repo_dir).name,
             "default_branch": "main",
             "language_primary": "TypeScript",
             "package_manager": "pnpm",
@@ -62,10 +66,10 @@ def _infer_repo(repo_dir: str) -> Dict[str, Any]:
     }
 
 
-def _infer_api_surface(repo_dir: str) -> Dict[str, Any]:
+def _infer_api_surface(repo_dir: str | GitPath) -> Dict[str, Any]:
     # Parse src/index.ts re-exports and discover symbol names from each module file
     exports: List[Dict[str, Any]] = []
-    src_root = Path(repo_dir) / "src"
+    src_root = tree_root(repo_dir) / "src"
     index_path = src_root / "index.ts"
     reexport_targets: List[str] = []
     if index_path.exists():
@@ -130,65 +134,104 @@ def _infer_api_surface(repo_dir: str) -> Dict[str, Any]:
     return {"schema_version": "1.0", "exports": exports}
 
 
-def _infer_deps(repo_dir: str) -> Dict[str, Any]:
-    # Robust-ish file-level import scan in src/** for TypeScript
+def _imported_names(line_s: str) -> List[str]:
+    """Names one import line takes from its module: named imports by their exported name, "default"
+    for a default import, "*" for namespace, side-effect or unparsable imports (every symbol).
+    """
+    if " from " not in line_s:
+        return ["*"]
+    clause = line_s[len("import "):].rsplit(" from ", 1)[0].strip()
+    if clause.startswith("type "):
+        clause = clause[len("type "):].strip()
+    names: List[str] = []
+    if "{" in clause:
+        clause, _, rest = clause.partition("{")
+        for part in rest.split("}", 1)[0].split(","):
+            part = part.strip()
+            if part.startswith("type "):
+                part = part[len("type "):].strip()
+            if part:
+                names.append(part.split(" as ", 1)[0].strip())
+    for part in clause.split(","):
+        part = part.strip()
+        if part.startswith("*"):
+            names.append("*")
+        elif part:
+            names.append("default")
+    return sorted(set(names)) or ["*"]
+
+
+def _scan_imports(task: Tuple[Path | GitPath, Path | GitPath]) -> List[Dict[str, Any]]:
+    """Relative-import edges of one source file (worker-pool task); each edge lists the imported symbols."""
+    root, path = task
+    rel = path.relative_to(root).as_posix()
+    edges: List[Dict[str, Any]] = []
+    try:
+        text = path.read_text(encoding="utf-8", errors="ignore")
+    except Exception:
+        return edges
+    for raw in text.splitlines():
+        line_s = raw.strip()
+        if not line_s.startswith("import "):
+            continue
+        # Handle: import ... from "..." | '...'
+        mod = None
+        if " from \"" in line_s:
+            mod = line_s.split(" from \"")[-1]
+            if mod.endswith("\""):
+                mod = mod[:-1]
+        elif " from '\"" in line_s:
+            # defensive; unlikely
+            pass
+        elif " from '" in line_s:
+            mod = line_s.split(" from '")[-1]
+            if mod.endswith("'"):
+                mod = mod[:-1]
+        else:
+            # bare import like: import "./polyfill";
+            if line_s.endswith(";") and ("\"" in line_s or "'" in line_s):
+                q = "\"" if "\"" in line_s else "'"
+                try:
+                    mod = line_s.split(q)[1]
+                except Exception:
+                    mod = None
+        if not mod:
+            continue
+        if not (mod.startswith("./") or mod.startswith("../")):
+            continue
+        # Resolve to candidate targets
+        candidates = []
+        base = path.parent / mod
+        candidates.append(base)
+        candidates.append(base.parent / (base.name + ".ts"))
+        candidates.append(base / "index.ts")
+        for t in candidates:
+            if t.exists():
+                try:
+                    target_rel = t.resolve().relative_to(root).as_posix()
+                    edges.append({"from": rel, "to": target_rel, "symbols": _imported_names(line_s)})
+                    break
+                except Exception:
+                    continue
+    return edges
+
+
+def _infer_deps(repo_dir: str | GitPath) -> Dict[str, Any]:
+    # Robust-ish import scan in src/** for TypeScript; edges carry the imported symbol names
     nodes: List[Dict[str, Any]] = []
-    edges: List[Dict[str, str]] = []
-    src_root = Path(repo_dir) / "src"
+    edges: List[Dict[str, Any]] = []
+    # absolute: the scan runs in pool workers, and _scan_imports compares against resolved targets
+    root = absolute_root(repo_dir)
+    src_root = root / "src"
     if not src_root.exists():
         return {"schema_version": "1.0", "nodes": nodes, "edges": edges}
 
     all_files = list(src_root.rglob("*.ts"))
     for path in all_files:
-        rel = path.relative_to(Path(repo_dir)).as_posix()
-        nodes.append({"id": rel, "layer": "library"})
-        try:
-            text = path.read_text(encoding="utf-8", errors="ignore")
-        except Exception:
-            continue
-        for raw in text.splitlines():
-            line_s = raw.strip()
-            if not line_s.startswith("import "):
-                continue
-            # Handle: import ... from "..." | '...'
-            mod = None
-            if " from \"" in line_s:
-                mod = line_s.split(" from \"")[-1]
-                if mod.endswith("\""):
-                    mod = mod[:-1]
-            elif " from '\"" in line_s:
-                # defensive; unlikely
-                pass
-            elif " from '" in line_s:
-                mod = line_s.split(" from '")[-1]
-                if mod.endswith("'"):
-                    mod = mod[:-1]
-            else:
-                # bare import like: import "./polyfill";
-                if line_s.endswith(";") and ("\"" in line_s or "'" in line_s):
-                    q = "\"" if "\"" in line_s else "'"
-                    try:
-                        mod = line_s.split(q)[1]
-                    except Exception:
-                        mod = None
-            if not mod:
-                continue
-            if not (mod.startswith("./") or mod.startswith("../")):
-                continue
-            # Resolve to candidate targets
-            candidates = []
-            base = path.parent / mod
-            candidates.append(base)
-            candidates.append(Path(str(base) + ".ts"))
-            candidates.append(base / "index.ts")
-            for t in candidates:
-                if t.exists():
-                    try:
-                        target_rel = t.resolve().relative_to(Path(repo_dir)).as_posix()
-                        edges.append({"from": rel, "to": target_rel})
-                        break
-                    except Exception:
-                        continue
+        nodes.append({"id": path.relative_to(root).as_posix(), "layer": "library"})
+    # each file is read and scanned independently; results come back in file order
+    for file_edges in parallel_map(_scan_imports, [(root, p) for p in all_files]):
+        edges.extend(file_edges)
 
     return {"schema_version": "1.0", "nodes": nodes, "edges": edges}
 
@@ -238,7 +281,7 @@ def _profile() -> Dict[str, Any]:
     }
 
 
-def generate_repo_knowledge(repo_dir: str, out_dir: str) -> List[str]:
+def generate_repo_knowledge(repo_dir: str | GitPath, out_dir: str) -> List[str]:
     out = Path(out_dir)
     out.mkdir(parents=True, exist_ok=True)
 
@@ -258,7 +301,7 @@ def generate_repo_knowledge(repo_dir: str, out_dir: str) -> List[str]:
         "profile.json": profile,
     }
     for name, data in artifacts.items():
-        (out / name).write_text(json.dumps(data, indent=2), encoding="utf-8")
+        atomic_write_json(out / name, data)
     return list(artifacts.keys())
 
 
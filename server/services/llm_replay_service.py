@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Tuple
+
+
+DEFAULT_CASSETTE_DIR = str(Path("prompt_performance") / "cassettes")
+
+_rng = random.Random(int(os.environ.get("LLM_REPLAY_SEED", "0")) or None)
+_rng_lock = threading.Lock()
+
+
+def cassette_dir() -> Path:
+    return Path(os.environ.get("LLM_CASSETTE_DIR", DEFAULT_CASSETTE_DIR))
+
+
+def cassette_key(model: str, system: str, user_content: str) -> str:
+    # user_content is the exact serialized user message, so in-process and HTTP replay agree
+    h = hashlib.sha256()
+    for part in (model, system, user_content):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def record_exchange(key: str, model: str, system: str, user_content: str, response: Dict[str, Any], latency_ms: float) -> None:
+    d = cassette_dir()
+    try:
+        d.mkdir(parents=True, exist_ok=True)
+        doc = {
+            "schema_version": "1.0",
+            "key": key,
+            "model": model,
+            "system": system,
+            "user": user_content,
+            "response": response,
+            "latency_ms": round(latency_ms, 3),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        tmp = d / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp.write_text(json.dumps(doc), encoding="utf-8")
+        os.replace(tmp, d / f"{key}.json")
+    except Exception:
+        pass
+
+
+def load_exchange(key: str) -> Dict[str, Any] | None:
+    p = cassette_dir() / f"{key}.json"
+    if not p.exists():
+        return None
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+
+def sample_latency_ms(spec: str | None, recorded_ms: float | None = None) -> float:
+    """Latency to inject for a replayed call. spec forms:
+    recorded (default), none, fixed:MS, uniform:LO:HI, normal:MEAN:STD, lognormal:MEDIAN:SIGMA.
+    """
+    spec = (spec or "recorded").strip().lower()
+    parts = spec.split(":")
+    kind = parts[0]
+    try:
+        args = [float(x) for x in parts[1:]]
+    except ValueError:
+        args = []
+    with _rng_lock:
+        if kind == "none":
+            return 0.0
+        if kind == "fixed" and len(args) >= 1:
+            return max(0.0, args[0])
+        if kind == "uniform" and len(args) >= 2:
+            return max(0.0, _rng.uniform(args[0], args[1]))
+        if kind == "normal" and len(args) >= 2:
+            return max(0.0, _rng.gauss(args[0], args[1]))
+        if kind == "lognormal" and len(args) >= 2:
+            import math
+            return max(0.0, _rng.lognormvariate(math.log(max(args[0], 1e-3)), args[1]))
+    return max(0.0, float(recorded_ms or 0.0))
+
+
+def _stub_alignment(user_obj: Dict[str, Any]) -> Dict[str, Any]:
+    acs = [c.get("id") for c in (user_obj.get("ticket") or {}).get("acceptance_criteria", [])]
+    return {"matched": [], "unmet": acs, "evidence": []}
+
+
+def _stub_impact() -> Dict[str, Any]:
+    return {"changed_exports": [], "signature_changes": [], "possibly_impacted": []}
+
+
+def stub_content(system: str, user_obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Schema-valid, conservative response for a prompt we have no recording for."""
+    if "\"directories\"" in system:
+        return {
+            "schema_version": "1.0",
+            "directories": [
+                {"rel_path": c.get("rel_path", ""), "ticket_alignment": _stub_alignment(user_obj), "impact": _stub_impact()}
+                for c in user_obj.get("directories", []) or [] if isinstance(c, dict)
+            ],
+        }
+    if "ticket_alignment" in system:
+        return {"schema_version": "1.0", "ticket_alignment": _stub_alignment(user_obj), "notes": "stub"}
+    if "changed_exports" in system:
+        return _stub_impact()
+    return {}
+
+
+def replay_completion(model: str, system: str, user_content: str) -> Tuple[Dict[str, Any] | None, str]:
+    """Serve a chat-completions response from the cassette store, sleeping per LLM_REPLAY_LATENCY.
+    Returns (response, source) with source "cassette" or "stub"; on a miss with LLM_REPLAY_MISS
+    other than "stub", returns (None, "miss").
+    """
+    key = cassette_key(model, system, user_content)
+    hit = load_exchange(key)
+    if hit is not None:
+        response = hit.get("response") or {}
+        recorded_ms = hit.get("latency_ms")
+        source = "cassette"
+    elif os.environ.get("LLM_REPLAY_MISS", "error").lower() == "stub":
+        try:
+            user_obj = json.loads(user_content)
+        except Exception:
+            user_obj = {}
+        content = stub_content(system, user_obj if isinstance(user_obj, dict) else {})
+        # ~4 chars per token; good enough for relative load numbers
+        response = {
+            "id": f"stub-{key[:12]}",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(content)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": (len(system) + len(user_content)) // 4, "completion_tokens": len(json.dumps(content)) // 4},
+        }
+        recorded_ms = None
+        source = "stub"
+    else:
+        return None, "miss"
+    delay = sample_latency_ms(os.environ.get("LLM_REPLAY_LATENCY"), recorded_ms)
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+    return response, source
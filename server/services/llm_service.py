@@ -1,12 +1,104 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List
 import json
 import os
+import threading
+import time
 import urllib.request
 import urllib.error
 
+from server.services.metrics_service import record_llm_usage, current_metrics
+from server.services.trace_service import trace_payloads_enabled, trace_prompt
+from server.services.llm_replay_service import cassette_key, record_exchange, replay_completion
+
+
+DEFAULT_LLM_BASE_URL = "https://api.openai.com/v1"
+
+# latency/usage/cache info of the last _chat_completion on this thread, picked up by _log_prompt
+_call_info = threading.local()
+
+
+def _record_usage(data: Dict[str, Any]) -> None:
+    usage = data.get("usage") or {}
+    record_llm_usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+
+def _llm_mode() -> str:
+    # live (default) | record (live + store exchanges) | replay (serve stored exchanges, no network)
+    return os.environ.get("LLM_MODE", "live").strip().lower()
+
+
+def llm_enabled() -> bool:
+    # a custom LLM_BASE_URL (e.g. a local stub server) does not need a real key
+    return _llm_mode() == "replay" or bool(os.environ.get("OPENAI_API_KEY")) or bool(os.environ.get("LLM_BASE_URL"))
+
+
+def llm_identity() -> Dict[str, Any]:
+    """Everything besides the prompt that shapes an answer; part of memo keys for LLM stages."""
+    return {
+        "model": os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
+        "mode": _llm_mode(),
+        "base_url": os.environ.get("LLM_BASE_URL", DEFAULT_LLM_BASE_URL).rstrip("/"),
+        "enabled": llm_enabled(),
+    }
+
+
+def _chat_completion(system: str, user_obj: Dict[str, Any], timeout: int = 90) -> Dict[str, Any]:
+    """One chat-completions round trip against LLM_BASE_URL (OpenAI-compatible), or the replay store.
+    Returns the raw response document; raises on transport/HTTP errors or replay misses.
+    """
+    model = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+    user_content = json.dumps(user_obj, ensure_ascii=False)
+    mode = _llm_mode()
+    started = time.perf_counter()
+    _call_info.last = None
+    if mode == "replay":
+        data, source = replay_completion(model, system, user_content)
+        if data is None:
+            raise LookupError("no recorded exchange for prompt")
+        _finish_call(data, started, cache_hit=source == "cassette", source=source)
+        return data
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user_content}
+        ],
+        "temperature": 0,
+        "response_format": {"type": "json_object"}
+    }
+    base_url = os.environ.get("LLM_BASE_URL", DEFAULT_LLM_BASE_URL).rstrip("/")
+    req = urllib.request.Request(
+        url=f"{base_url}/chat/completions",
+        data=json.dumps(body).encode("utf-8"),
+        headers={
+            "Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}",
+            "Content-Type": "application/json",
+        },
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        data = json.loads(resp.read().decode("utf-8"))
+    if mode == "record":
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        record_exchange(cassette_key(model, system, user_content), model, system, user_content, data, latency_ms)
+    _finish_call(data, started, cache_hit=False, source=mode)
+    return data
+
+
+def _finish_call(data: Dict[str, Any], started: float, cache_hit: bool, source: str) -> None:
+    _record_usage(data)
+    usage = data.get("usage") or {}
+    _call_info.last = {
+        "latency_ms": round((time.perf_counter() - started) * 1000.0, 3),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "cache_hit": cache_hit,
+        "source": source,
+    }
+
 
 def _slim_diff(diff_bundle: Dict[str, Any], max_hunk_chars: int = 2000, files_only: bool = False) -> Dict[str, Any]:
     files = []
@@ -38,53 +130,47 @@ def _slim_diff(diff_bundle: Dict[str, Any], max_hunk_chars: int = 2000, files_on
 
 
 def _log_prompt(name: str, system: str, user_obj: Dict[str, Any], response_obj: Dict[str, Any] | None, error: str | None = None) -> None:
+    # Non-blocking: the record is serialized and appended to the per-run NDJSON by trace_service
     try:
-        from pathlib import Path
-        import json as _json
-        d = Path("prompt_performance")
-        d.mkdir(parents=True, exist_ok=True)
-        payload = {"system": system, "input": user_obj, "output": response_obj, "error": error}
-        (d / f"last_{name}.json").write_text(_json.dumps(payload, indent=2), encoding="utf-8")
+        info = getattr(_call_info, "last", None) or {}
+        _call_info.last = None
+        metrics = current_metrics()
+        dir_context = user_obj.get("dir_context") if isinstance(user_obj, dict) else None
+        record = {
+            "run_id": metrics.run_id if metrics is not None else None,
+            "name": name,
+            "rel_path": dir_context.get("rel_path") if isinstance(dir_context, dict) else None,
+            "model": os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
+            "latency_ms": info.get("latency_ms"),
+            "prompt_tokens": info.get("prompt_tokens"),
+            "completion_tokens": info.get("completion_tokens"),
+            "cache_hit": bool(info.get("cache_hit", False)),
+            "source": info.get("source"),
+            "error": error,
+        }
+        if trace_payloads_enabled():
+            record.update({"system": system, "input": user_obj, "output": response_obj})
+        trace_prompt(record)
     except Exception:
         pass
 
 
 def evaluate_ticket_alignment(ticket: Dict[str, Any], diff_bundle: Dict[str, Any], feature_summary: Dict[str, Any] | None = None, dry_run: Dict[str, Any] | None = None) -> Dict[str, Any]:
-    key = os.environ.get("OPENAI_API_KEY")
-    if not key:
+    if not llm_enabled():
         return _heuristic_alignment(ticket, diff_bundle)
 
     # Model call with strict IO, per-criterion evidence requirement
     system = (
         "ONLY_OUTPUT valid JSON with {\"schema_version\":\"1.0\", \"ticket_alignment\":{\"matched\":[],\"unmet\":[],\"evidence\":[]}}. "
         "For each acceptance criterion, decide matched/unmet using diff hunks plus structural evidence. "
-        "Require mapping each matched AC to either (a) semantic deltas (likely_replacements or calls_added) or (b) AST deltas (exports/signature), or (c) explicit caller paths from dry_run.callers. "
+        "Require mapping each matched AC to either (a) semantic deltas (likely_replacements or calls_added) or (b) AST deltas (exports/signature), or (c) explicit caller paths from dry_run.callers (dry_run.callers_by_symbol lists them per touched export). "
         "If no structural evidence exists, mark AC unmet. Be conservative."
     )
     slim = _slim_diff(diff_bundle, max_hunk_chars=3000)
     user_payload = {"schema_version": "1.0", "ticket": ticket.get("ticket", {}), "diff": slim, "feature_summary": feature_summary or {}, "dry_run": dry_run or {}}
-    body = {
-        "model": os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-        ],
-        "temperature": 0,
-        "response_format": {"type": "json_object"}
-    }
 
     try:
-        req = urllib.request.Request(
-            url="https://api.openai.com/v1/chat/completions",
-            data=json.dumps(body).encode("utf-8"),
-            headers={
-                "Authorization": f"Bearer {key}",
-                "Content-Type": "application/json"
-            },
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
+        data = _chat_completion(system, user_payload, timeout=60)
         content = data["choices"][0]["message"]["content"]
         parsed = json.loads(content)
         _log_prompt("ticket_alignment", system, user_payload, parsed)
@@ -128,30 +214,10 @@ def _heuristic_alignment(ticket: Dict[str, Any], diff_bundle: Dict[str, Any]) ->
 
 
 def _openai_chat(system: str, user_obj: Dict[str, Any]) -> Dict[str, Any] | None:
-    key = os.environ.get("OPENAI_API_KEY")
-    if not key:
+    if not llm_enabled():
         return None
-    body = {
-        "model": os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user", "content": json.dumps(user_obj, ensure_ascii=False)}
-        ],
-        "temperature": 0,
-        "response_format": {"type": "json_object"}
-    }
     try:
-        req = urllib.request.Request(
-            url="https://api.openai.com/v1/chat/completions",
-            data=json.dumps(body).encode("utf-8"),
-            headers={
-                "Authorization": f"Bearer {key}",
-                "Content-Type": "application/json",
-            },
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=90) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
+        data = _chat_completion(system, user_obj, timeout=90)
         content = data["choices"][0]["message"]["content"]
         return json.loads(content)
     except Exception:
@@ -229,7 +295,8 @@ def ticket_alignment_shadow(ticket: Dict[str, Any], dir_context: Dict[str, Any],
 def impact_guard_shadow(dir_context: Dict[str, Any], feature_summary: Dict[str, Any] | None = None, dry_run: Dict[str, Any] | None = None) -> Dict[str, Any]:
     system = (
         "ONLY_OUTPUT valid JSON: {\"changed_exports\":[],\"signature_changes\":[],\"possibly_impacted\":[]}. "
-        "Use dir_context.diff.hunks + dir_context.api_exports + dir_context.deps_subgraph. Limit reasoning to this subtree."
+        "Use dir_context.diff.hunks + dir_context.api_exports + dir_context.deps_subgraph. Limit reasoning to this subtree. "
+        "Where a file carries symbol_deltas, its hunks hold changed lines only; count a signature change only for an exported symbol whose change is signature, added or removed."
     )
     user_payload = {
         "schema_version": "1.0",
@@ -248,3 +315,75 @@ def impact_guard_shadow(dir_context: Dict[str, Any], feature_summary: Dict[str,
     # fallback to empty impact for the subtree
     return {"changed_exports": [], "signature_changes": [], "possibly_impacted": []}
 
+
+BATCH_TOKEN_BUDGET = 12000
+BATCH_MAX_DIRS = 8
+
+
+def _estimate_tokens(obj: Any) -> int:
+    # ~4 chars/token for JSON-heavy prompts; only used to pack batches under a budget
+    return len(json.dumps(obj, ensure_ascii=False)) // 4
+
+
+def pack_dir_contexts(dir_contexts: List[Dict[str, Any]], token_budget: int = BATCH_TOKEN_BUDGET, max_dirs: int = BATCH_MAX_DIRS) -> List[List[Dict[str, Any]]]:
+    """Greedy, order-preserving packing of directory contexts into prompt-sized groups.
+    A context larger than the budget gets a group of its own.
+    """
+    groups: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    used = 0
+    for ctx in dir_contexts:
+        cost = _estimate_tokens(ctx)
+        if current and (used + cost > token_budget or len(current) >= max_dirs):
+            groups.append(current)
+            current, used = [], 0
+        current.append(ctx)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def batched_shadow_prompts(ticket: Dict[str, Any], dir_contexts: List[Dict[str, Any]], global_summary: Dict[str, Any] | None = None) -> Dict[str, Dict[str, Any]]:
+    """Alignment + impact for several directories in one call (shared ticket/global_summary; each
+    directory may carry its own dir_summary, the feature summary and dry run of its files).
+    Returns {rel_path: {"alignment": ..., "impact": ...}} for directories the model answered;
+    callers fall back to per-directory prompts for anything missing.
+    """
+    system = (
+        "ONLY_OUTPUT valid JSON: {\"schema_version\":\"1.0\",\"directories\":[{\"rel_path\":\"\","
+        "\"ticket_alignment\":{\"matched\":[],\"unmet\":[],\"evidence\":[]},"
+        "\"impact\":{\"changed_exports\":[],\"signature_changes\":[],\"possibly_impacted\":[]}}]}. "
+        "Return exactly one entry per input directory, echoing its rel_path. "
+        "Judge each directory only from its own dir_context (meta/files, diff.hunks, api_exports, deps_subgraph). "
+        "If structural evidence for an AC is absent in that subtree, leave it unmet unless explicitly proven in its dir_summary or global_summary. "
+        "Limit impact reasoning to that subtree; where a file carries symbol_deltas, count a signature change only for an exported "
+        "symbol whose change is signature, added or removed. Be conservative."
+    )
+    user_payload = {
+        "schema_version": "1.0",
+        "ticket": ticket.get("ticket", {}),
+        "global_summary": global_summary or {},
+        "directories": dir_contexts,
+    }
+    out = _openai_chat(system, user_payload)
+    _log_prompt("shadow_batch", system, user_payload, out)
+    wanted = {c.get("rel_path", "") for c in dir_contexts}
+    results: Dict[str, Dict[str, Any]] = {}
+    for entry in (out or {}).get("directories", []) or []:
+        if not isinstance(entry, dict):
+            continue
+        rel = entry.get("rel_path")
+        ta = entry.get("ticket_alignment")
+        impact = entry.get("impact")
+        if rel not in wanted or rel in results or not isinstance(ta, dict) or not isinstance(impact, dict):
+            continue
+        results[rel] = {
+            "alignment": {"schema_version": "1.0", "ticket_alignment": ta, "notes": "shadow_batch"},
+            "impact": {
+                "changed_exports": impact.get("changed_exports", []),
+                "signature_changes": impact.get("signature_changes", []),
+                "possibly_impacted": impact.get("possibly_impacted", []),
+            },
+        }
+    return results
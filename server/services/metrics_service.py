@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Iterator, Tuple
+
+try:
+    import resource
+except ImportError:  # non-POSIX
+    resource = None
+
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+# (stage, field) -> float; fields: runs, wall_seconds, cpu_seconds, child_cpu_seconds, read_bytes, write_bytes, llm_calls, prompt_tokens, completion_tokens
+_registry: Dict[Tuple[str, str], float] = {}
+# finished analyze runs by outcome (RunMetrics.status)
+RUN_STATUSES = ("done", "rejected", "error")
+_runs_total = {status: 0 for status in RUN_STATUSES}
+
+
+def _peak_rss_kb() -> int | None:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux (bytes on macOS); process-wide high-water mark
+    return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _children_cpu_seconds() -> float | None:
+    # git/node subprocesses (diff, AST) do their work outside the request thread
+    if resource is None:
+        return None
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _io_counters() -> Tuple[int, int] | None:
+    # Linux only; rchar/wchar include page-cache hits, which is what artifact writes cost us
+    p = Path("/proc/self/io")
+    try:
+        fields = dict(line.split(": ", 1) for line in p.read_text().splitlines() if ": " in line)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except Exception:
+        return None
+
+
+def _empty_llm() -> Dict[str, int]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+class RunMetrics:
+    """Per-run stage instrumentation: wall/CPU time, peak RSS, I/O bytes and LLM tokens.
+    cpu_ms is CPU of the request thread, child_cpu_ms covers reaped subprocesses (git, node);
+    RSS and I/O are process-wide counters. status is the run's outcome, set by the caller:
+    done, rejected (a 4xx error event) or error (the default, e.g. an exception).
+    """
+
+    def __init__(self, run_id: str) -> None:
+        self.run_id = run_id
+        self.status = "error"
+        self.stages: List[Dict[str, Any]] = []
+        self.directories: List[Dict[str, Any]] = []
+        self._llm_stack: List[Dict[str, int]] = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, rel_path: str | None = None) -> Iterator[Dict[str, Any]]:
+        io_start = _io_counters()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        child_start = _children_cpu_seconds()
+        llm = _empty_llm()
+        self._llm_stack.append(llm)
+        entry: Dict[str, Any] = {"stage": name}
+        if rel_path is not None:
+            entry["rel_path"] = rel_path
+        try:
+            yield entry
+        finally:
+            self._llm_stack.pop()
+            # nested directory entries roll their tokens up into the enclosing stage
+            if self._llm_stack:
+                for k, v in llm.items():
+                    self._llm_stack[-1][k] += v
+            io_end = _io_counters()
+            child_end = _children_cpu_seconds()
+            entry.update({
+                "wall_ms": round((time.perf_counter() - wall_start) * 1000.0, 3),
+                "cpu_ms": round((time.thread_time() - cpu_start) * 1000.0, 3),
+                "child_cpu_ms": round((child_end - child_start) * 1000.0, 3) if child_start is not None and child_end is not None else None,
+                "peak_rss_kb": _peak_rss_kb(),
+                "read_bytes": (io_end[0] - io_start[0]) if io_start and io_end else None,
+                "write_bytes": (io_end[1] - io_start[1]) if io_start and io_end else None,
+                "llm": llm,
+            })
+            (self.directories if rel_path is not None else self.stages).append(entry)
+            _observe(entry)
+
+    def record_llm_usage(self, prompt_tokens: int, completion_tokens: int) -> None:
+        if not self._llm_stack:
+            return
+        llm = self._llm_stack[-1]
+        llm["calls"] += 1
+        llm["prompt_tokens"] += int(prompt_tokens or 0)
+        llm["completion_tokens"] += int(completion_tokens or 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        totals = _empty_llm()
+        for s in self.stages:
+            for k, v in s["llm"].items():
+                totals[k] += v
+        return {
+            "schema_version": "1.0",
+            "total_wall_ms": round((time.perf_counter() - self._started) * 1000.0, 3),
+            "stages": self.stages,
+            "directories": self.directories,
+            "llm_totals": totals,
+        }
+
+
+@contextmanager
+def run_metrics(run_id: str) -> Iterator[RunMetrics]:
+    """Bind a RunMetrics to the current thread so services (e.g. llm_service) can report into it."""
+    metrics = RunMetrics(run_id)
+    prev = getattr(_local, "metrics", None)
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = prev
+        with _registry_lock:
+            _runs_total[metrics.status if metrics.status in _runs_total else "error"] += 1
+
+
+def current_metrics() -> RunMetrics | None:
+    return getattr(_local, "metrics", None)
+
+
+def record_llm_usage(prompt_tokens: int, completion_tokens: int) -> None:
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.record_llm_usage(prompt_tokens, completion_tokens)
+
+
+def _observe(entry: Dict[str, Any]) -> None:
+    stage = entry["stage"]
+    llm = entry.get("llm") or {}
+    with _registry_lock:
+        def add(field: str, value: float | None) -> None:
+            if value is None:
+                return
+            _registry[(stage, field)] = _registry.get((stage, field), 0.0) + float(value)
+        add("runs", 1)
+        add("wall_seconds", entry.get("wall_ms", 0.0) / 1000.0)
+        add("cpu_seconds", entry.get("cpu_ms", 0.0) / 1000.0)
+        add("child_cpu_seconds", (entry["child_cpu_ms"] / 1000.0) if entry.get("child_cpu_ms") is not None else None)
+        add("read_bytes", entry.get("read_bytes"))
+        add("write_bytes", entry.get("write_bytes"))
+        add("llm_calls", llm.get("calls", 0))
+        add("prompt_tokens", llm.get("prompt_tokens", 0))
+        add("completion_tokens", llm.get("completion_tokens", 0))
+
+
+_PROM_FIELDS = (
+    ("runs", "gtm_stage_runs_total", "counter", "Completed executions of a pipeline stage."),
+    ("wall_seconds", "gtm_stage_wall_seconds_total", "counter", "Wall-clock seconds spent in a pipeline stage."),
+    ("cpu_seconds", "gtm_stage_cpu_seconds_total", "counter", "Request-thread CPU seconds spent in a pipeline stage."),
+    ("child_cpu_seconds", "gtm_stage_child_cpu_seconds_total", "counter", "Subprocess (git, node) CPU seconds reaped during a pipeline stage."),
+    ("read_bytes", "gtm_stage_read_bytes_total", "counter", "Bytes read by the process while a stage ran."),
+    ("write_bytes", "gtm_stage_write_bytes_total", "counter", "Bytes written by the process while a stage ran."),
+    ("llm_calls", "gtm_stage_llm_calls_total", "counter", "LLM calls issued from a stage."),
+    ("prompt_tokens", "gtm_stage_llm_prompt_tokens_total", "counter", "LLM prompt tokens consumed by a stage."),
+    ("completion_tokens", "gtm_stage_llm_completion_tokens_total", "counter", "LLM completion tokens consumed by a stage."),
+)
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        snapshot = dict(_registry)
+        runs = dict(_runs_total)
+    lines: List[str] = [
+        "# HELP gtm_analyze_runs_total Finished /local/pr/analyze runs by outcome: done, rejected (404/409) or error.",
+        "# TYPE gtm_analyze_runs_total counter",
+    ]
+    lines += [f'gtm_analyze_runs_total{{status="{status}"}} {runs[status]}' for status in RUN_STATUSES]
+    stages = sorted({s for (s, _) in snapshot})
+    for field, metric, mtype, help_text in _PROM_FIELDS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {mtype}")
+        for s in stages:
+            if (s, field) in snapshot:
+                lines.append(f'{metric}{{stage="{s}"}} {snapshot[(s, field)]:g}')
+    peak = _peak_rss_kb()
+    if peak is not None:
+        lines += [
+            "# HELP gtm_process_peak_rss_kb Peak resident set size of the server process.",
+            "# TYPE gtm_process_peak_rss_kb gauge",
+            f"gtm_process_peak_rss_kb {peak}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def maybe_profile(mode: str | bool | None, out_dir: Path) -> Iterator[None]:
+    """Opt-in per-run profile capture. mode: falsy (off), True/"cprofile", or "pyinstrument".
+    Writes profile.pstats + profile.txt (cProfile) or profile.html (pyinstrument) into out_dir.
+    """
+    if not mode:
+        yield
+        return
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+        if Profiler is not None:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                out_dir.mkdir(parents=True, exist_ok=True)
+                (out_dir / "profile.html").write_text(profiler.output_html(), encoding="utf-8")
+            return
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(out_dir / "profile.pstats"))
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(60)
+        (out_dir / "profile.txt").write_text(buf.getvalue(), encoding="utf-8")
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any
+
+
+OBJECTS_DIR = "objects"
+# blobs younger than this are never collected: a writer may have stored one and not linked it yet
+GC_GRACE_SECONDS = 3600
+
+
+def objects_dir_for(repo_id: str) -> Path:
+    return Path("results") / repo_id / OBJECTS_DIR
+
+
+def blob_path(objects_dir: Path, digest: str) -> Path:
+    return objects_dir / digest[:2] / digest[2:]
+
+
+def _tmp_name(target: Path) -> Path:
+    return target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _store_blob(blob: Path, raw: bytes) -> None:
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_name(blob)
+    tmp.write_bytes(raw)
+    os.replace(tmp, blob)
+
+
+def write_shard(path: Path, data: str, objects_dir: Path | None, stats: Dict[str, int] | None = None) -> str:
+    """Write a shard file, content-addressed when objects_dir is given.
+
+    With a store, the shard path becomes a hardlink to objects/{sha[:2]}/{sha[2:]}: an existing blob is
+    never rewritten and a shard already linked to the right blob is left untouched. Returns
+    "unchanged", "linked" (blob reused) or "written". Shards are always replaced via rename, never
+    rewritten in place, because their inode may be shared with other runs.
+    """
+    raw = data.encode("utf-8")
+    if objects_dir is None:
+        tmp = _tmp_name(path)
+        tmp.write_bytes(raw)
+        os.replace(tmp, path)
+        status = "written"
+    else:
+        blob = blob_path(objects_dir, hashlib.sha256(raw).hexdigest())
+        status = "linked"
+        try:
+            b = blob.stat()
+            try:
+                p = path.stat()
+                if (p.st_dev, p.st_ino) == (b.st_dev, b.st_ino):
+                    status = "unchanged"
+            except FileNotFoundError:
+                pass
+        except FileNotFoundError:
+            _store_blob(blob, raw)
+            status = "written"
+        if status != "unchanged":
+            tmp = _tmp_name(path)
+            try:
+                os.link(blob, tmp)
+            except FileNotFoundError:
+                # collected between the stat and the link: store it again
+                _store_blob(blob, raw)
+                os.link(blob, tmp)
+            except OSError:
+                # different filesystem or link limit: fall back to a private copy
+                shutil.copyfile(blob, tmp)
+            os.replace(tmp, path)
+    if stats is not None:
+        stats[status] = stats.get(status, 0) + 1
+    return status
+
+
+def gc_objects(objects_dir: Path, dry_run: bool = False, now: float | None = None) -> Dict[str, Any]:
+    """Delete blobs no shard links to any more (link count 1) once past the grace period."""
+    now = time.time() if now is None else now
+    removed = 0
+    reclaimed = 0
+    if not objects_dir.is_dir():
+        return {"blobs_removed": 0, "bytes_reclaimed": 0}
+    for fan in objects_dir.iterdir():
+        if not fan.is_dir():
+            continue
+        for blob in fan.iterdir():
+            try:
+                st = blob.stat()
+            except OSError:
+                continue
+            if blob.name.startswith(".") or st.st_nlink > 1 or now - st.st_mtime < GC_GRACE_SECONDS:
+                continue
+            if not dry_run:
+                try:
+                    blob.unlink()
+                except OSError:
+                    continue
+            removed += 1
+            reclaimed += st.st_size
+    return {"blobs_removed": removed, "bytes_reclaimed": reclaimed}
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+from server.services.run_index_service import forget_runs
+from server.services.run_io_service import RUNS_LOCK, repo_lock
+from server.services.object_store_service import OBJECTS_DIR, gc_objects
+from server.services.stage_cache_service import MEMO_DIR, prune_memo
+from server.services.trace_service import TRACE_ROOT, prune_traces
+
+
+RESULTS_ROOT = Path("results")
+POLICY_FILE = "retention.json"
+RUN_KINDS = ("shadow_diff", "analysis")
+# a run directory is complete (and its files immutable) once its marker exists
+COMPLETE_MARKER = {"shadow_diff": "_run.json", "analysis": "manifest.json"}
+
+
+def default_policy() -> Dict[str, Any]:
+    """Env defaults, applied to each run kind; 0 disables a limit."""
+    base = {
+        "max_age_days": float(os.environ.get("RETENTION_MAX_AGE_DAYS", "30")),
+        "max_runs": int(os.environ.get("RETENTION_MAX_RUNS", "200")),
+        "max_bytes": int(os.environ.get("RETENTION_MAX_BYTES", "0")),
+        "min_keep": int(os.environ.get("RETENTION_MIN_KEEP", "1")),
+    }
+    return {kind: dict(base) for kind in RUN_KINDS}
+
+
+def load_policy(repo_dir: Path) -> Dict[str, Any]:
+    """Defaults overlaid with results/{repo_id}/retention.json ({"shadow_diff": {...}, "analysis": {...}})."""
+    policy = default_policy()
+    p = repo_dir / POLICY_FILE
+    if p.exists():
+        try:
+            override = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            override = {}
+        for kind in RUN_KINDS:
+            policy[kind].update({k: v for k, v in (override.get(kind) or {}).items() if k in policy[kind]})
+    return policy
+
+
+def _run_time(run_dir: Path) -> float:
+    try:
+        return datetime.strptime(run_dir.name[:16], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return run_dir.stat().st_mtime
+
+
+def _dir_usage(d: Path) -> int:
+    # bytes under d, counting hardlinked inodes once
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(d):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key in seen:
+                continue
+            seen.add(key)
+            total += st.st_size
+    return total
+
+
+def _referenced_diff_runs(analysis_runs: List[Path]) -> set:
+    refs = set()
+    for d in analysis_runs:
+        try:
+            refs.add(json.loads((d / "manifest.json").read_text(encoding="utf-8")).get("diff_run_id"))
+        except Exception:
+            continue
+    return refs
+
+
+def select_expired(runs: List[Path], policy: Dict[str, Any], now: float, protected: set = frozenset()) -> List[Tuple[Path, str]]:
+    """Apply count, age and size limits newest-first; returns (run_dir, reason) to delete."""
+    ordered = sorted(runs, key=lambda d: d.name, reverse=True)
+    max_runs = int(policy.get("max_runs") or 0)
+    max_age = float(policy.get("max_age_days") or 0) * 86400.0
+    max_bytes = int(policy.get("max_bytes") or 0)
+    min_keep = int(policy.get("min_keep") or 0)
+    expired: List[Tuple[Path, str]] = []
+    kept = 0
+    used = 0
+    for d in ordered:
+        reason = None
+        size = _dir_usage(d) if max_bytes else 0
+        if kept >= min_keep and d.name not in protected:
+            if max_runs and kept >= max_runs:
+                reason = "count"
+            elif max_age and now - _run_time(d) > max_age:
+                reason = "age"
+            elif max_bytes and used + size > max_bytes:
+                reason = "size"
+        if reason:
+            expired.append((d, reason))
+        else:
+            kept += 1
+            used += size
+    return expired
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dedupe_runs(run_dirs: List[Path], dry_run: bool = False) -> Dict[str, Any]:
+    """Hardlink byte-identical files across completed run directories; returns files linked and bytes reclaimed."""
+    by_size: Dict[int, List[Path]] = {}
+    for d in run_dirs:
+        for root, _, files in os.walk(d):
+            for name in files:
+                p = Path(root) / name
+                try:
+                    by_size.setdefault(p.stat().st_size, []).append(p)
+                except OSError:
+                    continue
+    linked = 0
+    reclaimed = 0
+    for size, paths in by_size.items():
+        if len(paths) < 2 or size == 0:
+            continue
+        canonical: Dict[str, Path] = {}
+        for p in paths:
+            try:
+                digest = _file_digest(p)
+                first = canonical.setdefault(digest, p)
+                if first is p:
+                    continue
+                a, b = first.stat(), p.stat()
+                if (a.st_dev, a.st_ino) == (b.st_dev, b.st_ino) or a.st_dev != b.st_dev:
+                    continue
+                if not dry_run:
+                    tmp = p.with_name(f".{p.name}.link.{os.getpid()}")
+                    os.link(first, tmp)
+                    os.replace(tmp, p)
+                linked += 1
+                # the replaced inode is only freed if nothing else links to it
+                if b.st_nlink == 1:
+                    reclaimed += size
+            except OSError:
+                continue
+    return {"files_linked": linked, "bytes_reclaimed": reclaimed}
+
+
+def compact_repo(repo_dir: Path, dry_run: bool = False, dedupe: bool = True, now: float | None = None) -> Dict[str, Any]:
+    """Apply the repo's retention policy to shadow_diff/ and analysis/ runs, then dedupe what is kept.
+    Waits for in-flight analyses of the repo (RUNS_LOCK).
+    """
+    with repo_lock(repo_dir.name, RUNS_LOCK, results_root=repo_dir.parent):
+        return _compact_repo(repo_dir, dry_run, dedupe, now)
+
+
+def _compact_repo(repo_dir: Path, dry_run: bool, dedupe: bool, now: float | None) -> Dict[str, Any]:
+    now = time.time() if now is None else now
+    policy = load_policy(repo_dir)
+    runs = {
+        kind: [d for d in (repo_dir / kind).iterdir() if d.is_dir() and (d / COMPLETE_MARKER[kind]).exists()] if (repo_dir / kind).is_dir() else []
+        for kind in RUN_KINDS
+    }
+    before = _dir_usage(repo_dir)
+    out: Dict[str, Any] = {"repo_id": repo_dir.name, "policy": policy, "deleted": {}, "dry_run": dry_run}
+
+    expired_analysis = select_expired(runs["analysis"], policy["analysis"], now)
+    kept_analysis = [d for d in runs["analysis"] if d not in {e[0] for e in expired_analysis}]
+    # a kept analysis keeps the shadow diff run it points at (file_content / reuse read from it)
+    protected = _referenced_diff_runs(kept_analysis)
+    expired_diff = select_expired(runs["shadow_diff"], policy["shadow_diff"], now, protected=protected)
+
+    for kind, expired in (("analysis", expired_analysis), ("shadow_diff", expired_diff)):
+        out["deleted"][kind] = [{"run_id": d.name, "reason": reason} for d, reason in expired]
+        if not dry_run:
+            for d, _ in expired:
+                shutil.rmtree(d, ignore_errors=True)
+    if not dry_run and expired_analysis:
+        try:
+            forget_runs(repo_dir.name, [d.name for d, _ in expired_analysis])
+        except Exception:
+            pass
+
+    # shards of deleted runs were hardlinks; blobs nothing links to any more can go
+    out["objects"] = gc_objects(repo_dir / OBJECTS_DIR, dry_run=dry_run, now=now)
+    # memo entries are touched on every hit, so age is time since last use
+    out["memo"] = prune_memo(repo_dir / MEMO_DIR, float(os.environ.get("RETENTION_MEMO_MAX_AGE_DAYS", "14")), dry_run=dry_run, now=now)
+    if dedupe:
+        remaining = [d for kind in RUN_KINDS for d in runs[kind] if d.exists() and d not in {e[0] for e in expired_analysis + expired_diff}]
+        out["dedupe"] = dedupe_runs(remaining, dry_run=dry_run)
+    after = _dir_usage(repo_dir)
+    out["bytes_before"] = before
+    out["bytes_after"] = after
+    if dry_run:
+        doomed = sum(_dir_usage(d) for d, _ in expired_analysis + expired_diff)
+        out["bytes_reclaimed"] = doomed + (out.get("dedupe") or {}).get("bytes_reclaimed", 0) + out["memo"]["bytes_reclaimed"]
+    else:
+        out["bytes_reclaimed"] = max(0, before - after)
+    return out
+
+
+def compact_results(
+    results_root: str | Path = RESULTS_ROOT,
+    repo_id: str | None = None,
+    dry_run: bool = False,
+    dedupe: bool = True,
+    trace_root: str | Path = TRACE_ROOT,
+) -> Dict[str, Any]:
+    """Compact every repo (or one) under results_root, then prune prompt traces, which are per run
+    rather than per repo, after RETENTION_TRACE_MAX_AGE_DAYS without writes.
+    """
+    root = Path(results_root)
+    if repo_id:
+        repos = [root / repo_id] if (root / repo_id).is_dir() else []
+    else:
+        repos = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("_")) if root.exists() else []
+    started = time.time()
+    reports = [compact_repo(r, dry_run=dry_run, dedupe=dedupe) for r in repos]
+    traces = prune_traces(float(os.environ.get("RETENTION_TRACE_MAX_AGE_DAYS", "14")), Path(trace_root), dry_run=dry_run)
+    return {
+        "schema_version": "1.0",
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "duration_ms": round((time.time() - started) * 1000.0, 3),
+        "bytes_reclaimed": sum(r["bytes_reclaimed"] for r in reports) + traces["bytes_reclaimed"],
+        "repos": reports,
+        "traces": traces,
+    }
+
+
+_last_report: Dict[str, Any] | None = None
+_compaction_lock = threading.Lock()
+_thread: threading.Thread | None = None
+
+
+def run_compaction(results_root: str | Path = RESULTS_ROOT, repo_id: str | None = None, dry_run: bool = False) -> Dict[str, Any]:
+    """Serialized compaction pass; the last non-dry-run report is kept for /retention/status."""
+    global _last_report
+    with _compaction_lock:
+        report = compact_results(results_root, repo_id=repo_id, dry_run=dry_run)
+        if not dry_run:
+            _last_report = report
+    return report
+
+
+def last_compaction() -> Dict[str, Any] | None:
+    return _last_report
+
+
+def start_background_compaction(interval_seconds: float, results_root: str | Path = RESULTS_ROOT) -> bool:
+    """Start the periodic compaction thread once per process (RETENTION_INTERVAL_SECONDS > 0)."""
+    global _thread
+    if interval_seconds <= 0 or (_thread is not None and _thread.is_alive()):
+        return False
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                run_compaction(results_root)
+            except Exception:
+                pass
+
+    _thread = threading.Thread(target=loop, name="results-compaction", daemon=True)
+    _thread.start()
+    return True
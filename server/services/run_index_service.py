@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List
+
+
+DEFAULT_INDEX_PATH = str(Path("results") / "_index" / "runs.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    repo_id TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    score INTEGER,
+    rank INTEGER,
+    risk_level TEXT,
+    diff_run_id TEXT,
+    files_changed INTEGER,
+    output_dir TEXT,
+    PRIMARY KEY (repo_id, run_id)
+);
+CREATE INDEX IF NOT EXISTS runs_rank ON runs (rank, created_at);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at);
+CREATE TABLE IF NOT EXISTS run_paths (
+    repo_id TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (repo_id, run_id, path)
+);
+CREATE INDEX IF NOT EXISTS run_paths_path ON run_paths (path);
+CREATE TABLE IF NOT EXISTS run_violations (
+    repo_id TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    violation_id TEXT NOT NULL,
+    PRIMARY KEY (repo_id, run_id, violation_id)
+);
+CREATE INDEX IF NOT EXISTS run_violations_id ON run_violations (violation_id);
+"""
+
+
+def index_path() -> Path:
+    return Path(os.environ.get("RUN_INDEX_DB", DEFAULT_INDEX_PATH))
+
+
+def _connect() -> sqlite3.Connection:
+    p = index_path()
+    p.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(p), timeout=10.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _created_at(run_id: str, fallback: float | None = None) -> str:
+    # run ids are UTC timestamps (%Y%m%dT%H%M%SZ, optionally with a suffix); otherwise use the mtime
+    try:
+        ts = datetime.strptime(run_id[:16], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    except ValueError:
+        ts = datetime.fromtimestamp(fallback, tz=timezone.utc) if fallback else datetime.now(timezone.utc)
+    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _run_rows(repo_id: str, run_id: str, report: Dict[str, Any], diff_bundle: Dict[str, Any] | None, output_dir: str, created_at: str, diff_run_id: str | None):
+    paths = set()
+    for f in (diff_bundle or {}).get("files", []):
+        for key in ("path", "old_path"):
+            if f.get(key):
+                paths.add(f[key])
+    if not paths:
+        # runs without a stored diff bundle: fall back to the paths the report itself names
+        paths.update((report.get("scope", {}) or {}).get("out_of_scope_files", []))
+        paths.update(p for p in (report.get("feature_summary", {}) or {}).get("config_drift", []) if p != "<unknown>")
+        paths.update(d.get("rel_path") for d in report.get("per_directory", []) or [] if d.get("rel_path"))
+    violation_ids = {v.get("id") for v in report.get("policy_violations", []) or [] if v.get("id")}
+    violation_ids.update(v.get("rule_id") for v in (report.get("rules", {}) or {}).get("violations", []) or [] if v.get("rule_id"))
+    run = (
+        repo_id, run_id, created_at, report.get("score"), report.get("rank"), report.get("risk_level"),
+        diff_run_id, len((diff_bundle or {}).get("files", [])) or None, output_dir,
+    )
+    return run, sorted(paths), sorted(violation_ids)
+
+
+def index_run(repo_id: str, run_id: str, report: Dict[str, Any], diff_bundle: Dict[str, Any] | None, output_dir: str, diff_run_id: str | None = None, created_at: str | None = None) -> None:
+    """Upsert one finished analysis into the run index."""
+    run, paths, violation_ids = _run_rows(repo_id, run_id, report, diff_bundle, output_dir, created_at or _created_at(run_id), diff_run_id)
+    conn = _connect()
+    try:
+        with conn:
+            _write_run(conn, run, paths, violation_ids)
+    finally:
+        conn.close()
+
+
+def _write_run(conn: sqlite3.Connection, run, paths: List[str], violation_ids: List[str]) -> None:
+    repo_id, run_id = run[0], run[1]
+    conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", run)
+    conn.execute("DELETE FROM run_paths WHERE repo_id = ? AND run_id = ?", (repo_id, run_id))
+    conn.execute("DELETE FROM run_violations WHERE repo_id = ? AND run_id = ?", (repo_id, run_id))
+    conn.executemany("INSERT OR IGNORE INTO run_paths VALUES (?, ?, ?)", [(repo_id, run_id, p) for p in paths])
+    conn.executemany("INSERT OR IGNORE INTO run_violations VALUES (?, ?, ?)", [(repo_id, run_id, v) for v in violation_ids])
+
+
+def forget_runs(repo_id: str, run_ids: List[str]) -> int:
+    """Drop runs (e.g. deleted by retention) from the index; returns rows removed."""
+    if not run_ids:
+        return 0
+    conn = _connect()
+    try:
+        with conn:
+            keys = [(repo_id, r) for r in run_ids]
+            conn.executemany("DELETE FROM run_paths WHERE repo_id = ? AND run_id = ?", keys)
+            conn.executemany("DELETE FROM run_violations WHERE repo_id = ? AND run_id = ?", keys)
+            return conn.executemany("DELETE FROM runs WHERE repo_id = ? AND run_id = ?", keys).rowcount
+    finally:
+        conn.close()
+
+
+def backfill(results_root: str = "results", repo_id: str | None = None) -> Dict[str, Any]:
+    """Import existing results/{repo_id}/analysis/{run_id} directories into the index."""
+    root = Path(results_root)
+    if repo_id:
+        repos = [root / repo_id]
+    else:
+        repos = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("_")) if root.exists() else []
+    indexed = 0
+    errors: List[str] = []
+    conn = _connect()
+    try:
+        for repo in repos:
+            runs = repo / "analysis"
+            if not runs.is_dir():
+                continue
+            with conn:
+                for d in sorted(runs.iterdir()):
+                    report_path = d / "report.json"
+                    if not report_path.exists():
+                        continue
+                    try:
+                        report = json.loads(report_path.read_text(encoding="utf-8"))
+                        diff_bundle = json.loads((d / "diff_bundle.json").read_text(encoding="utf-8")) if (d / "diff_bundle.json").exists() else None
+                        manifest = json.loads((d / "manifest.json").read_text(encoding="utf-8")) if (d / "manifest.json").exists() else {}
+                        rows = _run_rows(repo.name, d.name, report, diff_bundle, str(d), _created_at(d.name, report_path.stat().st_mtime), manifest.get("diff_run_id"))
+                        _write_run(conn, *rows)
+                        indexed += 1
+                    except Exception as e:
+                        errors.append(f"{d}: {e}")
+    finally:
+        conn.close()
+    return {"indexed": indexed, "errors": errors, "index": str(index_path())}
+
+
+def query_runs(
+    repo_id: str | None = None,
+    path: str | None = None,
+    rank: int | None = None,
+    risk_level: str | None = None,
+    violation_id: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Newest-first runs matching all given filters. path matches the file itself or anything under it."""
+    where: List[str] = []
+    args: List[Any] = []
+    if repo_id:
+        where.append("r.repo_id = ?")
+        args.append(repo_id)
+    if rank is not None:
+        where.append("r.rank = ?")
+        args.append(rank)
+    if risk_level:
+        where.append("r.risk_level = ?")
+        args.append(risk_level)
+    if since:
+        where.append("r.created_at >= ?")
+        args.append(since)
+    if until:
+        where.append("r.created_at < ?")
+        args.append(until)
+    if path:
+        prefix = path.rstrip("/")
+        # range scan on the path index: exact file, or prefix + "/" .. prefix + "0" ("0" sorts right after "/")
+        where.append(
+            "EXISTS (SELECT 1 FROM run_paths p WHERE p.repo_id = r.repo_id AND p.run_id = r.run_id"
+            " AND (p.path = ? OR (p.path >= ? AND p.path < ?)))"
+        )
+        args.extend([prefix, prefix + "/", prefix + "0"])
+    if violation_id:
+        where.append("EXISTS (SELECT 1 FROM run_violations v WHERE v.repo_id = r.repo_id AND v.run_id = r.run_id AND v.violation_id = ?)")
+        args.append(violation_id)
+    sql = "SELECT r.* FROM runs r"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY r.created_at DESC, r.run_id DESC LIMIT ?"
+    args.append(max(1, min(int(limit), 1000)))
+    conn = _connect()
+    try:
+        rows = [dict(row) for row in conn.execute(sql, args)]
+        for row in rows:
+            row["violation_ids"] = [v[0] for v in conn.execute(
+                "SELECT violation_id FROM run_violations WHERE repo_id = ? AND run_id = ? ORDER BY violation_id", (row["repo_id"], row["run_id"]))]
+    finally:
+        conn.close()
+    return rows
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+LOCKS_DIR = ".locks"
+# analyses hold this repo lock shared while they run (they may be reading an older shadow_diff run that
+# no finished manifest references yet); compaction takes it exclusively, which also serializes the
+# passes of several worker processes over one repo
+RUNS_LOCK = "runs"
+
+
+def new_run_id() -> str:
+    """Sortable, collision-free run id: UTC second (as before), microseconds, random suffix.
+
+    The first 16 characters stay %Y%m%dT%H%M%SZ so timestamp parsing of run ids keeps working.
+    """
+    now = datetime.now(timezone.utc)
+    return f"{now.strftime('%Y%m%dT%H%M%SZ')}-{now.microsecond:06d}{secrets.token_hex(2)}"
+
+
+def reserve_run_dir(parent: Path) -> tuple[str, Path]:
+    """Create a fresh run directory under parent; mkdir without exist_ok makes the claim exclusive."""
+    parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        run_id = new_run_id()
+        d = parent / run_id
+        try:
+            d.mkdir()
+            return run_id, d
+        except FileExistsError:
+            continue
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    # readers (and concurrent runs) see either the old file or the complete new one
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_json(path: Path, obj: Any, indent: int | None = 2) -> None:
+    atomic_write_text(path, json.dumps(obj, indent=indent))
+
+
+@contextmanager
+def repo_lock(repo_id: str, name: str, shared: bool = False, results_root: str | Path = "results") -> Iterator[None]:
+    """Inter-process lock on {results_root}/{repo_id}/.locks/{name}.lock (flock; released on exit or crash),
+    exclusive unless shared: shared holders run together and exclude an exclusive one.
+
+    Threads in one process are serialized too, since flock is per open file description.
+    """
+    lock_dir = Path(results_root) / repo_id / LOCKS_DIR
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    with (lock_dir / f"{name}.lock").open("a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
@@ -4,12 +4,17 @@ import json
 from pathlib import Path
 from typing import Dict, Any, List, Tuple, Set
 
+from server.services.git_source_service import GitPath, absolute_root, tree_root
+from server.services.object_store_service import write_shard
+from server.services.run_io_service import atomic_write_json
+from server.services.worker_pool_service import parallel_map
+
 
 MAX_NO_CHANGE_LIST = 500
 MAX_HUNK_TEXT_PER_FILE = 4000
 
 
-def _list_dir(local_root: Path) -> Tuple[List[Dict[str, Any]], List[str]]:
+def _list_dir(local_root: Path | GitPath) -> Tuple[List[Dict[str, Any]], List[str]]:
     files: List[Dict[str, Any]] = []
     children: List[str] = []
     for entry in sorted(local_root.iterdir(), key=lambda p: p.name):
@@ -26,12 +31,12 @@ def _list_dir(local_root: Path) -> Tuple[List[Dict[str, Any]], List[str]]:
     return files, children
 
 
-def _rel_to_repo(repo_dir: str, path: Path) -> str:
-    return path.resolve().relative_to(Path(repo_dir).resolve()).as_posix()
+def _rel_to_repo(repo_dir: str | GitPath, path: Path | GitPath) -> str:
+    return path.resolve().relative_to(tree_root(repo_dir).resolve()).as_posix()
 
 
-def _gather_tree_dirs(repo_dir: str) -> List[str]:
-    root = Path(repo_dir)
+def _gather_tree_dirs(repo_dir: str | GitPath) -> List[str]:
+    root = tree_root(repo_dir)
     dirs: List[str] = [""]
     for p in root.rglob("*"):
         if p.name.startswith(".git"):
@@ -76,14 +81,66 @@ def _prune_deps_for_subtree(deps: Dict[str, Any], subtree: str) -> Dict[str, Any
     return {"schema_version": deps.get("schema_version", "1.0"), "nodes": nodes, "edges": edges}
 
 
-def build_shadow_knowledge(repo_dir: str, out_dir: str) -> Dict[str, Any]:
+def _write_knowledge_dir(task: Tuple[Path | GitPath, str, str, Dict[str, Any], Dict[str, Any], str | None]) -> Tuple[int, Dict[str, int]]:
+    """Write one directory's SKT shards (worker-pool task); returns (files listed, shard write stats)."""
+    root, out_root, rel, api_pruned, deps_pruned, objects_dir = task
+    root_out = Path(out_root)
+    store = Path(objects_dir) if objects_dir else None
+    writes: Dict[str, int] = {}
+    real_dir = root if rel == "" else (root / rel)
+    shadow_dir = root_out if rel == "" else (root_out / rel)
+    shadow_dir.mkdir(parents=True, exist_ok=True)
+    files, children = _list_dir(real_dir)
+
+    # classify kinds for files
+    for f in files:
+        name = f.get("name", "").lower()
+        kinds: List[str] = []
+        if name.endswith((".ts", ".tsx", ".js", ".jsx", ".mjs", ".py", ".go", ".rs")):
+            kinds.append("code")
+        if name.endswith((".md", ".rst")) or name.startswith("readme"):
+            kinds.append("docs")
+        if name.endswith((".sh", ".bash")) or name.startswith("scripts/"):
+            kinds.append("scripts")
+        if name in {"package.json", "pnpm-lock.yaml", "yarn.lock", "requirements.txt", "pyproject.toml", ".env", ".env.example", "Dockerfile"}:
+            kinds.append("config")
+        f["kinds"] = kinds
+
+    parent_meta = (".." + "/_dir.meta.json") if rel != "" else None
+    children_meta = [
+        {"name": c, "rel_path": (rel + "/" + c if rel else c), "meta": f"{c}/_dir.meta.json"}
+        for c in children
+    ]
+
+    # write pruned knowledge for subtree
+    write_shard(shadow_dir / "api_exports.json", json.dumps(api_pruned, indent=2), store, writes)
+    write_shard(shadow_dir / "deps_subgraph.json", json.dumps(deps_pruned, indent=2), store, writes)
+
+    meta = {
+        "schema_version": "1.0",
+        "dir_name": (real_dir.name if rel != "" else "root"),
+        "rel_path": rel,
+        "parent_meta": parent_meta,
+        "children": children_meta,
+        "files": files,
+        "links": {
+            "api_exports": "api_exports.json",
+            "deps_subgraph": "deps_subgraph.json",
+        },
+    }
+    write_shard(shadow_dir / "_dir.meta.json", json.dumps(meta, indent=2), store, writes)
+    return len(files), writes
+
+
+def build_shadow_knowledge(repo_dir: str | GitPath, out_dir: str, objects_dir: str | None = None) -> Dict[str, Any]:
     """Construct a shadow knowledge tree with per-directory meta and pruned knowledge.
-    Writes files to out_dir mirroring the directory layout.
+    Writes files to out_dir mirroring the directory layout; with objects_dir, shards are
+    hardlinks into that content-addressed store and unchanged shards are not rewritten.
     """
     # Load base knowledge artifacts if present (optional)
     from server.services.knowledge_service import generate_repo_knowledge, load_knowledge_bundle
 
-    repo_id = Path(repo_dir).name
+    repo_id = tree_root(repo_dir).name
     # Ensure we have a knowledge bundle to prune from
     kb_dir = Path("results") / repo_id / "knowledge"
     kb_dir.mkdir(parents=True, exist_ok=True)
@@ -93,61 +150,24 @@ def build_shadow_knowledge(repo_dir: str, out_dir: str) -> Dict[str, Any]:
     api_surface = bundle.get("api_surface", {"schema_version": "1.0", "exports": []})
     deps = bundle.get("deps", {"schema_version": "1.0", "nodes": [], "edges": []})
 
-    root_out = Path(out_dir)
+    # tasks carry absolute paths: pool workers do not share this process's cwd
+    root_out = Path(out_dir).resolve()
     root_out.mkdir(parents=True, exist_ok=True)
-    root = Path(repo_dir)
-
-    total_dirs = 0
+    root = absolute_root(repo_dir)
+    store = Path(objects_dir).resolve() if objects_dir else None
+    writes: Dict[str, int] = {}
+
+    # pruning reads the whole bundle, so it stays here; listing and serializing each directory fans out
+    tasks = [
+        (root, str(root_out), rel, _prune_api_for_subtree(api_surface, rel), _prune_deps_for_subtree(deps, rel), str(store) if store else None)
+        for rel in _gather_tree_dirs(repo_dir)
+    ]
+    total_dirs = len(tasks)
     total_files = 0
-
-    for rel in _gather_tree_dirs(repo_dir):
-        total_dirs += 1
-        real_dir = root if rel == "" else (root / rel)
-        shadow_dir = root_out if rel == "" else (root_out / rel)
-        shadow_dir.mkdir(parents=True, exist_ok=True)
-        files, children = _list_dir(real_dir)
-        total_files += len([f for f in files])
-
-        # classify kinds for files
-        for f in files:
-            name = f.get("name", "").lower()
-            kinds: List[str] = []
-            if name.endswith((".ts", ".tsx", ".js", ".jsx", ".mjs", ".py", ".go", ".rs")):
-                kinds.append("code")
-            if name.endswith((".md", ".rst")) or name.startswith("readme"):
-                kinds.append("docs")
-            if name.endswith((".sh", ".bash")) or name.startswith("scripts/"):
-                kinds.append("scripts")
-            if name in {"package.json", "pnpm-lock.yaml", "yarn.lock", "requirements.txt", "pyproject.toml", ".env", ".env.example", "Dockerfile"}:
-                kinds.append("config")
-            f["kinds"] = kinds
-
-        parent_meta = (".." + "/_dir.meta.json") if rel != "" else None
-        children_meta = [
-            {"name": c, "rel_path": (rel + "/" + c if rel else c), "meta": f"{c}/_dir.meta.json"}
-            for c in children
-        ]
-
-        # write pruned knowledge for subtree
-        subtree = rel
-        api_pruned = _prune_api_for_subtree(api_surface, subtree)
-        deps_pruned = _prune_deps_for_subtree(deps, subtree)
-        (shadow_dir / "api_exports.json").write_text(json.dumps(api_pruned, indent=2), encoding="utf-8")
-        (shadow_dir / "deps_subgraph.json").write_text(json.dumps(deps_pruned, indent=2), encoding="utf-8")
-
-        meta = {
-            "schema_version": "1.0",
-            "dir_name": (real_dir.name if rel != "" else "root"),
-            "rel_path": rel,
-            "parent_meta": parent_meta,
-            "children": children_meta,
-            "files": files,
-            "links": {
-                "api_exports": "api_exports.json",
-                "deps_subgraph": "deps_subgraph.json",
-            },
-        }
-        (shadow_dir / "_dir.meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    for n_files, dir_writes in parallel_map(_write_knowledge_dir, tasks):
+        total_files += n_files
+        for status, n in dir_writes.items():
+            writes[status] = writes.get(status, 0) + n
 
     index = {
         "schema_version": "1.0",
@@ -155,8 +175,9 @@ def build_shadow_knowledge(repo_dir: str, out_dir: str) -> Dict[str, Any]:
         "root_meta": "_dir.meta.json",
         "generated_at": __import__("datetime").datetime.utcnow().isoformat() + "Z",
         "counts": {"dirs": total_dirs, "files": total_files},
+        "shard_writes": writes,
     }
-    (root_out / "_index.json").write_text(json.dumps(index, indent=2), encoding="utf-8")
+    atomic_write_json(root_out / "_index.json", index)
     return index
 
 
@@ -188,95 +209,115 @@ def _partition_changes_by_dir(diff_bundle: Dict[str, Any]) -> Dict[str, List[Dic
     return by_dir
 
 
-def build_shadow_diff(base_dir: str, head_dir: str, diff_bundle: Dict[str, Any], shadow_root: str) -> Dict[str, Any]:
+def _list_file_names(p: Path | GitPath) -> List[str]:
+    # enumerate directory listing for no_change entries
+    names: List[str] = []
+    if p.exists() and p.is_dir():
+        for e in sorted(p.iterdir(), key=lambda x: x.name):
+            if e.name.startswith(".git"):
+                continue
+            if e.is_file():
+                names.append(e.name)
+    return names
+
+
+def _write_diff_dir(task: Tuple[Path | GitPath, str, str, List[Dict[str, Any]], str | None]) -> Tuple[int, Dict[str, int]]:
+    """Write one directory's _dir.diff.json (worker-pool task); returns (changed files listed, shard write stats).
+    The shard holds only this directory's changes, so it is byte-identical across revisions that leave
+    the directory alone and the object store links it instead of writing it again.
+    """
+    repo_root, out_root, rel, changed_here, objects_dir = task
+    root_out = Path(out_root)
+    store = Path(objects_dir) if objects_dir else None
+    writes: Dict[str, int] = {}
+    real_dir = repo_root if rel == "" else (repo_root / rel)
+    shadow_dir = root_out if rel == "" else (root_out / rel)
+    shadow_dir.mkdir(parents=True, exist_ok=True)
+
+    changed_names = {Path(f.get("path") or "").name for f in changed_here}
+    local_all_names = _list_file_names(real_dir)
+    no_change_names = [n for n in local_all_names if n not in changed_names]
+    # cap list
+    no_change_omitted = False
+    if len(no_change_names) > MAX_NO_CHANGE_LIST:
+        no_change_omitted = True
+        no_change_names = no_change_names[:MAX_NO_CHANGE_LIST]
+
+    files: List[Dict[str, Any]] = []
+    # include changed files with hunks
+    for f in changed_here:
+        files.append({
+            "name": Path(f.get("path") or "").name,
+            "status": f.get("status", "modified"),
+            "hunks": f.get("hunks", []),
+        })
+    n_changed = len(files)
+    # include no_change entries
+    for n in no_change_names:
+        files.append({"name": n, "status": "no_change"})
+
+    # link children directories
+    children: List[Dict[str, Any]] = []
+    if real_dir.exists():
+        for e in sorted(real_dir.iterdir(), key=lambda x: x.name):
+            if e.is_dir() and not e.name.startswith(".git"):
+                child_rel = (rel + "/" + e.name) if rel else e.name
+                children.append({"name": e.name, "rel_path": child_rel, "diff": f"{e.name}/_dir.diff.json"})
+
+    summary = {
+        "files_changed_here": len(changed_here),
+        "no_change_omitted": no_change_omitted,
+    }
+    doc = {
+        "schema_version": "1.0",
+        "rel_path": rel,
+        "summary": summary,
+        "files": files,
+        "children": children,
+    }
+    write_shard(shadow_dir / "_dir.diff.json", json.dumps(doc, indent=2), store, writes)
+    return n_changed, writes
+
+
+def build_shadow_diff(base_dir: str | GitPath, head_dir: str | GitPath, diff_bundle: Dict[str, Any], shadow_root: str, objects_dir: str | None = None) -> Dict[str, Any]:
     """Create per-directory diff shards under shadow_root, mirroring directory structure.
+    With objects_dir, shards identical to an earlier run's are hardlinked instead of rewritten.
     """
-    root_out = Path(shadow_root)
+    # tasks carry absolute paths: pool workers do not share this process's cwd
+    root_out = Path(shadow_root).resolve()
     root_out.mkdir(parents=True, exist_ok=True)
-    repo_root = Path(head_dir)
+    repo_root = absolute_root(head_dir)
+    store = Path(objects_dir).resolve() if objects_dir else None
+    writes: Dict[str, int] = {}
 
     by_dir = _partition_changes_by_dir(diff_bundle)
     all_dirs: Set[str] = set(by_dir.keys())
     # ensure parent directories exist in output to link children
     for d in list(all_dirs):
-        p = Path(d)
+        p = Path(d).parent
         while str(p) not in all_dirs and str(p) != ".":
             all_dirs.add(str(p))
             p = p.parent
     all_dirs.add("")
 
-    total_dirs = 0
+    tasks = [(repo_root, str(root_out), rel, by_dir.get(rel, []), str(store) if store else None) for rel in sorted(all_dirs)]
+    total_dirs = len(tasks)
     total_files = 0
+    for n_files, dir_writes in parallel_map(_write_diff_dir, tasks):
+        total_files += n_files
+        for status, n in dir_writes.items():
+            writes[status] = writes.get(status, 0) + n
 
-    # enumerate directory listing for no_change entries
-    def list_names(p: Path) -> List[str]:
-        names: List[str] = []
-        if p.exists() and p.is_dir():
-            for e in sorted(p.iterdir(), key=lambda x: x.name):
-                if e.name.startswith(".git"):
-                    continue
-                if e.is_file():
-                    names.append(e.name)
-        return names
-
-    for rel in sorted(all_dirs):
-        total_dirs += 1
-        real_dir = repo_root if rel == "" else (repo_root / rel)
-        shadow_dir = root_out if rel == "" else (root_out / rel)
-        shadow_dir.mkdir(parents=True, exist_ok=True)
-
-        changed_here = by_dir.get(rel, [])
-        changed_names = {Path(f.get("path") or "").name for f in changed_here}
-        local_all_names = list_names(real_dir)
-        no_change_names = [n for n in local_all_names if n not in changed_names]
-        # cap list
-        no_change_omitted = False
-        if len(no_change_names) > MAX_NO_CHANGE_LIST:
-            no_change_omitted = True
-            no_change_names = no_change_names[:MAX_NO_CHANGE_LIST]
-
-        files: List[Dict[str, Any]] = []
-        # include changed files with hunks
-        for f in changed_here:
-            files.append({
-                "name": Path(f.get("path") or "").name,
-                "status": f.get("status", "modified"),
-                "hunks": f.get("hunks", []),
-            })
-        total_files += len(files)
-        # include no_change entries
-        for n in no_change_names:
-            files.append({"name": n, "status": "no_change"})
-
-        # link children directories
-        children: List[Dict[str, Any]] = []
-        if real_dir.exists():
-            for e in sorted(real_dir.iterdir(), key=lambda x: x.name):
-                if e.is_dir() and not e.name.startswith(".git"):
-                    child_rel = (rel + "/" + e.name) if rel else e.name
-                    children.append({"name": e.name, "rel_path": child_rel, "diff": f"{e.name}/_dir.diff.json"})
-
-        summary = {
-            "files_changed_here": len(changed_here),
-            "insertions": diff_bundle.get("summary", {}).get("insertions", 0),
-            "deletions": diff_bundle.get("summary", {}).get("deletions", 0),
-            "no_change_omitted": no_change_omitted,
-        }
-        doc = {
-            "schema_version": "1.0",
-            "rel_path": rel,
-            "summary": summary,
-            "files": files,
-            "children": children,
-        }
-        (shadow_dir / "_dir.diff.json").write_text(json.dumps(doc, indent=2), encoding="utf-8")
-
+    # run-wide totals live here only: in the shards they would change every directory on any edit
+    summary = diff_bundle.get("summary", {})
     index = {
         "schema_version": "1.0",
         "root_diff": "_dir.diff.json",
         "counts": {"dirs": total_dirs, "files_listed": total_files},
+        "summary": {"insertions": summary.get("insertions", 0), "deletions": summary.get("deletions", 0)},
+        "shard_writes": writes,
     }
-    (root_out / "_index.json").write_text(json.dumps(index, indent=2), encoding="utf-8")
+    atomic_write_json(root_out / "_index.json", index)
     return index
 
 
@@ -334,3 +375,61 @@ def get_dir_context(shadow_root: str, rel_path: str, include_diff: bool, budget:
         return {"schema_version": "1.0", "rel_path": rel_path, "error": "context_build_failed"}
 
 
+
+
+DIFF_RUN_FILE = "_run.json"
+
+
+def save_diff_run(shadow_root: str, diff_bundle: Dict[str, Any], fingerprint: str, base_dir: str | None, head_dir: str | None, git: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """Persist the diff bundle next to its SDE shards so later analyses can reuse both.
+    Git-ref inputs record the repository and resolved commits under "git" instead of directories.
+    """
+    root_out = Path(shadow_root)
+    root_out.mkdir(parents=True, exist_ok=True)
+    atomic_write_json(root_out / "diff_bundle.json", diff_bundle)
+    run = {
+        "schema_version": "1.0",
+        "run_id": root_out.name,
+        "fingerprint": fingerprint,
+        "base_dir": base_dir,
+        "head_dir": head_dir,
+        "git": git,
+        "diff_bundle": "diff_bundle.json",
+        "root_diff": "_dir.diff.json",
+    }
+    # _run.json last: find_diff_run/load_diff_run only see runs whose bundle is complete
+    atomic_write_json(root_out / DIFF_RUN_FILE, run)
+    return run
+
+
+def load_diff_run(shadow_root: str) -> Dict[str, Any] | None:
+    root = Path(shadow_root)
+    bundle_path = root / "diff_bundle.json"
+    if not bundle_path.exists() or not (root / "_dir.diff.json").exists():
+        return None
+    try:
+        run_path = root / DIFF_RUN_FILE
+        run = json.loads(run_path.read_text(encoding="utf-8")) if run_path.exists() else {"run_id": root.name}
+        run["diff_bundle"] = json.loads(bundle_path.read_text(encoding="utf-8"))
+        return run
+    except Exception:
+        return None
+
+
+def find_diff_run(runs_root: str, fingerprint: str) -> str | None:
+    """Return the newest SDE run under runs_root whose recorded fingerprint matches.
+    """
+    root = Path(runs_root)
+    if not root.exists():
+        return None
+    for run_dir in sorted((p for p in root.iterdir() if p.is_dir()), key=lambda p: p.name, reverse=True):
+        run_path = run_dir / DIFF_RUN_FILE
+        if not run_path.exists():
+            continue
+        try:
+            run = json.loads(run_path.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        if run.get("fingerprint") == fingerprint and (run_dir / "diff_bundle.json").exists():
+            return run_dir.name
+    return None
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from server.services.run_io_service import atomic_write_json
+
+
+MEMO_DIR = "memo"
+# bump when a stage's output format or logic changes; old entries then simply stop matching
+MEMO_VERSION = "6"
+
+# The analyze DAG: each memoized stage and the named inputs its key is derived from. An input is
+# either a raw request value (ticket, knowledge, model) or an upstream stage's output, so a stage is
+# recomputed exactly when something it reads changed, and a recomputed-but-identical upstream output
+# still lets everything below it hit.
+STAGE_INPUTS: Dict[str, Tuple[str, ...]] = {
+    "feature_summary": ("ticket", "diff"),
+    "dry_run": ("knowledge", "diff", "ast_deltas"),
+    "ast_file": ("path_suffix", "content"),
+    "guards": ("ticket", "knowledge", "diff", "ast_deltas"),
+    "root_alignment": ("ticket", "root_context", "feature_summary", "dry_run", "model"),
+    # the directory's own context and the slice of feature summary / dry run over its files, which is
+    # what its prompts read: an edit in another directory leaves both alone
+    "directory": ("ticket", "dir_context", "dir_summary", "model"),
+}
+
+
+def content_hash(obj: Any) -> str:
+    if isinstance(obj, bytes):
+        return hashlib.sha256(obj).hexdigest()
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+
+def stage_key(stage: str, digests: Dict[str, str]) -> str:
+    """Key of one stage invocation from its declared inputs' digests."""
+    inputs = STAGE_INPUTS[stage]
+    missing = [name for name in inputs if name not in digests]
+    if missing:
+        raise KeyError(f"{stage}: missing inputs {missing}")
+    return content_hash([MEMO_VERSION, stage, [[name, digests[name]] for name in inputs]])
+
+
+def memo_root_for(repo_id: str) -> Path:
+    return Path("results") / repo_id / MEMO_DIR
+
+
+class StageMemo:
+    """Memo table of one stage under results/{repo_id}/memo/{stage}/{key[:2]}/{key}.json.
+
+    Mapping-style (get / item assignment) so services can take it as a plain cache; counts hits and misses.
+    """
+
+    def __init__(self, memo_root: Path | None, stage: str) -> None:
+        self.root = Path(memo_root) / stage if memo_root is not None else None
+        self.stage = stage
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self.root is None:
+            self.misses += 1
+            return default
+        p = self._path(key)
+        try:
+            value = json.loads(p.read_text(encoding="utf-8"))["value"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return default
+        try:
+            # mtime is the last use; retention prunes entries by it
+            os.utime(p)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.root is None:
+            return
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(p, {"stage": self.stage, "key": key, "value": value}, indent=None)
+
+
+def memo_stage(memo_root: Path | None, stage: str, digests: Dict[str, str], compute: Callable[[], Any], keep: Callable[[Any], bool] | None = None) -> Tuple[Any, bool]:
+    """Return (value, reused): the stored value for this stage's inputs, or compute() and store it.
+
+    keep(value) False leaves a computed value out of the memo (e.g. an LLM fallback answer).
+    """
+    memo = StageMemo(memo_root, stage)
+    key = stage_key(stage, digests)
+    hit = memo.get(key)
+    if hit is not None:
+        return hit, True
+    value = compute()
+    if keep is None or keep(value):
+        memo[key] = value
+    return value, False
+
+
+def prune_memo(memo_root: Path, max_age_days: float, dry_run: bool = False, now: float | None = None) -> Dict[str, Any]:
+    """Delete memo entries not used (read or written) within max_age_days; 0 keeps everything."""
+    now = time.time() if now is None else now
+    removed = 0
+    reclaimed = 0
+    if max_age_days <= 0 or not memo_root.is_dir():
+        return {"entries_removed": 0, "bytes_reclaimed": 0}
+    cutoff = now - max_age_days * 86400.0
+    for root, _, files in os.walk(memo_root):
+        for name in files:
+            p = os.path.join(root, name)
+            try:
+                st = os.stat(p)
+                if st.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    os.unlink(p)
+            except OSError:
+                continue
+            removed += 1
+            reclaimed += st.st_size
+    return {"entries_removed": removed, "bytes_reclaimed": reclaimed}
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+
+class IntervalIndex:
+    """Static index over closed line intervals (start, end, item).
+
+    Entries are sorted by start with a running maximum of ends, so a lookup bisects to the last
+    interval starting at or before the line and walks back only while an earlier one can still reach it.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, Any]]) -> None:
+        self._entries = sorted(intervals, key=lambda e: (e[0], -e[1]))
+        self._starts = [e[0] for e in self._entries]
+        self._max_end: List[int] = []
+        reach = 0
+        for _, end, _ in self._entries:
+            reach = max(reach, end)
+            self._max_end.append(reach)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def enclosing(self, line: int) -> List[Any]:
+        """Items whose interval contains line, outermost first."""
+        out: List[Any] = []
+        i = bisect_right(self._starts, line) - 1
+        while i >= 0 and self._max_end[i] >= line:
+            start, end, item = self._entries[i]
+            if end >= line:
+                out.append(item)
+            i -= 1
+        out.reverse()
+        return out
+
+
+# changed lines outside every symbol that cannot change what importers see; an import is not one of
+# them, since swapping what a module imports changes every export that uses the imported name
+_INERT_LINE_RE = re.compile(r"^\s*($|//|/\*|\*|#)")
+
+
+def symbol_index(summary: Dict[str, Any]) -> IntervalIndex:
+    return IntervalIndex((s["start"], s["end"], s) for s in summary.get("symbols", []) if s.get("start") and s.get("end"))
+
+
+def _changed_lines(hunk: Dict[str, Any]) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    old_no = hunk.get("old_start") or 0
+    new_no = hunk.get("new_start") or 0
+    removed: List[Tuple[int, str]] = []
+    added: List[Tuple[int, str]] = []
+    for line in (hunk.get("text") or "").splitlines():
+        if line.startswith("+"):
+            added.append((new_no, line[1:]))
+            new_no += 1
+        elif line.startswith("-"):
+            removed.append((old_no, line[1:]))
+            old_no += 1
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        else:
+            old_no += 1
+            new_no += 1
+    return removed, added
+
+
+def hunk_changed_lines(hunk: Dict[str, Any]) -> Tuple[List[int], List[int]]:
+    """(removed line numbers on the old side, added line numbers on the new side) of one hunk."""
+    removed, added = _changed_lines(hunk)
+    return [n for n, _ in removed], [n for n, _ in added]
+
+
+def _parsed(summary: Dict[str, Any] | None) -> bool:
+    # summaries from a failed parse carry no "symbols" key; a parsed file with no symbols has []
+    return bool(summary) and "symbols" in summary
+
+
+def map_hunks_to_symbols(diff_bundle: Dict[str, Any], base: Dict[str, Dict[str, Any]], head: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Annotate each hunk of every mappable file with "symbols": the names of the symbols enclosing its
+    changed lines (removed lines against the base summary, added lines against the head summary),
+    outermost first, and with "unscoped": True when a changed line outside every symbol is more than
+    a comment or blank line. Returns symbol-level deltas, one per innermost touched symbol.
+
+    A file is mappable when every side with changed lines was parsed; other files are left as they are.
+    """
+    deltas: List[Dict[str, Any]] = []
+    for f in diff_bundle.get("files", []):
+        path = f.get("path")
+        hunks = f.get("hunks") or []
+        if not path or not hunks or (path not in base and path not in head):
+            continue
+        lines = [_changed_lines(h) for h in hunks]
+        b, h_ = base.get(path), head.get(path)
+        if (any(r for r, _ in lines) and not _parsed(b)) or (any(a for _, a in lines) and not _parsed(h_)):
+            continue
+        bidx = symbol_index(b) if _parsed(b) else IntervalIndex([])
+        hidx = symbol_index(h_) if _parsed(h_) else IntervalIndex([])
+        touched: Dict[str, None] = {}
+        for hunk, (removed, added) in zip(hunks, lines):
+            names: Dict[str, None] = {}
+            unscoped = False
+            for idx, changed in ((bidx, removed), (hidx, added)):
+                for n, text in changed:
+                    chain = idx.enclosing(n)
+                    for s in chain:
+                        names[s["name"]] = None
+                    if chain:
+                        touched[chain[-1]["name"]] = None
+                    elif not _INERT_LINE_RE.match(text):
+                        unscoped = True
+            hunk["symbols"] = list(names)
+            if unscoped:
+                hunk["unscoped"] = True
+            else:
+                hunk.pop("unscoped", None)
+        deltas.extend(_symbol_deltas(path, list(touched), b if _parsed(b) else {}, h_ if _parsed(h_) else {}))
+    return deltas
+
+
+def _symbol_deltas(path: str, names: List[str], base: Dict[str, Any], head: Dict[str, Any]) -> List[Dict[str, Any]]:
+    bsyms = {s["name"]: s for s in reversed(base.get("symbols", []))}
+    hsyms = {s["name"]: s for s in reversed(head.get("symbols", []))}
+    out: List[Dict[str, Any]] = []
+    for name in names:
+        bs, hs = bsyms.get(name), hsyms.get(name)
+        if bs is None and hs is None:
+            continue
+        if bs is None:
+            change = "added"
+        elif hs is None:
+            change = "removed"
+        elif bs.get("params") != hs.get("params") or bool(bs.get("exported")) != bool(hs.get("exported")):
+            change = "signature"
+        else:
+            change = "body"
+        sym = hs or bs
+        exported = bool((hs or {}).get("exported") or (bs or {}).get("exported"))
+        if sym.get("kind") == "method":
+            # a method is public API when its class is exported
+            owner = name.rsplit(".", 1)[0]
+            exported = bool((hsyms.get(owner) or bsyms.get(owner) or {}).get("exported"))
+        entry = {"path": path, "symbol": name, "kind": sym.get("kind"), "change": change, "exported": exported}
+        if change == "signature":
+            entry["params"] = {"before": bs.get("params"), "after": hs.get("params")}
+        out.append(entry)
+    return out
+
+
+def _references(text: str, names: Set[str]) -> bool:
+    return any(re.search(rf"(?<![\w$]){re.escape(name)}(?![\w$])", text) for name in names)
+
+
+def _propagate(names: Set[str], head: Dict[str, Any] | None, source: str | None) -> Set[str] | None:
+    """names plus every top-level head symbol whose body mentions one of them, to a fixpoint; None
+    when a head line outside every top-level symbol mentions one (a module-level alias or table
+    entry can hand the touched code to anything).
+    """
+    if not _parsed(head):
+        return set(names)
+    if source is None:
+        return None
+    lines = source.splitlines()
+    spans = [(s["name"], s["start"], s["end"]) for s in head["symbols"] if "." not in s["name"] and s.get("start") and s.get("end")]
+    inside = {n for _, start, end in spans for n in range(start, end + 1)}
+    outside = "\n".join(line for n, line in enumerate(lines, 1) if n not in inside and not _INERT_LINE_RE.match(line))
+    if _references(outside, names):
+        return None
+    out = set(names)
+    grew = True
+    while grew:
+        grew = False
+        for name, start, end in spans:
+            if name not in out and _references("\n".join(lines[start - 1:end]), out):
+                out.add(name)
+                grew = True
+    return out
+
+
+def exported_changes(
+    diff_bundle: Dict[str, Any],
+    base: Dict[str, Dict[str, Any]],
+    head: Dict[str, Dict[str, Any]],
+    sources: Dict[str, str] | None = None,
+) -> Dict[str, List[str]]:
+    """{path: exported top-level symbols affected} for mapped files whose every change sits inside a
+    top-level symbol. Touched symbols are widened to the top-level symbols that use them in the head
+    source (sources: {path: head text}), so a touched export called by another export names both.
+    Files are left out, their importers not narrowed, when a hunk is unscoped (import changes
+    included), no symbol was touched, the head source is missing, or the widened set holds a
+    non-exported symbol.
+    """
+    out: Dict[str, List[str]] = {}
+    for f in diff_bundle.get("files", []):
+        path = f.get("path")
+        hunks = f.get("hunks") or []
+        if not path or not hunks or not all("symbols" in h for h in hunks) or any(h.get("unscoped") for h in hunks):
+            continue
+        names = {name.split(".", 1)[0] for h in hunks for name in h["symbols"]}
+        if not names:
+            continue
+        names = _propagate(names, head.get(path), (sources or {}).get(path))
+        if names is None:
+            continue
+        top = {s["name"]: bool(s.get("exported")) for summary in (base.get(path), head.get(path)) if _parsed(summary) for s in summary["symbols"] if "." not in s["name"]}
+        if all(top.get(name) for name in names):
+            out[path] = sorted(names)
+    return out
+
+
+def importer_index(deps: Dict[str, Any]) -> Dict[str, Dict[str, Set[str]]]:
+    """Symbol-indexed reverse deps: {imported file: {symbol: importing files}}. Edges without a
+    symbol list (knowledge built before symbols were recorded) count as "*", every symbol.
+    """
+    index: Dict[str, Dict[str, Set[str]]] = {}
+    for e in deps.get("edges", []):
+        frm, to = e.get("from"), e.get("to")
+        if not frm or not to:
+            continue
+        by_symbol = index.setdefault(to, {})
+        for name in e.get("symbols") or ["*"]:
+            by_symbol.setdefault(name, set()).add(frm)
+    return index
+
+
+def importers_of(index: Dict[str, Dict[str, Set[str]]], path: str, symbols: Iterable[str] | None = None) -> Set[str]:
+    """Files importing path; with symbols, only those importing one of them, the default export
+    (not mapped to a name here) or the whole module.
+    """
+    by_symbol = index.get(path, {})
+    if symbols is None:
+        return set().union(*by_symbol.values()) if by_symbol else set()
+    out: Set[str] = set()
+    for name in (*symbols, "default", "*"):
+        out |= by_symbol.get(name, set())
+    return out
+
+
+def scope_dir_context(ctx: Dict[str, Any], diff_bundle: Dict[str, Any], symbol_deltas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Prompt context with mapped code files reduced to symbol-level deltas: changed lines only (no
+    unchanged context lines), each hunk's enclosing symbols, and the file's per-symbol changes.
+    """
+    files = (ctx.get("diff") or {}).get("files")
+    if not files:
+        return ctx
+    rel = ctx.get("rel_path", "")
+    mapped = {f.get("path"): f for f in diff_bundle.get("files", []) if f.get("hunks") and all("symbols" in h for h in f["hunks"])}
+    if not mapped:
+        return ctx
+    by_path: Dict[str, List[Dict[str, Any]]] = {}
+    for d in symbol_deltas:
+        by_path.setdefault(d["path"], []).append({k: v for k, v in d.items() if k != "path"})
+    out: List[Dict[str, Any]] = []
+    for entry in files:
+        path = f"{rel}/{entry.get('name')}" if rel else entry.get("name")
+        src = mapped.get(path)
+        if src is None or entry.get("status") == "no_change":
+            out.append(entry)
+            continue
+        hunks = []
+        for h, full in zip(entry.get("hunks") or [], src["hunks"]):
+            changed = [line for line in (h.get("text") or "").splitlines() if line.startswith(("+", "-"))]
+            hunks.append({"meta": h.get("meta"), "symbols": full["symbols"], "text": "".join(line + "\n" for line in changed)})
+        out.append({**entry, "hunks": hunks, "symbol_deltas": by_path.get(path, [])})
+    return {**ctx, "diff": {**ctx["diff"], "files": out}}
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any
+
+
+TRACE_ROOT = Path("prompt_performance") / "traces"
+TRACE_FILE = "prompts.ndjson"
+MAX_TRACE_BYTES = int(os.environ.get("PROMPT_TRACE_MAX_BYTES", str(8 * 1024 * 1024)))
+QUEUE_SIZE = 10000
+
+
+class _TraceWriter:
+    """Single background thread appending NDJSON prompt traces to per-run files.
+
+    Callers only enqueue (never block); records are dropped and counted if the queue is full.
+    Files live at prompt_performance/traces/{run_id}/prompts.ndjson and rotate to
+    prompts.{n}.ndjson once they exceed PROMPT_TRACE_MAX_BYTES.
+    """
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[Dict[str, Any] | None]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="prompt-trace-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _loop(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                if record is not None:
+                    self._write(record)
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        run_id = str(record.get("run_id") or "adhoc-" + time.strftime("%Y%m%d", time.gmtime()))
+        d = TRACE_ROOT / Path(run_id).name
+        d.mkdir(parents=True, exist_ok=True)
+        target = d / TRACE_FILE
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        if target.exists() and target.stat().st_size + len(line) > MAX_TRACE_BYTES:
+            n = 1
+            while (d / f"prompts.{n}.ndjson").exists():
+                n += 1
+            os.replace(target, d / f"prompts.{n}.ndjson")
+        with target.open("a", encoding="utf-8") as fh:
+            fh.write(line)
+
+
+_writer = _TraceWriter()
+atexit.register(_writer.flush)
+
+
+def trace_prompt(record: Dict[str, Any]) -> None:
+    """Enqueue one prompt trace (run_id, name, rel_path, latency_ms, tokens, cache_hit, ...)."""
+    record.setdefault("ts", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    _writer.submit(record)
+
+
+def flush_traces(timeout: float = 5.0) -> None:
+    _writer.flush(timeout)
+
+
+def dropped_traces() -> int:
+    return _writer.dropped
+
+
+def trace_payloads_enabled() -> bool:
+    # PROMPT_TRACE_PAYLOADS=1 adds system prompt, input and output to every trace; off by default,
+    # since they repeat ticket text and source excerpts
+    return os.environ.get("PROMPT_TRACE_PAYLOADS", "0").lower() in ("1", "true", "yes")
+
+
+def prune_traces(max_age_days: float, trace_root: Path = TRACE_ROOT, dry_run: bool = False, now: float | None = None) -> Dict[str, Any]:
+    """Delete per-run trace directories not written to within max_age_days; 0 keeps everything."""
+    now = time.time() if now is None else now
+    removed = 0
+    reclaimed = 0
+    if max_age_days <= 0 or not trace_root.is_dir():
+        return {"runs_removed": 0, "bytes_reclaimed": 0}
+    cutoff = now - max_age_days * 86400.0
+    for d in trace_root.iterdir():
+        if not d.is_dir():
+            continue
+        try:
+            stats = [f.stat() for f in d.iterdir() if f.is_file()]
+        except OSError:
+            continue
+        if any(st.st_mtime >= cutoff for st in stats):
+            continue
+        if not dry_run:
+            shutil.rmtree(d, ignore_errors=True)
+        removed += 1
+        reclaimed += sum(st.st_size for st in stats)
+    return {"runs_removed": removed, "bytes_reclaimed": reclaimed}
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import json
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, Any, List
+
+from server.services.dry_run_service import _is_code_file, _is_docs, _is_tests
+from server.services.file_class_service import LOCKFILES
+
+
+FIXTURE_MARKERS = ("/fixtures/", "/__fixtures__/", "/__snapshots__/", "/testdata/")
+
+
+def _skt_kinds(skt_root: Path, rel_dir: str) -> Dict[str, List[str]]:
+    meta_path = (skt_root / rel_dir / "_dir.meta.json") if rel_dir else (skt_root / "_dir.meta.json")
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    return {f.get("name"): f.get("kinds", []) for f in meta.get("files", []) if f.get("name")}
+
+
+def _is_fixture(path: str) -> bool:
+    p = "/" + path
+    return any(m in p for m in FIXTURE_MARKERS) or path.endswith(".snap")
+
+
+def _classify_file(f: Dict[str, Any], kinds: List[str], ticket_globs: List[str], out_of_scope: set) -> str | None:
+    """Reason a changed file cannot move alignment/impact, or None if the model should look at it."""
+    path = f.get("path") or ""
+    name = Path(path).name
+    is_code = "code" in kinds or _is_code_file(path)
+    if f.get("classified"):
+        # generated, vendored, binary or lockfile (diff_service kept no hunks)
+        return f["classified"]
+    if f.get("truncated"):
+        # over MAX_DIFF_BYTES only the file list was kept: its hunks are unknown, not empty
+        return None
+    if f.get("status") == "modified" and not f.get("hunks"):
+        return "no_content_change"
+    if f.get("change_class"):
+        # every hunk is whitespace- or comment-only (diff_service collapsed them)
+        return "format_only"
+    if is_code:
+        return None
+    if name in LOCKFILES:
+        return "lockfile"
+    if _is_fixture(path) or _is_tests(path):
+        return "test_fixture"
+    if path in out_of_scope:
+        return "out_of_scope_noncode"
+    explicitly_in_scope = bool(ticket_globs) and any(fnmatch(path, g) for g in ticket_globs)
+    if ("docs" in kinds or _is_docs(path) or name.lower().endswith((".md", ".rst", ".txt"))) and not explicitly_in_scope:
+        return "docs"
+    return None
+
+
+def triage_directories(ticket: Dict[str, Any], diff_bundle: Dict[str, Any], scope: Dict[str, Any], skt_root: str) -> Dict[str, Dict[str, Any]]:
+    """Deterministic pre-classifier: decide per changed directory whether a shadow LLM prompt is needed.
+
+    A directory is skipped only when every changed file in it has a reason; _classify_file checks,
+    in order:
+    - classified generated, vendored, binary or lockfile by diff_service (a file truncated by
+      MAX_DIFF_BYTES is never skipped: its hunks are unknown);
+    - no_content_change: modified, but the diff showed no hunks;
+    - format_only: only whitespace- or comment-only hunks;
+    any other code file needs the model. Non-code files may still be:
+    - lockfile, test_fixture (fixtures, snapshots, tests), out_of_scope_noncode;
+    - docs, unless the ticket's files_glob targets them.
+    Config drift, dep drift and scope for skipped files are still reported by the deterministic
+    guards.
+    """
+    ticket_globs = ((ticket or {}).get("ticket", {}).get("expected_change_scope", {}) or {}).get("files_glob", []) or []
+    out_of_scope = set((scope or {}).get("out_of_scope_files", []))
+    by_dir: Dict[str, List[Dict[str, Any]]] = {}
+    for f in diff_bundle.get("files", []):
+        path = f.get("path") or ""
+        if not path:
+            continue
+        rel_dir = str(Path(path).parent).replace("\\", "/")
+        by_dir.setdefault("" if rel_dir == "." else rel_dir, []).append(f)
+
+    root = Path(skt_root)
+    out: Dict[str, Dict[str, Any]] = {}
+    for rel_dir, files in sorted(by_dir.items()):
+        kinds_by_name = _skt_kinds(root, rel_dir)
+        reasons = [_classify_file(f, kinds_by_name.get(Path(f.get("path") or "").name, []), ticket_globs, out_of_scope) for f in files]
+        if all(reasons):
+            out[rel_dir] = {"needs_llm": False, "reason": "+".join(sorted(set(reasons)))}
+        else:
+            out[rel_dir] = {"needs_llm": True, "reason": None}
+    return out
+
+
+def skipped_dir_result(ticket: Dict[str, Any]) -> Dict[str, Any]:
+    """Heuristic stand-in for a skipped directory: no AC evidence, no API impact."""
+    acs = [c.get("id") for c in (ticket or {}).get("ticket", {}).get("acceptance_criteria", [])]
+    return {
+        "alignment": {"schema_version": "1.0", "ticket_alignment": {"matched": [], "unmet": acs, "evidence": []}, "notes": "triage_skipped"},
+        "impact": {"changed_exports": [], "signature_changes": [], "possibly_impacted": []},
+    }
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import atexit
+import math
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, List
+
+
+# WORKER_POOL_SIZE: worker processes (default: CPU count); 0 or 1 runs everything inline
+# WORKER_POOL_CHUNK: items per task (default: spread each call over ~4 tasks per worker)
+# WORKER_POOL_MIN_ITEMS: calls with fewer items run inline, where IPC would cost more than it saves
+# WORKER_POOL_START_METHOD: forkserver (POSIX default; safe under threaded servers) | spawn | fork
+DEFAULT_MIN_ITEMS = 16
+TASKS_PER_WORKER = 4
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def pool_size() -> int:
+    raw = os.environ.get("WORKER_POOL_SIZE", "")
+    try:
+        return max(0, int(raw)) if raw else (os.cpu_count() or 1)
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def _in_worker() -> bool:
+    # never nest pools: a stage running inside a worker maps inline
+    return multiprocessing.parent_process() is not None
+
+
+def _start_method() -> str:
+    method = os.environ.get("WORKER_POOL_START_METHOD", "")
+    if method:
+        return method
+    return "spawn" if sys.platform in ("win32", "darwin") else "forkserver"
+
+
+def _get_pool() -> ProcessPoolExecutor | None:
+    global _pool
+    workers = pool_size()
+    if workers <= 1 or _in_worker():
+        return None
+    with _pool_lock:
+        if _pool is None:
+            try:
+                ctx = multiprocessing.get_context(_start_method())
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+            except (OSError, ValueError, NotImplementedError):
+                # no semaphores / start method in this environment: stay inline
+                return None
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _run_chunk(fn: Callable[[Any], Any], chunk: List[Any]) -> List[Any]:
+    return [fn(item) for item in chunk]
+
+
+def parallel_map(fn: Callable[[Any], Any], items: Iterable[Any], chunksize: int | None = None, min_items: int | None = None) -> List[Any]:
+    """Ordered map of a picklable module-level fn over items on the shared process pool.
+
+    Falls back to a plain inline map when the pool is disabled, the input is small, or the pool
+    breaks (the pool is then recreated on the next call). Results are identical either way.
+    """
+    items = list(items)
+    if min_items is None:
+        min_items = int(os.environ.get("WORKER_POOL_MIN_ITEMS", str(DEFAULT_MIN_ITEMS)))
+    pool = _get_pool() if len(items) >= max(2, min_items) else None
+    if pool is None:
+        return [fn(item) for item in items]
+    if chunksize is None:
+        env_chunk = int(os.environ.get("WORKER_POOL_CHUNK", "0") or 0)
+        chunksize = env_chunk or math.ceil(len(items) / (pool_size() * TASKS_PER_WORKER))
+    chunksize = max(1, chunksize)
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    try:
+        futures = [pool.submit(_run_chunk, fn, chunk) for chunk in chunks]
+        out: List[Any] = []
+        for fut in futures:
+            out.extend(fut.result())
+        return out
+    except BrokenProcessPool:
+        shutdown_pool()
+        return [fn(item) for item in items]
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from server.services.diff_service import compute_local_diff
+from server.services.dry_run_service import build_feature_summary
+
+
+def _tree(root: Path, files: dict) -> str:
+    for rel, text in files.items():
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text(text, encoding="utf-8")
+    return str(root)
+
+
+def test_feature_summary_counts_match_diff_summary(tmp_path: Path) -> None:
+    base = _tree(tmp_path / "base", {
+        "src/fmt.ts": "export function f(a,b) {\n  return a+b;\n}\n",
+        "src/calc.ts": "export const x = 1;\n",
+    })
+    head = _tree(tmp_path / "head", {
+        # whitespace-only: the hunk is collapsed to its line counts
+        "src/fmt.ts": "export function f(a, b) {\n  return a + b;\n}\n",
+        "src/calc.ts": "export const x = 2;\n",
+        # a new file's hunk starts with an added line
+        "src/new.ts": "export const y = 1;\nexport const z = 2;\n",
+    })
+    bundle = compute_local_diff(base, head, include_context=False)
+    assert any("collapsed" in h for f in bundle["files"] for h in f["hunks"])
+    assert (bundle["summary"]["insertions"], bundle["summary"]["deletions"]) == (5, 3)
+    summary = build_feature_summary({}, bundle)
+    assert (summary["added_lines"], summary["removed_lines"]) == (5, 3)
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from server.services.file_class_service import MINIFIED_LINE_CHARS, classify_content
+
+
+def _hunk(*added: str) -> dict:
+    return {"text": "".join(f"+{line}\n" for line in added)}
+
+
+def test_one_long_line_does_not_hide_code() -> None:
+    data_uri = 'const LOGO = "data:image/png;base64,' + "A" * (MINIFIED_LINE_CHARS * 5) + '";'
+    hunks = [_hunk("export function check(user) {", data_uri, "  return user.isAdmin;", "}")]
+    assert classify_content("src/auth.ts", hunks, False) is None
+
+
+def test_minified_bundle_is_generated_with_reason() -> None:
+    hunks = [_hunk("!function(){" + "var a=1;" * 400 + "}();", "x" * (MINIFIED_LINE_CHARS + 1))]
+    cls, source, reason = classify_content("static/app.js", hunks, False)
+    assert (cls, source) == ("generated", "content")
+    assert reason.startswith("minified: 2/2 added lines")
+
+
+def test_non_code_file_with_extreme_average_is_generated() -> None:
+    hunks = [_hunk("{", '"blob": "' + "z" * (MINIFIED_LINE_CHARS * 10) + '"', "}")]
+    assert classify_content("data/fixture.json", hunks, False)[0] == "generated"
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from server.services.diff_service import classify_hunk
+
+
+def _hunk(removed: list, added: list, context: list | None = None) -> str:
+    lines = [f" {line}" for line in context or []] + [f"-{line}" for line in removed] + [f"+{line}" for line in added]
+    return "".join(line + "\n" for line in lines)
+
+
+def test_spacing_between_tokens_is_whitespace() -> None:
+    assert classify_hunk(_hunk(["x=f(a,b);"], ["x = f(a, b);"]), "src/a.ts") == "whitespace"
+    assert classify_hunk(_hunk(["int x=f(a,", "    b);"], ["int x = f(a, b);"]), "src/a.c") == "whitespace"
+
+
+def test_whitespace_that_separates_operators_is_semantic() -> None:
+    assert classify_hunk(_hunk(["y = a - -b;"], ["y = a --b;"]), "src/a.c") == "semantic"
+    assert classify_hunk(_hunk(['s = "a  b"'], ['s = "a b"']), "src/a.py") == "semantic"
+
+
+def test_js_line_break_after_return_is_semantic() -> None:
+    assert classify_hunk(_hunk(["  return value;"], ["  return", "  value;"]), "src/a.js") == "semantic"
+
+
+def test_python_indentation_is_semantic() -> None:
+    hunk = _hunk(["    if ok:", "        run()", "    done()"], ["    if ok:", "        run()", "        done()"])
+    assert classify_hunk(hunk, "src/a.py") == "semantic"
+
+
+def test_star_line_is_code_outside_a_block_comment() -> None:
+    assert classify_hunk(_hunk(["  * factor;"], ["  * scale;"], ["const total = price"]), "src/a.ts") == "semantic"
+    hunk = _hunk([" * old note"], [" * new note"], ["/**", " * Totals."])
+    assert classify_hunk(hunk, "src/a.ts") == "comment"
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+
+from server.services.retention_service import compact_repo
+from server.services.run_io_service import RUNS_LOCK, repo_lock
+
+
+def test_compaction_waits_for_in_flight_analysis(tmp_path: Path) -> None:
+    repo_dir = tmp_path / "results" / "acme"
+    run = repo_dir / "shadow_diff" / "20200101T000000Z-000000aa"
+    run.mkdir(parents=True)
+    (run / "_run.json").write_text(json.dumps({"run_id": run.name}), encoding="utf-8")
+    (repo_dir / "retention.json").write_text(json.dumps({"shadow_diff": {"max_age_days": 1, "min_keep": 0}}), encoding="utf-8")
+
+    reports = []
+    with repo_lock("acme", RUNS_LOCK, shared=True, results_root=repo_dir.parent):
+        worker = threading.Thread(target=lambda: reports.append(compact_repo(repo_dir)))
+        worker.start()
+        worker.join(0.3)
+        assert worker.is_alive()
+        assert run.exists()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert [d["run_id"] for d in reports[0]["deleted"]["shadow_diff"]] == [run.name]
+    assert not run.exists()
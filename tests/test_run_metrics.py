@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import re
+
+import pytest
+
+from server.services.metrics_service import render_prometheus, run_metrics
+
+
+def _runs() -> dict:
+    return {m.group(1): int(m.group(2)) for m in re.finditer(r'gtm_analyze_runs_total\{status="(\w+)"\} (\d+)', render_prometheus())}
+
+
+def test_analyze_runs_are_counted_by_outcome() -> None:
+    before = _runs()
+    with run_metrics("a") as metrics:
+        metrics.status = "done"
+    with run_metrics("b") as metrics:
+        metrics.status = "rejected"
+    with pytest.raises(RuntimeError):
+        with run_metrics("c"):
+            raise RuntimeError("boom")
+    after = _runs()
+    assert {status: after[status] - before[status] for status in after} == {"done": 1, "rejected": 1, "error": 1}
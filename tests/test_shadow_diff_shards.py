@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict
+
+from server.services.diff_service import compute_local_diff
+from server.services.shadow_fs_service import build_shadow_diff
+
+
+BASE = {
+    "src/a/add.ts": "export function add(a, b) {\n  return a + b;\n}\n",
+    "src/b/mul.ts": "export function mul(a, b) {\n  return a * b;\n}\n",
+}
+
+
+def _tree(root: Path, files: Dict[str, str]) -> str:
+    for rel, text in files.items():
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text(text, encoding="utf-8")
+    return str(root)
+
+
+def _revision(tmp_path: Path, name: str, add_body: str) -> Dict:
+    head = _tree(tmp_path / name, {
+        "src/a/add.ts": f"export function add(a, b) {{\n  {add_body}\n}}\n",
+        "src/b/mul.ts": "export function mul(a, b) {\n  return b * a;\n}\n",
+    })
+    bundle = compute_local_diff(str(tmp_path / "base"), head, include_context=False)
+    return build_shadow_diff(str(tmp_path / "base"), head, bundle, str(tmp_path / "runs" / name), objects_dir=str(tmp_path / "objects"))
+
+
+def test_untouched_directory_shard_is_shared_across_revisions(tmp_path: Path) -> None:
+    _tree(tmp_path / "base", BASE)
+    first = _revision(tmp_path, "r1", "return b + a;")
+    second = _revision(tmp_path, "r2", "const t = b + a;\n  return t | 0;")
+    assert first["summary"] != second["summary"]
+    b1, b2 = (os.stat(tmp_path / "runs" / r / "src/b/_dir.diff.json") for r in ("r1", "r2"))
+    assert (b1.st_dev, b1.st_ino) == (b2.st_dev, b2.st_ino)
+    a1, a2 = (os.stat(tmp_path / "runs" / r / "src/a/_dir.diff.json") for r in ("r1", "r2"))
+    assert a1.st_ino != a2.st_ino
+    # only the edited directory's shard is a new blob; src/b, src/ and the root are linked
+    assert second["shard_writes"] == {"written": 1, "linked": 3}
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from server.services.ast_service import compute_ast_deltas, summarize_python_source
+
+
+MOD = "pkg/client.py"
+
+
+def _breaking(tmp_path: Path, before: str, after: str) -> list:
+    for side, text in (("base", before), ("head", after)):
+        (tmp_path / side / "pkg").mkdir(parents=True)
+        (tmp_path / side / MOD).write_text(f"class Client:\n    def fetch{text}:\n        return 1\n", encoding="utf-8")
+    return compute_ast_deltas(str(tmp_path / "base"), str(tmp_path / "head"), [MOD])["signature_breaking"]
+
+
+def test_python_params_record_defaults_and_keyword_only() -> None:
+    summary = summarize_python_source(b"def f(a, b=1, *args, c, d=2, **kw):\n    pass\ndef g(a, *, b=None):\n    pass\n")
+    params = {f["name"]: f["params"] for f in summary["functions"]}
+    assert params == {"f": ["a", "b=", "*args", "c", "d=", "**kw"], "g": ["a", "*", "b="]}
+
+
+@pytest.mark.parametrize("before, after", [
+    ("(self, url)", "(self, url, timeout=10)"),
+    ("(self, url)", "(self, url, *, retries=3)"),
+    ("(self, url, timeout)", "(self, url, timeout=10)"),
+    ("(self, url)", "(self, url, *args, **kwargs)"),
+])
+def test_compatible_param_changes_are_not_breaking(tmp_path: Path, before: str, after: str) -> None:
+    assert _breaking(tmp_path, before, after) == []
+
+
+@pytest.mark.parametrize("before, after", [
+    ("(self, url, timeout=10)", "(self, url)"),
+    ("(self, url)", "(self, link)"),
+    ("(self, url)", "(self, url, timeout)"),
+    ("(self, url)", "(self, url, *, retries)"),
+    ("(self, url, timeout=10)", "(self, url, timeout)"),
+    ("(self, url, **kwargs)", "(self, url)"),
+])
+def test_removed_renamed_or_required_params_are_breaking(tmp_path: Path, before: str, after: str) -> None:
+    assert _breaking(tmp_path, before, after) == [f"{MOD}#$Client.fetch"]
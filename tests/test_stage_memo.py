@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+from server.app import create_app
+
+
+TICKET = {
+    "schema_version": "1.0",
+    "ticket": {
+        "id": "T-1",
+        "title": "Tune math helpers",
+        "summary": "Adjust helpers",
+        "acceptance_criteria": [{"id": "AC-1", "text": "helpers updated", "verification": "manual"}],
+        "expected_change_scope": {"files_glob": ["**/*"], "modules": []},
+        "out_of_scope_glob": [],
+    },
+}
+
+FILES = {
+    "src/a/add.ts": "export function add(a, b) {\n  return a + b;\n}\n",
+    "src/b/mul.ts": "export function mul(a, b) {\n  return a * b;\n}\n",
+    "src/index.ts": 'import { add } from "./a/add";\nimport { mul } from "./b/mul";\nexport const both = (x) => mul(add(x, x), x);\n',
+}
+
+
+def _write(root: Path, files: Dict[str, str]) -> None:
+    for rel, text in files.items():
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text(text, encoding="utf-8")
+
+
+@pytest.fixture()
+def client(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, value in {"LLM_MODE": "replay", "LLM_REPLAY_MISS": "stub", "LLM_REPLAY_LATENCY": "none", "RETENTION_INTERVAL_SECONDS": "0"}.items():
+        monkeypatch.setenv(name, value)
+    _write(tmp_path / "base" / "demo", FILES)
+    head = dict(FILES)
+    head["src/a/add.ts"] = "export function add(a, b) {\n  return b + a;\n}\n"
+    head["src/b/mul.ts"] = "export function mul(a, b) {\n  return b * a;\n}\n"
+    _write(tmp_path / "head" / "demo", head)
+    return create_app().test_client()
+
+
+def _analyze(client, tmp_path: Path) -> Dict[str, Any]:
+    r = client.post("/local/pr/analyze", json={"base_dir": str(tmp_path / "base" / "demo"), "head_dir": str(tmp_path / "head" / "demo"), "ticket": TICKET})
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()["report"]["memo"]
+
+
+def test_second_analyze_reuses_every_stage(client, tmp_path: Path) -> None:
+    cold = _analyze(client, tmp_path)
+    assert cold["stages_reused"] == [] and cold["directories_reused"] == []
+    warm = _analyze(client, tmp_path)
+    assert warm["stages_reused"] == ["diff", "feature_summary", "dry_run", "guards", "root_alignment"]
+    assert sorted(warm["directories_reused"]) == ["src/a", "src/b"]
+
+
+def test_one_file_change_recomputes_what_reads_it(client, tmp_path: Path) -> None:
+    _analyze(client, tmp_path)
+    (tmp_path / "head" / "demo" / "src/b/mul.ts").write_text("export function mul(a, b, c = 1) {\n  return b * a * c;\n}\n", encoding="utf-8")
+    edited = _analyze(client, tmp_path)
+    assert edited["stages_reused"] == []
+    assert edited["directories_reused"] == ["src/a"]
+    again = _analyze(client, tmp_path)
+    assert sorted(again["directories_reused"]) == ["src/a", "src/b"]
+
+
+def test_edit_in_one_directory_reuses_the_other(client, tmp_path: Path) -> None:
+    _analyze(client, tmp_path)
+    (tmp_path / "head" / "demo" / "src/a/add.ts").write_text("export function add(a, b) {\n  return (b + a) | 0;\n}\n", encoding="utf-8")
+    edited = _analyze(client, tmp_path)
+    assert "feature_summary" in edited["stages_recomputed"] and "dry_run" in edited["stages_recomputed"]
+    assert edited["directories_reused"] == ["src/b"]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict
+
+from server.services.ast_service import compute_ast_deltas
+from server.services.dry_run_service import static_dry_run
+
+
+UTIL = "src/util.py"
+
+DEPS = {
+    "edges": [
+        {"from": "src/app.py", "to": UTIL, "symbols": ["parse"]},
+        {"from": "src/cli.py", "to": UTIL, "symbols": ["other"]},
+        {"from": "src/job.py", "to": UTIL, "symbols": ["load"]},
+    ]
+}
+
+
+def _write(root: Path, text: str) -> None:
+    (root / "src").mkdir(parents=True)
+    (root / UTIL).write_text(text, encoding="utf-8")
+
+
+def _analyze(tmp_path: Path, before: str, after: str, hunk: Dict[str, Any]) -> Dict[str, Any]:
+    _write(tmp_path / "base", before)
+    _write(tmp_path / "head", after)
+    bundle = {"files": [{"path": UTIL, "status": "modified", "hunks": [hunk]}]}
+    ast_deltas = compute_ast_deltas(str(tmp_path / "base"), str(tmp_path / "head"), [UTIL], None, bundle)
+    return {"ast_deltas": ast_deltas, "dry_run": static_dry_run({}, DEPS, bundle, ast_deltas)}
+
+
+def test_import_swap_keeps_every_importer(tmp_path: Path) -> None:
+    body = "\n\ndef parse(s):\n    return impl(s)\n\n\ndef other():\n    return 1\n"
+    hunk = {"old_start": 1, "new_start": 1, "text": "-from .v1 import impl\n+from .v2 import impl\n \n \n"}
+    out = _analyze(tmp_path, "from .v1 import impl\n" + body, "from .v2 import impl\n" + body, hunk)
+    assert UTIL not in out["ast_deltas"]["exported_changes"]
+    assert out["dry_run"]["callers"] == ["src/app.py", "src/cli.py", "src/job.py"]
+
+
+def test_touched_export_widens_to_exports_calling_it(tmp_path: Path) -> None:
+    before = "def parse(s):\n    return s\n\n\ndef load(s):\n    return parse(s)\n\n\ndef other():\n    return 1\n"
+    after = before.replace("return s\n", "return s.strip()\n", 1)
+    hunk = {"old_start": 1, "new_start": 1, "text": " def parse(s):\n-    return s\n+    return s.strip()\n"}
+    out = _analyze(tmp_path, before, after, hunk)
+    assert out["ast_deltas"]["exported_changes"] == {UTIL: ["load", "parse"]}
+    assert out["dry_run"]["callers"] == ["src/app.py", "src/job.py"]
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+from server.services.retention_service import compact_results
+
+
+def test_compaction_prunes_idle_trace_runs(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setenv("RETENTION_TRACE_MAX_AGE_DAYS", "7")
+    traces = tmp_path / "traces"
+    for run_id, age_days in (("old", 30), ("new", 1)):
+        (traces / run_id).mkdir(parents=True)
+        target = traces / run_id / "prompts.ndjson"
+        target.write_text('{"name": "x"}\n', encoding="utf-8")
+        stamp = time.time() - age_days * 86400
+        os.utime(target, (stamp, stamp))
+    report = compact_results(tmp_path / "results", trace_root=traces)
+    assert report["traces"]["runs_removed"] == 1
+    assert sorted(p.name for p in traces.iterdir()) == ["new"]
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from server.services.triage_service import triage_directories
+
+
+def test_truncated_modification_needs_review(tmp_path) -> None:
+    bundle = {"files": [
+        {"path": "src/api.ts", "status": "modified", "hunks": [], "truncated": True},
+        {"path": "docs/notes.txt", "status": "modified", "hunks": []},
+    ]}
+    out = triage_directories({}, bundle, {}, str(tmp_path))
+    assert out["src"] == {"needs_llm": True, "reason": None}
+    assert out["docs"] == {"needs_llm": False, "reason": "no_content_change"}
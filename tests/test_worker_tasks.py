@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from server.services.diff_service import _parse_chunks, _split_file_chunks
+from server.services.shadow_fs_service import build_shadow_diff
+from server.services.worker_pool_service import parallel_map, shutdown_pool
+
+
+@pytest.fixture
+def started_pool(tmp_path: Path, monkeypatch):
+    # the pool (and its forkserver) starts here, keeping this cwd and environment
+    monkeypatch.setenv("WORKER_POOL_SIZE", "2")
+    monkeypatch.setenv("WORKER_POOL_MIN_ITEMS", "2")
+    shutdown_pool()
+    (tmp_path / "first").mkdir()
+    monkeypatch.chdir(tmp_path / "first")
+    assert parallel_map(abs, [-1, -2]) == [1, 2]
+    yield tmp_path
+    shutdown_pool()
+
+
+def test_relative_shadow_root_lands_in_callers_cwd(started_pool: Path, monkeypatch) -> None:
+    second = started_pool / "second"
+    (second / "repo" / "src").mkdir(parents=True)
+    (second / "repo" / "src" / "a.ts").write_text("export const a = 1;\n", encoding="utf-8")
+    monkeypatch.chdir(second)
+    bundle = {"summary": {}, "files": [{"path": "src/a.ts", "status": "modified", "hunks": []}]}
+    build_shadow_diff("repo", "repo", bundle, "out")
+    assert (second / "out" / "src" / "_dir.diff.json").exists()
+    assert not (started_pool / "first" / "out").exists()
+
+
+def test_parse_options_follow_callers_environment(started_pool: Path, monkeypatch) -> None:
+    monkeypatch.setenv("FILE_CLASSIFY", "0")
+    minified = "+" + "x" * 2000
+    patch = "".join(
+        f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n@@ -0,0 +1 @@\n{minified}\n"
+        for name in ("static/a.js", "static/b.js")
+    )
+    files = _parse_chunks(_split_file_chunks(patch), [None, None])["files"]
+    assert [f.get("classified") for f in files] == [None, None]
+    assert all(f["hunks"] for f in files)
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from server.services.run_index_service import backfill  # noqa: E402
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Import existing results/*/analysis/* runs into the run index (RUN_INDEX_DB)")
+    parser.add_argument("--results", default="results", help="results root (default: ./results)")
+    parser.add_argument("--repo", help="only this repo_id")
+    args = parser.parse_args(argv)
+    out = backfill(args.results, args.repo)
+    print(json.dumps(out, indent=2))
+    return 1 if out["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
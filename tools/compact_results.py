@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from server.services.retention_service import compact_results  # noqa: E402
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply retention policies to results/*/shadow_diff and analysis runs and hardlink identical files")
+    parser.add_argument("--results", default="results", help="results root (default: ./results)")
+    parser.add_argument("--repo", help="only this repo_id")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted/linked without touching files")
+    parser.add_argument("--no-dedupe", action="store_true")
+    args = parser.parse_args(argv)
+    report = compact_results(args.results, repo_id=args.repo, dry_run=args.dry_run, dedupe=not args.no_dedupe)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
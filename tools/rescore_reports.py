@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from server.services.batch_scoring_service import load_feature_table, score_table, summarize_scores  # noqa: E402
+
+
+DEFAULT_PROFILE = ROOT / "templates" / "profile.json"
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-score stored analysis reports under candidate profiles")
+    parser.add_argument("--results", default="results", help="results root (default: ./results)")
+    parser.add_argument("--repo", help="only this repo_id")
+    parser.add_argument("--profile", action="append", help="candidate profile.json; repeat to compare several (default: templates/profile.json)")
+    parser.add_argument("--write-features", action="store_true", help="backfill score_features.json next to reports that lack it")
+    parser.add_argument("--runs", action="store_true", help="include per-run score/rank in the output")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    table = load_feature_table(args.results, args.repo, write_missing=args.write_features)
+    load_ms = (time.perf_counter() - t0) * 1000.0
+
+    out = {"reports": len(table["features"]), "load_ms": round(load_ms, 3), "errors": table["errors"], "profiles": {}}
+    for path in args.profile or [str(DEFAULT_PROFILE)]:
+        profile = json.loads(Path(path).read_text(encoding="utf-8"))
+        t0 = time.perf_counter()
+        scored = score_table(table, profile)
+        summary = summarize_scores(table, scored)
+        summary["score_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        if args.runs:
+            summary["runs"] = [{**ref, "score": s, "risk_level": k, "rank": r} for ref, (s, k, r) in zip(table["refs"], scored)]
+        out["profiles"][path] = summary
+    print(json.dumps(out, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())